@@ -6,12 +6,41 @@ import logging
 import json
 import zipfile
 import io
-from datetime import datetime
-from typing import Dict, Tuple
+import gzip
+import hashlib
+import shutil
+import fcntl
+import socket
+import sqlite3
+import threading
+import uuid
+import copy
+import selectors
+import resource
+import math
+import signal
+import bisect
+import sys
+import contextvars
+import csv
+import mimetypes
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
 
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
+
+try:
+    import brotli
+except ImportError:  # 未安裝時只提供 gzip
+    brotli = None
 # 配置日誌
 logging.basicConfig(
     level=logging.INFO,
@@ -30,7 +59,93 @@ CORS(app)
 class Config:
     TESTCASE_DIR = "/app/testcases"
     CONFIG_FILE = "/app/testcases/config.json"
+    MANIFEST_FILE = "/app/testcases/manifest.json"
+    TESTCASE_OBJECT_DIR = os.path.join(TESTCASE_DIR, "objects")  # 以 SHA-256 命名的測試檔內容
+    TESTCASE_REF_DIR = os.path.join(TESTCASE_DIR, "refs")  # 每個測試案例一個參照檔 (名稱 -> 內容雜湊)，可重建索引
+    BLOB_COMPRESS_MIN_BYTES = 64 * 1024  # 超過此大小的測試檔才嘗試壓縮
+    BLOB_COMPRESS_MIN_SAVING = 0.2  # 壓縮後至少省下的比例，否則直接儲存
+    BLOB_COMPRESS_LEVEL = 6
+    OBJECT_GC_GRACE_SECONDS = 600  # 未被索引引用的物件保留時間 (避免與進行中的上傳衝突)
+    BLOB_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024  # worker 本機解壓縮快取的上限
+    PREVIEW_CACHE_MAX_BYTES = 32 * 1024 * 1024  # 行程內預期輸出預覽的快取上限
+    TESTCASE_PREVIEW_BYTES = 64 * 1024  # 測試資料預覽預設回傳的長度
+    TESTCASE_PREVIEW_MAX_BYTES = 1024 * 1024  # 單次預覽可要求的最大長度
+    CACHE_DIR = "/app/cache"
+    STATIC_CACHE_DIR = os.path.join(CACHE_DIR, "static")  # 預先壓縮的靜態檔案 (以內容雜湊命名)
+    STATIC_MAX_AGE = 86400  # 秒，圖示等靜態檔案的快取時間 (index.html 每次重新驗證)
+    HTTP_COMPRESS_MIN_BYTES = 1024  # 小於此大小的回應不壓縮
+    HTTP_GZIP_LEVEL = 6
+    HTTP_BROTLI_QUALITY = 5  # 動態回應的 brotli 壓縮等級 (靜態檔案使用最高等級)
+    HTTP_COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript",
+                               "application/manifest+json", "image/svg+xml", "image/vnd.microsoft.icon")
+    ARTIFACT_CACHE_DIR = os.path.join(CACHE_DIR, "artifacts")
+    ARTIFACT_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512MB
+    ARTIFACT_CACHE_MAX_ENTRIES = 256
+    GO_BUILD_CACHE_DIR = os.path.join(CACHE_DIR, "go-build")  # 持久化的 GOCACHE
+    GO_BUILD_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1GB
+    GO_BUILD_CACHE_TRIM_INTERVAL = 600  # 秒，檢查 GOCACHE 大小的最短間隔
+    PCH_DIR = os.path.join(CACHE_DIR, "pch")  # C++ 預編譯標頭
+    CPP_PRECOMPILED_HEADERS = ["bits/stdc++.h"]
+    JAVA_CDS_DIR = os.path.join(CACHE_DIR, "cds")  # 所有 Java 提交共用的 JDK 類別 CDS 封存檔
+    JAVA_ARCHIVE_TIME_LIMIT = 60  # 秒，建立共用 CDS 封存檔的時間上限 (每個 JDK 只建立一次)
+    # 工作佇列與測試資料 blob 的共用儲存位置，同一台主機上的 web 與 worker 行程 (或容器) 指向同一個本機目錄。
+    # SQLite 的 WAL 依賴共享記憶體與 POSIX 鎖，不能放在 NFS / SMB 等網路檔案系統上，因此不支援跨主機
+    SHARED_STORE_DIR = os.environ.get("JUDGE_SHARED_STORE", CACHE_DIR)
+    JOB_DB = os.path.join(SHARED_STORE_DIR, "jobs.db")
+    BLOB_DIR = os.path.join(SHARED_STORE_DIR, "blobs")  # 以 SHA-256 命名的測試檔
+    TESTSET_STORE_KEEP = 8  # 共用儲存中保留的測試資料版本數
+    WORKER_TESTSET_DIR = os.path.join(CACHE_DIR, "testsets")  # worker 本機依內容雜湊展開的測試資料
+    WORKER_BLOB_DIR = os.path.join(CACHE_DIR, "blobs")  # worker 本機的 blob 快取
+    WORKER_TESTSET_KEEP = 4
+    # 0 表示 web 行程不執行評判，只由獨立的 worker 行程 (python app.py worker) 處理工作
+    EMBEDDED_RUNNERS = os.environ.get("JUDGE_EMBEDDED_RUNNERS", "1") != "0"
+    JOB_MAX_ATTEMPTS = 3  # 工作因 worker 中斷而重新排隊的次數上限
+    VERDICT_CACHE_MAX_ENTRIES = 2000  # 評判結果快取的項目上限 (依最近使用時間淘汰)
+    CASE_RESULT_CACHE_MAX_ENTRIES = 50000  # 單一測試案例結果快取的項目上限 (依最近使用時間淘汰)
+    CASE_STATS_MAX_ENTRIES = 50000  # 測試輸入歷史統計的項目上限 (依最近執行時間淘汰)
+    TIMING_SAMPLES_MAX_ENTRIES = 50000  # 執行時間變異統計 (編譯產物 + 測試輸入) 的項目上限
+    JOB_QUEUE_MAX_DEPTH = 100  # 只計算互動提交 (批次評判的工作以 BATCH_QUEUE_MAX_JOBS 限制)
+    BATCH_MAX_SUBMISSIONS = 2000  # 單一批次的提交數上限
+    BATCH_QUEUE_MAX_JOBS = 10000  # 所有批次合計排隊中的工作數上限
+    BATCH_JOB_PRIORITY = -1  # 批次評判的工作排在互動提交之後
+    BATCH_RETENTION_SECONDS = 86400  # 批次與其工作結果的保留時間
+    JOB_RUNNERS_PER_PROCESS = 1
+    JOB_POLL_INTERVAL = 0.2  # 秒
+    JOB_HEARTBEAT_INTERVAL = 5  # 秒
+    JOB_LEASE_SECONDS = 30  # 超過此時間未更新 heartbeat 的工作會重新排隊
+    JOB_RETENTION_SECONDS = 3600  # 完成的工作保留時間
+    # 同步 /judge 與 NDJSON 串流在連線上等待的最長時間 (需小於 gunicorn timeout)；等待期間佔用一個
+    # 請求執行緒，web 需以 gthread worker 啟動 (見 entrypoint.sh)
+    SYNC_JUDGE_WAIT_SECONDS = 25
     MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+    IO_CHUNK_SIZE = 64 * 1024  # 串流讀寫的區塊大小
+    OUTPUT_PREVIEW_BYTES = 64 * 1024  # 評判結果中保留的輸出長度
+    IMPORT_MAX_FILES = 10000
+    IMPORT_MAX_TOTAL_BYTES = 4 * 1024 * 1024 * 1024  # 解壓縮後總大小上限 4GB
+    IMPORT_MAX_COMPRESSION_RATIO = 100  # 解壓縮後與壓縮後總大小的比例上限
+    IMPORT_RATIO_CHECK_BYTES = 256 * 1024 * 1024  # 解壓縮後超過此大小才檢查壓縮比例
+    IMPORT_WORKERS = 4  # 平行解壓縮的執行緒數
+    # 各 web / worker 行程的指標快照，放在共用儲存中，/metrics 才能合併獨立 worker 行程的指標
+    METRICS_DIR = os.path.join(SHARED_STORE_DIR, "metrics")
+    METRICS_FLUSH_INTERVAL = 5  # 秒
+    METRICS_STALE_SECONDS = 30  # 超過此時間未更新的快照不計入 gauge
+    METRICS_RETENTION_SECONDS = 86400  # 已結束行程的快照保留時間
+    EXPORT_STORE_THRESHOLD = 256 * 1024 * 1024  # 超過此大小的檔案匯出時不壓縮
+    EXPORT_COMPRESS_LEVEL = 6
+    WALL_TIME_FACTOR = 2  # 牆鐘時間上限為 CPU 時間限制的倍數
+    MEMORY_POLL_INTERVAL = 0.05  # 秒，執行中檢查 RSS 的間隔
+    ADDRESS_SPACE_SLACK_MB = 64  # 位址空間限制額外保留給共享函式庫等的空間
+    RUN_MAX_PROCESSES = 1024  # 單次執行的行程數上限 (cgroup pids.max，cgroup 無法使用時不限制單次執行)
+    # RLIMIT_NPROC 以使用者為單位計算 (包含 web 行程與所有同時進行的執行)，只作為防止 fork 炸彈的總上限
+    USER_MAX_PROCESSES = 4096
+    # 計時執行專用的 CPU 核心 (例如 "2-7" 或 "2,3")，未設定時使用所有可用核心；編譯等工作改在其餘核心執行
+    RUN_CPUS = os.environ.get("JUDGE_RUN_CPUS", "")
+    CPU_SLOT_DIR = os.path.join(CACHE_DIR, "cpu-slots")  # 各核心的檔案鎖 (本機)
+    # 每次執行建立子 cgroup 的位置 (cgroup v2，需可寫入)，無法使用時只以 CPU affinity 隔離
+    CGROUP_ROOT = os.environ.get("JUDGE_CGROUP_ROOT", "/sys/fs/cgroup/judge")
+    STARTUP_PROBE_RUNS = 3  # 量測 JVM 啟動時間的次數 (取最小值)
+    WARM_POOL_SIZE = 2  # 每個 worker 每種語言預先啟動的直譯器數量
+    WARM_POOL_REFILL_INTERVAL = 5  # 秒
     SUPPORTED_LANGUAGES = ["cpp", "java", "python", "javascript", "golang"]
 
 # 預設設定值
@@ -40,86 +155,250 @@ DEFAULT_SETTINGS = {
     "compile_time_limit": 10,  # 秒
     "auto_save_code": True,  # 自動保存程式碼
     "show_execution_time": True,  # 顯示執行時間
+    "max_parallel_runs": 0,  # 同時執行的測試案例數 (0 = 依 CPU 核心數)
+    "fail_fast": False,  # 遇到第一個失敗的測試案例即停止
+    "output_limit": 64,  # MB，程式輸出超過此大小即判定為輸出超過限制
+    "warm_runners": False,  # Python / JavaScript 使用預熱直譯器池
+    "reuse_case_results": True,  # 重新評判時只執行內容或限制有變動的測試案例
 }
 
 app.config['MAX_CONTENT_LENGTH'] = Config.MAX_FILE_SIZE
 
+# 以 python app.py worker 啟動的獨立 worker 不提供 HTTP 服務，也不接觸 web 端的測試資料目錄
+WORKER_ROLE = __name__ == "__main__" and sys.argv[1:2] == ["worker"]
+
 # 確保目錄存在
-os.makedirs(Config.TESTCASE_DIR, exist_ok=True)
+if not WORKER_ROLE:
+    os.makedirs(Config.TESTCASE_DIR, exist_ok=True)
+    os.makedirs(Config.TESTCASE_OBJECT_DIR, exist_ok=True)
+    # 參照檔目錄由 backfill_testcase_refs 建立 (舊版索引需先補上參照檔)
+    os.makedirs(Config.STATIC_CACHE_DIR, exist_ok=True)
+os.makedirs(Config.ARTIFACT_CACHE_DIR, exist_ok=True)
+os.makedirs(Config.GO_BUILD_CACHE_DIR, exist_ok=True)
+os.makedirs(Config.PCH_DIR, exist_ok=True)
+os.makedirs(Config.JAVA_CDS_DIR, exist_ok=True)
+os.makedirs(Config.METRICS_DIR, exist_ok=True)
+os.makedirs(Config.BLOB_DIR, exist_ok=True)
+os.makedirs(Config.WORKER_TESTSET_DIR, exist_ok=True)
+os.makedirs(Config.WORKER_BLOB_DIR, exist_ok=True)
+os.makedirs(Config.CPU_SLOT_DIR, exist_ok=True)
+
+# 預熱直譯器的啟動程式：完成 import 後阻塞在控制管線 (fd 由最後一個參數傳入)，讀到程式路徑才執行
+PYTHON_WARM_BOOTSTRAP = """
+import os, sys, runpy
+import bisect, collections, functools, heapq, itertools, math, re, string
+ctl = os.fdopen(int(sys.argv[1]), "rb")
+path = ctl.readline().decode().strip()
+ctl.close()
+if not path:
+    sys.exit(0)
+os.chdir(os.path.dirname(path))
+sys.argv = [path]
+sys.path[0] = os.path.dirname(path)
+runpy.run_path(path, run_name="__main__")
+"""
+
+NODE_WARM_BOOTSTRAP = """
+const fs = require("fs");
+const path = require("path");
+const ctl = Number(process.argv[1]);
+const chunks = [];
+const buffer = Buffer.alloc(4096);
+let n;
+while ((n = fs.readSync(ctl, buffer)) > 0) chunks.push(Buffer.from(buffer.subarray(0, n)));
+fs.closeSync(ctl);
+const script = Buffer.concat(chunks).toString().trim();
+if (!script) process.exit(0);
+process.chdir(path.dirname(script));
+process.argv = [process.argv[0], script];
+require("module").runMain();
+"""
+
+# 短時間執行的 JVM 參數：單執行緒 GC、不建立 hsperfdata、啟用 CDS，
+# JVM 的警告訊息改輸出到 stderr，避免混入程式輸出
+JVM_RUN_FLAGS = [
+    "-XX:+UseSerialGC",
+    "-XX:-UsePerfData",
+    "-Xshare:auto",
+    "-Xlog:disable",
+    "-Xlog:all=warning:stderr",
+]
+
+# C++ 編譯參數 (預編譯標頭必須以相同參數建立才能使用)
+CPP_COMPILE_FLAGS = ["-std=c++17", "-O2"]
 
 # 語言編譯和執行配置
 LANGUAGE_CONFIG = {
     "cpp": {
         "extension": ".cpp",
-        "compile_cmd": ["g++", "-std=c++17", "-O2", "-o", "main", "main.cpp"],
+        "compile_cmd": ["g++"] + CPP_COMPILE_FLAGS + ["-o", "main", "main.cpp"],
         "run_cmd": ["./main"],
-        "need_compile": True
+        "need_compile": True,
+        "limit_address_space": True
     },
     "java": {
         "extension": ".java",
-        "compile_cmd": ["javac", "Main.java"],
-        "run_cmd": ["java", "Main"],
-        "need_compile": True
+        # javac 只跑一次且時間很短，只用 C1 編譯器可省下 JIT 的暖機成本
+        "compile_cmd": ["javac", "-J-XX:TieredStopAtLevel=1", "-J-XX:+UseSerialGC", "Main.java"],
+        "run_cmd": ["java"] + JVM_RUN_FLAGS + ["-cp", ".", "Main"],
+        "startup_probe_cmd": ["java"] + JVM_RUN_FLAGS + ["-version"],
+        "class_data_sharing": True,
+        "need_compile": True,
+        "memory_args": ["-Xmx{memory}m"],
+        "memory_overhead": 256  # JVM 的 metaspace、code cache 等 heap 以外的記憶體
     },
     "python": {
         "extension": ".py",
         "compile_cmd": [],
         "run_cmd": ["python3", "main.py"],
-        "need_compile": False
+        "need_compile": False,
+        "limit_address_space": True,
+        "warm_bootstrap": ["python3", "-c", PYTHON_WARM_BOOTSTRAP]
     },
     "javascript": {
         "extension": ".js",
         "compile_cmd": [],
         "run_cmd": ["node", "main.js"],
-        "need_compile": False
+        "need_compile": False,
+        "memory_args": ["--max-old-space-size={memory}"],
+        "memory_overhead": 128,  # V8 heap 以外的記憶體
+        "warm_bootstrap": ["node", "-e", NODE_WARM_BOOTSTRAP]
     },
     "golang": {
         "extension": ".go",
         "compile_cmd": ["go", "build", "-o", "main", "main.go"],
+        # 標準函式庫等相依套件的編譯結果跨提交共用
+        "compile_env": {"GOCACHE": Config.GO_BUILD_CACHE_DIR},
         "run_cmd": ["./main"],
-        "need_compile": True
+        "need_compile": True,
+        # Go runtime 啟動時會保留大量虛擬位址，改以 GOMEMLIMIT 與 RSS 檢查限制記憶體
+        "memory_env": {"GOMEMLIMIT": "{memory}MiB"}
     }
 }
 
-def load_config() -> Dict:
-    """載入配置檔案"""
-    try:
-        if os.path.exists(Config.CONFIG_FILE):
-            with open(Config.CONFIG_FILE, "r", encoding='utf-8') as f:
-                config = json.load(f)
-                # 確保所有預設設定都存在
-                if "settings" not in config:
-                    config["settings"] = DEFAULT_SETTINGS.copy()
-                else:
-                    # 合併預設設定，確保新增的設定項目有預設值
-                    for key, value in DEFAULT_SETTINGS.items():
-                        if key not in config["settings"]:
-                            config["settings"][key] = value
-                return config
+@contextmanager
+def file_lock(lock_path: str, shared: bool = False):
+    """跨 gunicorn worker 的檔案鎖 (flock)，shared=True 時為共用鎖"""
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def write_json_atomic(path: str, data: Dict) -> None:
+    """以暫存檔 + rename 原子寫入 JSON 檔案"""
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+    try:
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, "w", encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+class JsonFileStore:
+    """多個 gunicorn worker 共用的 JSON 檔案
+
+    讀取時以檔案的 inode / mtime / 大小判斷是否需要重新解析，其餘時間直接使用
+    記憶體中的內容；寫入時在檔案鎖內以暫存檔 + rename 原子替換，內容未變更時略過。
+    """
+
+    def __init__(self, path: str, default_factory: Callable[[], Dict],
+                 normalize: Optional[Callable[[Dict], Dict]] = None):
+        self.path = path
+        self.default_factory = default_factory
+        self.normalize = normalize
+        self._key = None
+        self._data = None
+        self._lock = threading.Lock()
+
+    def read(self) -> Dict:
+        """取得目前內容 (共用物件，呼叫端不可修改)"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return self.default_factory()
+
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if self._key == key:
+                return self._data
+            with open(self.path, "r", encoding='utf-8') as f:
+                data = json.load(f)
+            if self.normalize:
+                data = self.normalize(data)
+            self._key = key
+            self._data = data
+            return data
+
+    def update(self, mutate: Callable[[Dict], None]) -> Dict:
+        """在檔案鎖內讀取最新內容、套用修改並寫回，避免多個 worker 同時修改時遺失更新"""
+        with file_lock(self.path + ".lock"):
+            current = self.read()
+            data = copy.deepcopy(current)
+            mutate(data)
+            if data != current:
+                write_json_atomic(self.path, data)
+            return data
+
+def default_config() -> Dict:
+    """預設配置"""
+    return {"last_lang": "", "statistics": {}, "settings": DEFAULT_SETTINGS.copy()}
+
+def normalize_config(config: Dict) -> Dict:
+    """補齊配置中缺少的預設設定"""
+    # 確保所有預設設定都存在
+    if "settings" not in config:
+        config["settings"] = DEFAULT_SETTINGS.copy()
+    else:
+        # 合併預設設定，確保新增的設定項目有預設值
+        for key, value in DEFAULT_SETTINGS.items():
+            if key not in config["settings"]:
+                config["settings"][key] = value
+    return config
+
+config_store = JsonFileStore(Config.CONFIG_FILE, default_config, normalize_config)
+
+def _cached_config() -> Dict:
+    """取得快取中的配置 (共用物件，呼叫端不可修改)"""
+    try:
+        return config_store.read()
     except Exception as e:
         logger.error(f"載入配置檔案失敗: {e}")
-    return {"last_lang": "", "statistics": {}, "settings": DEFAULT_SETTINGS.copy()}
+        return default_config()
+
+def load_config() -> Dict:
+    """載入配置檔案 (回傳可修改的副本)"""
+    return copy.deepcopy(_cached_config())
 
-def save_config(config: Dict) -> None:
-    """儲存配置檔案"""
+def update_config(mutate: Callable[[Dict], None]) -> Dict:
+    """讀取最新配置、套用修改並寫回"""
     try:
-        with open(Config.CONFIG_FILE, "w", encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        return config_store.update(mutate)
     except Exception as e:
         logger.error(f"儲存配置檔案失敗: {e}")
+        return load_config()
+
+# 評判工作提交時的設定快照，worker 執行該工作期間優先使用
+job_settings: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("job_settings", default=None)
 
 def get_setting(key: str, default=None):
     """獲取單個設定值"""
-    config = load_config()
+    snapshot = job_settings.get()
+    if snapshot is not None and key in snapshot:
+        return snapshot[key]
+    config = _cached_config()
     return config.get("settings", {}).get(key, default or DEFAULT_SETTINGS.get(key))
 
 def update_setting(key: str, value):
     """更新單個設定值"""
-    config = load_config()
-    if "settings" not in config:
-        config["settings"] = DEFAULT_SETTINGS.copy()
-    config["settings"][key] = value
-    save_config(config)
+    def mutate(config: Dict) -> None:
+        config.setdefault("settings", DEFAULT_SETTINGS.copy())[key] = value
+    update_config(mutate)
 
 def validate_testcase_name(name: str) -> bool:
     """驗證測試案例名稱的有效性"""
@@ -132,30 +411,396 @@ def sanitize_output(output: str) -> str:
     """清理輸出內容"""
     return output
 
+# 測試案例索引：記錄每個測試案例的輸入/輸出大小、SHA-256、儲存大小與修改時間。
+# 由 /upload、/import、/delete 維護，各端點改讀索引而不再掃描目錄。
+# version 在內容變更時遞增，可作為測試集版本。
+#
+# 測試檔內容以 SHA-256 命名存放在 TESTCASE_OBJECT_DIR，壓縮後明顯變小的檔案以 gzip
+# 儲存 (<sha256>.gz)，相同內容只存一份；索引即為測試案例名稱到內容雜湊的對應。
+# 每個測試案例另有一個參照檔 (TESTCASE_REF_DIR/<名稱>.json，內容與索引項目相同)，
+# 與索引在同一個檔案鎖內更新，索引遺失或損毀時可由參照檔重建。
+
+def default_manifest() -> Dict:
+    """空的測試案例索引"""
+    return {"version": 0, "testcases": {}}
+
+manifest_store = JsonFileStore(Config.MANIFEST_FILE, default_manifest)
+
+def testcase_ref_path(name: str) -> str:
+    return os.path.join(Config.TESTCASE_REF_DIR, f"{name}.json")
+
+def load_testcase_refs() -> Dict[str, Dict]:
+    """讀取所有測試案例參照檔，回傳 {名稱: 索引項目} (讀取失敗時拋出例外)"""
+    refs = {}
+    for filename in os.listdir(Config.TESTCASE_REF_DIR):
+        if filename.endswith(".json"):
+            with open(os.path.join(Config.TESTCASE_REF_DIR, filename), "r", encoding='utf-8') as f:
+                refs[filename[:-len(".json")]] = json.load(f)
+    return refs
+
+def backfill_testcase_refs() -> None:
+    """為尚未有參照檔的舊版索引建立參照檔 (在暫存目錄寫好後一次 rename)"""
+    if os.path.isdir(Config.TESTCASE_REF_DIR):
+        return
+    with file_lock(Config.MANIFEST_FILE + ".lock"):
+        if os.path.isdir(Config.TESTCASE_REF_DIR):
+            return
+        try:
+            testcases = manifest_store.read()["testcases"]
+        except Exception as e:
+            logger.error(f"讀取測試案例索引失敗，無法建立參照檔: {e}")
+            return
+        staging_dir = tempfile.mkdtemp(prefix=".tmp-", dir=Config.TESTCASE_DIR)
+        try:
+            for name, entry in testcases.items():
+                write_json_atomic(os.path.join(staging_dir, f"{name}.json"), entry)
+            os.rename(staging_dir, Config.TESTCASE_REF_DIR)
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+    logger.info(f"已為 {len(testcases)} 個測試案例建立參照檔")
+
+def blob_path(root: str, sha256: str) -> str:
+    return os.path.join(root, sha256[:2], sha256)
+
+def find_blob(root: str, sha256: str) -> Optional[str]:
+    """在內容定址目錄中找出 blob (直接儲存或 gzip 壓縮)，不存在時回傳 None"""
+    path = blob_path(root, sha256)
+    for candidate in (path, path + ".gz"):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+def open_blob(path: str):
+    """以二進位模式開啟 blob，gzip 壓縮的 blob 會透明解壓縮"""
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+def open_testcase_file(info: Dict):
+    """開啟索引中記錄的測試檔內容"""
+    path = find_blob(Config.TESTCASE_OBJECT_DIR, info["sha256"])
+    if not path:
+        raise FileNotFoundError(f"找不到測試檔內容 {info['sha256'][:12]}")
+    return open_blob(path)
+
+def object_store_lock(shared: bool = False):
+    """物件寫入 (共用) 與清除 (獨占) 之間的鎖，避免剛確認存在或更新時間的物件被清除"""
+    return file_lock(os.path.join(Config.TESTCASE_OBJECT_DIR, ".gc.lock"), shared=shared)
+
+def store_testcase_blob(source) -> Dict:
+    """將來源串流存成內容定址的物件，回傳索引資料 (大小、SHA-256、修改時間、儲存大小)
+
+    大於 BLOB_COMPRESS_MIN_BYTES 且壓縮後至少省下 BLOB_COMPRESS_MIN_SAVING 的檔案以 gzip
+    儲存。已有相同內容時不重複儲存，只更新修改時間，避免被當成未引用的物件清除。
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=Config.TESTCASE_OBJECT_DIR)
+    compressed_path = temp_path + ".gz"
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, "wb") as target:
+            for chunk in iter(lambda: source.read(Config.IO_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                target.write(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+
+        candidate = temp_path
+        if size >= Config.BLOB_COMPRESS_MIN_BYTES and not looks_compressed(temp_path) \
+                and not find_blob(Config.TESTCASE_OBJECT_DIR, sha256):
+            with open(temp_path, "rb") as src, \
+                    gzip.open(compressed_path, "wb", compresslevel=Config.BLOB_COMPRESS_LEVEL) as dst:
+                shutil.copyfileobj(src, dst, Config.IO_CHUNK_SIZE)
+            if os.path.getsize(compressed_path) <= size * (1 - Config.BLOB_COMPRESS_MIN_SAVING):
+                candidate = compressed_path
+        # 確認是否已存在與更新時間 (或放入新物件) 必須和清除互斥，否則清除可能在兩者之間刪掉物件
+        with object_store_lock(shared=True):
+            stored_path = find_blob(Config.TESTCASE_OBJECT_DIR, sha256)
+            if stored_path:
+                os.utime(stored_path)
+            else:
+                stored_path = blob_path(Config.TESTCASE_OBJECT_DIR, sha256) + (".gz" if candidate == compressed_path else "")
+                os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+                os.chmod(candidate, 0o644)
+                os.rename(candidate, stored_path)
+            stored_size = os.path.getsize(stored_path)
+        return {"size": size, "sha256": sha256, "mtime": time.time(), "stored_size": stored_size}
+    finally:
+        for path in (temp_path, compressed_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def manifest_blob_hashes(manifest: Dict) -> set:
+    """索引引用的所有內容雜湊"""
+    return {info["sha256"] for entry in manifest["testcases"].values()
+            for info in (entry.get("input"), entry.get("output")) if info}
+
+def collect_testcase_objects() -> None:
+    """刪除索引與參照檔都不再引用的物件 (最近寫入或重複使用的物件保留一段時間)
+
+    持有物件儲存的獨占鎖並在鎖內讀取最新的索引，清除期間不會有物件被確認存在或更新時間。
+    索引或參照檔無法讀取、或兩者都沒有引用任何物件 (可能是遺失) 時不清除。
+    """
+    with object_store_lock():
+        try:
+            referenced = (manifest_blob_hashes(manifest_store.read())
+                          | manifest_blob_hashes({"testcases": load_testcase_refs()}))
+        except Exception as e:
+            logger.error(f"讀取測試案例索引失敗，略過清除物件: {e}")
+            return
+        if not referenced:
+            logger.warning("測試案例索引與參照檔皆為空，略過清除物件")
+            return
+        cutoff = time.time() - Config.OBJECT_GC_GRACE_SECONDS
+        for subdir in os.scandir(Config.TESTCASE_OBJECT_DIR):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                try:
+                    if entry.name.split(".")[0] not in referenced and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+def migrate_flat_testcases() -> int:
+    """將舊版直接存放在 TESTCASE_DIR 的 .in/.out 檔搬進物件儲存並更新索引，回傳搬移的檔案數"""
+    with file_lock(os.path.join(Config.TESTCASE_DIR, ".migrate.lock")):
+        flat = []
+        for filename in os.listdir(Config.TESTCASE_DIR):
+            path = os.path.join(Config.TESTCASE_DIR, filename)
+            if filename.endswith(('.in', '.out')) and os.path.isfile(path) \
+                    and validate_testcase_name(filename.rsplit('.', 1)[0]):
+                flat.append(filename)
+        if not flat:
+            return 0
+
+        current = get_manifest()["testcases"]
+        entries = {}
+        for filename in flat:
+            path = os.path.join(Config.TESTCASE_DIR, filename)
+            name, ext = filename.rsplit('.', 1)
+            with open(path, "rb") as f:
+                info = store_testcase_blob(f)
+            info["mtime"] = os.stat(path).st_mtime
+            entry = entries.setdefault(name, dict(current.get(name) or {"input": None, "output": None}))
+            entry["input" if ext == "in" else "output"] = info
+        apply_manifest_entries(entries)
+        for filename in flat:
+            os.remove(os.path.join(Config.TESTCASE_DIR, filename))
+    logger.info(f"已將 {len(flat)} 個測試檔搬移到物件儲存")
+    return len(flat)
+
+def apply_manifest_entries(entries: Dict[str, Optional[Dict]]) -> Dict:
+    """將已計算好的索引資料寫入索引與參照檔，值為 None 表示該測試案例已刪除"""
+    def apply(manifest: Dict) -> None:
+        testcases = manifest["testcases"]
+        changed = False
+        for name, entry in entries.items():
+            # 參照檔先於索引寫入：中途失敗時參照檔較新，重建索引即可恢復
+            if entry is None:
+                remove_file(testcase_ref_path(name))
+                changed |= testcases.pop(name, None) is not None
+            elif testcases.get(name) != entry:
+                write_json_atomic(testcase_ref_path(name), entry)
+                testcases[name] = entry
+                changed = True
+        if changed:
+            manifest["version"] += 1
+            manifest["updated_at"] = time.time()
+
+    return manifest_store.update(apply)
+
+def rebuild_manifest() -> Dict:
+    """由參照檔重建索引：搬移舊版格式的測試檔，並略過內容已不存在的測試檔"""
+    with file_lock(Config.MANIFEST_FILE + ".lock"):
+        try:
+            manifest_store.read()
+        except Exception as e:
+            # 索引損毀時以空索引取代，內容完全由參照檔重建
+            logger.error(f"測試案例索引損毀，由參照檔重建: {e}")
+            write_json_atomic(Config.MANIFEST_FILE, default_manifest())
+    backfill_testcase_refs()
+    migrate_flat_testcases()
+
+    def apply(manifest: Dict) -> None:
+        testcases = {}
+        for name, ref in load_testcase_refs().items():
+            entry = {kind: ref.get(kind) if ref.get(kind)
+                     and find_blob(Config.TESTCASE_OBJECT_DIR, ref[kind]["sha256"]) else None
+                     for kind in ("input", "output")}
+            if entry != ref:
+                write_json_atomic(testcase_ref_path(name), entry)
+            if entry["input"] or entry["output"]:
+                testcases[name] = entry
+            else:
+                remove_file(testcase_ref_path(name))
+        if testcases != manifest["testcases"]:
+            manifest["testcases"] = testcases
+            manifest["version"] += 1
+            manifest["updated_at"] = time.time()
+
+    manifest = manifest_store.update(apply)
+    logger.info(f"重建測試案例索引，共 {len(manifest['testcases'])} 筆")
+    return manifest
+
+def get_manifest() -> Dict:
+    """取得測試案例索引 (共用物件，呼叫端不可修改)"""
+    try:
+        return manifest_store.read()
+    except Exception as e:
+        logger.error(f"讀取測試案例索引失敗: {e}")
+        return default_manifest()
+
+def list_input_files() -> List[str]:
+    """依檔名排序的所有 .in 檔"""
+    return sorted(f"{name}.in" for name, entry in get_manifest()["testcases"].items() if entry["input"])
+
+def testset_digest(manifest: Dict) -> str:
+    """以所有測試檔的 SHA-256 計算整組測試資料的內容雜湊 (與修改時間無關)"""
+    digest = hashlib.sha256()
+    for name in sorted(manifest["testcases"]):
+        entry = manifest["testcases"][name]
+        for kind in ("input", "output"):
+            info = entry.get(kind)
+            digest.update(f"{name}\0{kind}\0{info['sha256'] if info else ''}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def testset_etag(manifest: Dict) -> str:
+    """測試資料列表的 ETag：索引版本加上內容雜湊 (索引重建後版本號可能重複)"""
+    return f"{manifest['version']}-{testset_digest(manifest)[:16]}"
+
 def get_testcase_stats() -> Dict:
     """獲取測試案例統計資訊"""
     try:
-        files = os.listdir(Config.TESTCASE_DIR)
-        in_files = [f for f in files if f.endswith('.in')]
-        out_files = [f for f in files if f.endswith('.out')]
-        
-        testcases = set()
-        for f in in_files:
-            testcases.add(f[:-3])  # 移除 .in
-            
+        manifest = get_manifest()
+        entries = manifest["testcases"].values()
+        in_files = [entry["input"] for entry in entries if entry["input"]]
+        out_files = [entry["output"] for entry in entries if entry["output"]]
+        mtimes = [info["mtime"] for info in in_files + out_files]
+        # 相同內容只儲存一次
+        stored = {info["sha256"]: info.get("stored_size", info["size"]) for info in in_files + out_files}
+
         return {
-            "total_testcases": len(testcases),
+            "total_testcases": len(in_files),
             "in_files": len(in_files),
             "out_files": len(out_files),
-            "last_modified": datetime.fromtimestamp(
-                max([os.path.getmtime(os.path.join(Config.TESTCASE_DIR, f)) 
-                     for f in files] or [0])
-            ).isoformat() if files else None
+            "total_bytes": sum(info["size"] for info in in_files + out_files),
+            "stored_bytes": sum(stored.values()),
+            "version": manifest["version"],
+            "last_modified": datetime.fromtimestamp(max(mtimes)).isoformat() if mtimes else None
         }
     except Exception as e:
         logger.error(f"獲取統計資訊失敗: {e}")
         return {"total_testcases": 0, "in_files": 0, "out_files": 0}
 
+# HTTP 快取與壓縮：會變動的回應帶 ETag 並要求每次重新驗證，內容未變時回傳 304；
+# 文字回應依 Accept-Encoding 壓縮，靜態檔案預先壓縮一次存放在 STATIC_CACHE_DIR。
+
+def http_date(timestamp: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(timestamp, timezone.utc) if timestamp else None
+
+def set_validators(response: Response, etag: str, last_modified: Optional[float] = None) -> Response:
+    """設定弱 ETag 與 Last-Modified (壓縮後位元組不同，因此使用弱 ETag)，並要求用戶端每次重新驗證"""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = http_date(last_modified)
+    response.cache_control.no_cache = True
+    return response
+
+def not_modified(etag: str, last_modified: Optional[float] = None) -> Optional[Response]:
+    """請求帶的 If-None-Match / If-Modified-Since 仍有效時回傳 304 回應，否則回傳 None"""
+    if is_resource_modified(request.environ, etag=etag, last_modified=http_date(last_modified)):
+        return None
+    return set_validators(Response(status=304), etag, last_modified)
+
+def is_compressible(mimetype: Optional[str]) -> bool:
+    return bool(mimetype) and mimetype.startswith(Config.HTTP_COMPRESSIBLE_TYPES)
+
+def available_encodings() -> List[str]:
+    return ["br", "gzip"] if brotli else ["gzip"]
+
+def compress_bytes(data: bytes, encoding: str, static: bool = False) -> bytes:
+    """以 br 或 gzip 壓縮；靜態檔案只壓縮一次，使用最高壓縮等級"""
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if static else Config.HTTP_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if static else Config.HTTP_GZIP_LEVEL, mtime=0)
+
+STATIC_ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+_static_assets: Dict[Tuple, Dict] = {}
+_static_assets_lock = threading.Lock()
+
+def static_asset(path: str) -> Dict:
+    """取得靜態檔案的 ETag、MIME 類型與各編碼版本的路徑 (依大小與修改時間快取，內容變動後重新壓縮)"""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    with _static_assets_lock:
+        asset = _static_assets.get(key)
+    if asset:
+        return asset
+
+    with open(path, "rb") as f:
+        data = f.read()
+    sha256 = hashlib.sha256(data).hexdigest()
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    variants = {"identity": path}
+    if is_compressible(mimetype) and len(data) >= Config.HTTP_COMPRESS_MIN_BYTES:
+        for encoding in available_encodings():
+            target = os.path.join(Config.STATIC_CACHE_DIR, sha256 + STATIC_ENCODING_SUFFIXES[encoding])
+            if not os.path.exists(target):
+                # 多個 worker 行程可能同時產生，寫到暫存檔再 rename
+                fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=Config.STATIC_CACHE_DIR)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(compress_bytes(data, encoding, static=True))
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, target)
+            if os.path.getsize(target) < len(data):
+                variants[encoding] = target
+
+    asset = {"etag": sha256[:32], "mtime": st.st_mtime, "mimetype": mimetype, "variants": variants}
+    with _static_assets_lock:
+        _static_assets[key] = asset
+    return asset
+
+def send_static_asset(path: str, max_age: Optional[int] = None) -> Response:
+    """傳送靜態檔案，用戶端接受時改送預先壓縮的版本 (max_age 為 None 時每次重新驗證)"""
+    asset = static_asset(path)
+    encodings = [encoding for encoding in asset["variants"] if encoding != "identity"]
+    encoding = request.accept_encodings.best_match(encodings) if encodings else None
+    response = send_file(
+        asset["variants"][encoding or "identity"],
+        mimetype=asset["mimetype"],
+        etag=f"{asset['etag']}-{encoding}" if encoding else asset["etag"],
+        last_modified=asset["mtime"],
+        max_age=max_age,
+        conditional=True
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if encodings:
+        response.vary.add("Accept-Encoding")
+    return response
+
+@app.after_request
+def compress_response(response: Response) -> Response:
+    """依 Accept-Encoding 壓縮 JSON、CSV 等文字回應 (串流與檔案回應不處理)"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or "Content-Encoding" in response.headers or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add("Accept-Encoding")
+    if response.content_length is not None and response.content_length < Config.HTTP_COMPRESS_MIN_BYTES:
+        return response
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if not encoding:
+        return response
+    response.set_data(compress_bytes(response.get_data(), encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
 @app.errorhandler(413)
 def too_large(e):
     return jsonify({"error": "檔案過大，請上傳小於16MB的檔案"}), 413
@@ -167,27 +812,35 @@ def internal_error(e):
 
 @app.route("/")
 def home():
-    return send_file('index.html')
+    return send_static_asset(os.path.join(app.root_path, 'index.html'))
 
 @app.route('/favicons_io/<path:filename>')
 def static_files(filename):
-    return send_from_directory('favicons_io', filename)
+    path = safe_join(os.path.join(app.root_path, 'favicons_io'), filename)
+    if not path or not os.path.isfile(path):
+        return jsonify({"error": "檔案不存在"}), 404
+    return send_static_asset(path, max_age=Config.STATIC_MAX_AGE)
 
 @app.route("/api/stats", methods=["GET"])
 def get_stats():
-    """獲取系統統計資訊"""
+    """獲取系統統計資訊 (帶有依內容計算的 ETag，未變動時回傳 304)"""
     try:
         stats = get_testcase_stats()
-        config = load_config()
+        config = _cached_config()
         
-        return jsonify({
+        response = jsonify({
             "testcase_stats": stats,
             "last_language": config.get("last_lang", ""),
             "supported_languages": Config.SUPPORTED_LANGUAGES,
             "max_execution_time": get_setting("execution_time_limit"),
             "memory_limit": get_setting("memory_limit"),
-            "compile_time_limit": get_setting("compile_time_limit")
-        }), 200
+            "compile_time_limit": get_setting("compile_time_limit"),
+            "build_stats": load_build_stats(),
+            "timing_stats": load_timing_stats({name: input_hash for name, input_hash in load_testcase_hashes(None).items()
+                                               if name.endswith(".in")})
+        })
+        etag = hashlib.sha256(response.get_data()).hexdigest()[:32]
+        return not_modified(etag) or set_validators(response, etag)
     except Exception as e:
         logger.error(f"獲取統計資訊失敗: {e}")
         return jsonify({"error": "獲取統計資訊失敗"}), 500
@@ -206,22 +859,15 @@ def upload_testcase():
         if not validate_testcase_name(name):
             return jsonify({"error": "測試檔名無效，只能包含字母、數字、底線和連字號，長度不超過50字符"}), 400
 
-        input_filename = f"{name}.in"
-        output_filename = f"{name}.out"
-
-        # 使用安全的檔案名
-        safe_input_filename = secure_filename(input_filename)
-        safe_output_filename = secure_filename(output_filename)
-
-        input_path = os.path.join(Config.TESTCASE_DIR, safe_input_filename)
-        output_path = os.path.join(Config.TESTCASE_DIR, safe_output_filename)
-
-        with open(input_path, "w", encoding='utf-8') as f:
-            f.write(test_input)
-
-        if test_output:
-            with open(output_path, "w", encoding='utf-8') as f:
-                f.write(test_output)
+        name = secure_filename(name)
+        # 未提供輸出時保留原本的預期輸出
+        current = get_manifest()["testcases"].get(name) or {}
+        entry = {
+            "input": store_testcase_blob(io.BytesIO(test_input.encode('utf-8'))),
+            "output": store_testcase_blob(io.BytesIO(test_output.encode('utf-8'))) if test_output
+                      else current.get("output"),
+        }
+        apply_manifest_entries({name: entry})
 
         logger.info(f"上傳測試資料: {name}")
         return jsonify({"message": f"{name} 測試資料上傳成功"}), 200
@@ -232,96 +878,352 @@ def upload_testcase():
 
 @app.route("/testcases", methods=["GET"])
 def list_testcases():
-    """列出測試資料"""
+    """列出測試資料 (ETag 依測試資料版本，未變動時回傳 304)"""
     try:
-        files = os.listdir(Config.TESTCASE_DIR)
-        # 過濾出有效的測試檔案
-        valid_files = [f for f in files if f.endswith(('.in', '.out')) and 
-                      os.path.isfile(os.path.join(Config.TESTCASE_DIR, f))]
-        return jsonify(valid_files), 200
+        manifest = get_manifest()
+        etag = testset_etag(manifest)
+        cached = not_modified(etag, manifest.get("updated_at"))
+        if cached:
+            return cached
+
+        valid_files = []
+        for name, entry in sorted(manifest["testcases"].items()):
+            if entry["input"]:
+                valid_files.append(f"{name}.in")
+            if entry["output"]:
+                valid_files.append(f"{name}.out")
+        return set_validators(jsonify(valid_files), etag, manifest.get("updated_at"))
     except Exception as e:
         logger.error(f"列出測試資料失敗: {e}")
         return jsonify({"error": "無法獲取測試資料列表"}), 500
 
 @app.route("/testcases/<name>", methods=["GET"])
 def get_testcase(name):
-    """獲取特定測試資料"""
+    """獲取特定測試資料的完整內容 (大型測試資料請改用 /preview 或分別下載)"""
     try:
         if not validate_testcase_name(name):
             return jsonify({"error": "無效的測試檔名"}), 400
 
-        safe_name = secure_filename(name)
-        input_filename = os.path.join(Config.TESTCASE_DIR, f"{safe_name}.in")
-        output_filename = os.path.join(Config.TESTCASE_DIR, f"{safe_name}.out")
-
-        if not os.path.exists(input_filename):
+        entry = get_manifest()["testcases"].get(secure_filename(name))
+        if not entry or not entry["input"]:
             return jsonify({"error": "測試資料不存在"}), 404
+        etag = testcase_etag(entry, ("input", "output"))
+        cached = not_modified(etag)
+        if cached:
+            return cached
 
-        with open(input_filename, "r", encoding='utf-8') as f:
-            test_input = f.read()
+        with open_testcase_file(entry["input"]) as f:
+            test_input = f.read().decode('utf-8', errors='replace')
 
         test_output = ""
-        if os.path.exists(output_filename):
-            with open(output_filename, "r", encoding='utf-8') as f:
-                test_output = f.read()
+        if entry["output"]:
+            with open_testcase_file(entry["output"]) as f:
+                test_output = f.read().decode('utf-8', errors='replace')
 
-        return jsonify({
+        return set_validators(jsonify({
             "input": test_input, 
             "output": test_output,
-            "has_output": os.path.exists(output_filename)
-        }), 200
+            "has_output": bool(entry["output"])
+        }), etag)
 
     except Exception as e:
         logger.error(f"獲取測試資料失敗: {e}")
         return jsonify({"error": "獲取測試資料失敗"}), 500
 
+TESTCASE_FILE_KINDS = {"input": ".in", "output": ".out"}
+
+def testcase_etag(entry: Dict, kinds, *extra) -> str:
+    """依測試檔內容雜湊計算 ETag (內容不變時名稱對應改變也不影響)"""
+    parts = [(entry.get(kind) or {}).get("sha256", "")[:16] or "none" for kind in kinds]
+    return "-".join(parts + [str(value) for value in extra])
+
+def read_testcase_slice(info: Dict, offset: int, length: int) -> Dict:
+    """讀取測試檔 [offset, offset + length) 的內容 (壓縮的物件從頭解壓縮到 offset)"""
+    offset = min(offset, info["size"])
+    with open_testcase_file(info) as f:
+        if offset:
+            f.seek(offset)
+        data = f.read(length)
+    return {
+        "content": data.decode('utf-8', errors='replace'),
+        "offset": offset,
+        "length": len(data),
+        "size": info["size"],
+        "truncated": offset + len(data) < info["size"]
+    }
+
+@app.route("/testcases/<name>/preview", methods=["GET"])
+def preview_testcase(name):
+    """預覽測試資料的一段內容與檔案總大小
+
+    ?offset= 與 ?length= 指定位元組範圍 (預設從頭取 TESTCASE_PREVIEW_BYTES，最多
+    TESTCASE_PREVIEW_MAX_BYTES)，?kind= 可只取 input 或 output。
+    """
+    try:
+        if not validate_testcase_name(name):
+            return jsonify({"error": "無效的測試檔名"}), 400
+        try:
+            offset = int(request.args.get("offset", 0))
+            length = int(request.args.get("length", Config.TESTCASE_PREVIEW_BYTES))
+        except ValueError:
+            return jsonify({"error": "offset 與 length 必須是整數"}), 400
+        if offset < 0 or not 0 < length <= Config.TESTCASE_PREVIEW_MAX_BYTES:
+            return jsonify({"error": f"offset 不可為負數，length 必須介於 1-{Config.TESTCASE_PREVIEW_MAX_BYTES}"}), 400
+        kind = request.args.get("kind")
+        if kind is not None and kind not in TESTCASE_FILE_KINDS:
+            return jsonify({"error": "kind 必須是 input 或 output"}), 400
+
+        entry = get_manifest()["testcases"].get(secure_filename(name))
+        if not entry or not entry["input"]:
+            return jsonify({"error": "測試資料不存在"}), 404
+        kinds = [kind] if kind else list(TESTCASE_FILE_KINDS)
+        etag = testcase_etag(entry, kinds, offset, length)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        preview = {k: read_testcase_slice(entry[k], offset, length) if entry[k] else None for k in kinds}
+        return set_validators(jsonify(preview), etag)
+
+    except Exception as e:
+        logger.error(f"預覽測試資料失敗: {e}")
+        return jsonify({"error": "預覽測試資料失敗"}), 500
+
+@app.route("/testcases/<name>/<kind>", methods=["GET"])
+def download_testcase_file(name, kind):
+    """下載完整的測試檔 (kind 為 input 或 output)
+
+    未壓縮的物件支援 Range；壓縮儲存的物件在用戶端接受 gzip 時直接傳送，不需解壓縮。
+    """
+    try:
+        if kind not in TESTCASE_FILE_KINDS or not validate_testcase_name(name):
+            return jsonify({"error": "無效的測試檔名"}), 400
+        entry = get_manifest()["testcases"].get(secure_filename(name))
+        info = entry.get(kind) if entry else None
+        path = find_blob(Config.TESTCASE_OBJECT_DIR, info["sha256"]) if info else None
+        if not path:
+            return jsonify({"error": "測試資料不存在"}), 404
+        filename = name + TESTCASE_FILE_KINDS[kind]
+        etag = info["sha256"][:32]
+
+        if not path.endswith(".gz"):
+            return send_file(path, mimetype="text/plain", download_name=filename, etag=etag,
+                             last_modified=info["mtime"], conditional=True)
+
+        if "Range" not in request.headers and request.accept_encodings.best_match(["gzip"]):
+            response = send_file(path, mimetype="text/plain", download_name=filename,
+                                 etag=f"{etag}-gzip", last_modified=info["mtime"], conditional=True)
+            response.headers["Content-Encoding"] = "gzip"
+            response.vary.add("Accept-Encoding")
+            return response
+
+        cached = not_modified(etag, info["mtime"])
+        if cached:
+            return cached
+        # 先開啟檔案，串流途中物件被清除也不影響
+        source = open_blob(path)
+
+        def generate():
+            with source:
+                for chunk in iter(lambda: source.read(Config.IO_CHUNK_SIZE), b""):
+                    yield chunk
+
+        response = Response(generate(), mimetype="text/plain")
+        response.content_length = info["size"]
+        response.headers["Content-Disposition"] = f"inline; filename={filename}"
+        response.vary.add("Accept-Encoding")
+        return set_validators(response, etag, info["mtime"])
+
+    except Exception as e:
+        logger.error(f"下載測試資料失敗: {e}")
+        return jsonify({"error": "下載測試資料失敗"}), 500
+
+@app.route("/api/manifest/rebuild", methods=["POST"])
+def rebuild_testcase_manifest():
+    """由參照檔重建測試案例索引，並搬移舊版格式的測試檔"""
+    try:
+        manifest = rebuild_manifest()
+        return jsonify({
+            "message": f"已重建測試案例索引，共 {len(manifest['testcases'])} 筆",
+            "version": manifest["version"]
+        }), 200
+    except Exception as e:
+        logger.error(f"重建測試案例索引失敗: {e}")
+        return jsonify({"error": "重建測試案例索引失敗"}), 500
+
+# 串流匯出：ZipFile 寫入不可 seek 的緩衝區 (使用 data descriptor)，每寫入一個區塊就把
+# 已產生的位元組送出，記憶體中只保留一個區塊與壓縮器狀態
+
+COMPRESSED_MAGIC = (
+    b"PK\x03\x04",  # zip
+    b"\x1f\x8b",  # gzip
+    b"BZh",  # bzip2
+    b"\xfd7zXZ\x00",  # xz
+    b"\x28\xb5\x2f\xfd",  # zstd
+    b"\x89PNG",
+    b"\xff\xd8\xff",  # jpeg
+)
+
+EXPORT_COMPRESSION_MODES = ("auto", "deflate", "store")
+
+class ZipStreamBuffer(io.RawIOBase):
+    """只能附加寫入的緩衝區，供 ZipFile 以串流模式輸出"""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def pop(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+def looks_compressed(path: str) -> bool:
+    """依檔頭判斷檔案是否已經是壓縮格式"""
+    with open(path, "rb") as f:
+        head = f.read(8)
+    return head.startswith(COMPRESSED_MAGIC)
+
+def export_compress_type(head: bytes, size: int, mode: str) -> int:
+    """決定單一檔案的壓縮方式；auto 模式下大型或已壓縮的檔案直接儲存"""
+    if mode == "store":
+        return zipfile.ZIP_STORED
+    if mode == "auto" and (size > Config.EXPORT_STORE_THRESHOLD or head.startswith(COMPRESSED_MAGIC)):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+def generate_testcase_zip(files: List[Tuple[str, Dict]], mode: str):
+    """逐區塊產生 ZIP 內容，files 為 (檔名, 索引資料)"""
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compresslevel=Config.EXPORT_COMPRESS_LEVEL) as zipf:
+        for filename, info in files:
+            try:
+                zip_info = zipfile.ZipInfo(filename, date_time=time.localtime(info["mtime"])[:6])
+                zip_info.external_attr = 0o644 << 16
+                zip_info.file_size = info["size"]
+                with open_testcase_file(info) as source:
+                    zip_info.compress_type = export_compress_type(source.peek(8)[:8], info["size"], mode)
+                    with zipf.open(zip_info, 'w') as target:
+                        for chunk in iter(lambda: source.read(Config.IO_CHUNK_SIZE), b""):
+                            target.write(chunk)
+                            data = buffer.pop()
+                            if data:
+                                yield data
+            except FileNotFoundError:
+                # 匯出途中被刪除的檔案直接略過
+                continue
+            data = buffer.pop()
+            if data:
+                yield data
+    yield buffer.pop()
+
 @app.route("/export", methods=["GET"])
 def export_testcases():
-    """匯出測試資料"""
-    try:
-        memory_file = io.BytesIO()
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(Config.TESTCASE_DIR):
-                for file in files:
-                    if file.endswith(('.in', '.out')):
-                        file_path = os.path.join(root, file)
-                        zipf.write(file_path, os.path.relpath(file_path, Config.TESTCASE_DIR))
-        
-        memory_file.seek(0)
+    """匯出測試資料 (串流 ZIP)
+
+    ?compression= 可指定 auto (預設)、deflate 或 store。回應帶有依測試資料內容
+    計算的 ETag，帶 If-None-Match 的請求在內容未變時回傳 304。
+    """
+    try:
+        mode = request.args.get("compression", "auto")
+        if mode not in EXPORT_COMPRESSION_MODES:
+            return jsonify({"error": f"compression 必須是 {', '.join(EXPORT_COMPRESSION_MODES)} 之一"}), 400
+
+        manifest = get_manifest()
+        etag = f"{testset_digest(manifest)[:32]}-{mode}"
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        files = []
+        for name in sorted(manifest["testcases"]):
+            entry = manifest["testcases"][name]
+            if entry["input"]:
+                files.append((f"{name}.in", entry["input"]))
+            if entry["output"]:
+                files.append((f"{name}.out", entry["output"]))
+
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"testcases_{timestamp}.zip"
-        
-        logger.info("匯出測試資料")
-        return send_file(memory_file, as_attachment=True, download_name=filename)
+
+        logger.info(f"匯出測試資料 ({len(files)} 個檔案，壓縮模式 {mode})")
+        response = Response(generate_testcase_zip(files, mode), mimetype="application/zip")
+        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+        response.set_etag(etag, weak=True)
+        return response
 
     except Exception as e:
         logger.error(f"匯出測試資料失敗: {e}")
         return jsonify({"error": "匯出失敗"}), 500
 
+# 匯入：所有檔案先串流寫入物件儲存 (ZIP 成員平行解壓縮)，全部成功後才一次更新索引；
+# 評判使用的是索引的某個版本，因此不會看到只匯入一半的測試資料。中途失敗時已寫入的
+# 物件沒有被索引引用，之後會被清除。
+# /upload、/delete 與 /import 都只以 apply_manifest_entries 在索引的檔案鎖內原子更新，
+# 評判則讀取依內容雜湊發布的唯讀版本，因此評判期間不需要持有測試資料的鎖，
+# 匯入也不會因為長時間的評判而等不到鎖。
+
+def plan_zip_import(zip_ref: zipfile.ZipFile) -> Dict[str, zipfile.ZipInfo]:
+    """挑出要匯入的 ZIP 成員並檢查檔案數量、總大小與壓縮比例，超過限制時拋出 ValueError
+
+    ZipExtFile 最多只會讀出宣告的 file_size 並在結尾檢查 CRC，因此以宣告的大小檢查即可。
+    """
+    members = {}
+    for file_info in zip_ref.infolist():
+        if file_info.is_dir() or not file_info.filename.endswith(('.in', '.out')):
+            continue
+        filename = os.path.basename(file_info.filename)
+        if validate_testcase_name(filename.rsplit('.', 1)[0]):
+            # 不同目錄下的同名檔案以最後一個為準
+            members[filename] = file_info
+
+    if len(members) > Config.IMPORT_MAX_FILES:
+        raise ValueError(f"檔案數量超過上限 ({Config.IMPORT_MAX_FILES})")
+    total_size = sum(info.file_size for info in members.values())
+    if total_size > Config.IMPORT_MAX_TOTAL_BYTES:
+        raise ValueError(f"解壓縮後總大小超過上限 ({Config.IMPORT_MAX_TOTAL_BYTES // 1024 // 1024}MB)")
+    # 小型的重複性測試資料壓縮比本來就很高，只在解壓縮後的大小夠大時檢查比例
+    compressed_size = max(sum(info.compress_size for info in members.values()), 1)
+    if (total_size > Config.IMPORT_RATIO_CHECK_BYTES
+            and total_size / compressed_size > Config.IMPORT_MAX_COMPRESSION_RATIO):
+        raise ValueError("壓縮比例異常，疑似 ZIP 炸彈")
+    return members
+
+def extract_zip_member(zip_ref: zipfile.ZipFile, file_info: zipfile.ZipInfo) -> Dict:
+    """解壓縮單一 ZIP 成員到物件儲存 (ZipFile 的讀取可由多個執行緒共用)"""
+    with zip_ref.open(file_info) as source:
+        return store_testcase_blob(source)
+
 @app.route("/import", methods=["POST"])
 def import_testcases():
     """匯入測試資料"""
     try:
-        imported_count = 0
-        
+        start_time = time.monotonic()
+        staged = {}  # 檔名 -> 索引資料
+
         # 處理 ZIP 檔案
         if 'zipfile' in request.files:
             zip_file = request.files['zipfile']
             if zip_file and zip_file.filename and zip_file.filename.lower().endswith('.zip'):
                 try:
                     with zipfile.ZipFile(zip_file.stream, 'r') as zip_ref:
-                        for file_info in zip_ref.infolist():
-                            if not file_info.is_dir() and file_info.filename.endswith(('.in', '.out')):
-                                # 取得檔案名稱
-                                filename = os.path.basename(file_info.filename)
-                                base_name = filename.rsplit('.', 1)[0]
-                                
-                                if validate_testcase_name(base_name):
-                                    file_path = os.path.join(Config.TESTCASE_DIR, filename)
-                                    with zip_ref.open(file_info) as source_file:
-                                        with open(file_path, 'wb') as target_file:
-                                            target_file.write(source_file.read())
-                                    imported_count += 1
+                        members = plan_zip_import(zip_ref)
+                        with ThreadPoolExecutor(max_workers=Config.IMPORT_WORKERS) as executor:
+                            futures = {
+                                executor.submit(extract_zip_member, zip_ref, file_info): filename
+                                for filename, file_info in members.items()
+                            }
+                            for future in as_completed(futures):
+                                staged[futures[future]] = future.result()
+                except ValueError as e:
+                    return jsonify({"error": f"ZIP 檔案超過匯入限制: {e}"}), 400
                 except Exception as e:
                     logger.error(f"解壓縮 ZIP 檔案失敗: {e}")
                     return jsonify({"error": "ZIP 檔案格式錯誤或無法解壓縮"}), 400
@@ -336,15 +1238,34 @@ def import_testcases():
                         # 驗證檔案名
                         base_name = filename.rsplit('.', 1)[0]
                         if validate_testcase_name(base_name):
-                            file_path = os.path.join(Config.TESTCASE_DIR, filename)
-                            file.save(file_path)
-                            imported_count += 1
+                            staged[filename] = store_testcase_blob(file.stream)
 
-        if imported_count == 0:
+        if not staged:
             return jsonify({"error": "沒有有效的測試檔案可匯入"}), 400
 
-        logger.info(f"匯入 {imported_count} 個測試檔案")
-        return jsonify({"message": f"成功匯入 {imported_count} 個測試檔案"}), 200
+        # 同一測試案例中未匯入的另一個檔案沿用目前的內容
+        current = get_manifest()["testcases"]
+        entries = {}
+        for name in {filename.rsplit('.', 1)[0] for filename in staged}:
+            entry = {}
+            for kind, ext in (("input", ".in"), ("output", ".out")):
+                entry[kind] = staged.get(name + ext) or (current.get(name) or {}).get(kind)
+            entries[name] = entry
+        apply_manifest_entries(entries)
+
+        imported_count = len(staged)
+        imported_bytes = sum(info["size"] for info in staged.values())
+        elapsed = time.monotonic() - start_time
+        throughput = imported_bytes / 1024 / 1024 / elapsed if elapsed > 0 else 0.0
+
+        logger.info(f"匯入 {imported_count} 個測試檔案 ({imported_bytes} bytes, {elapsed:.2f}s)")
+        return jsonify({
+            "message": f"成功匯入 {imported_count} 個測試檔案",
+            "imported_files": imported_count,
+            "imported_bytes": imported_bytes,
+            "elapsed": f"{elapsed:.3f}s",
+            "throughput": f"{throughput:.1f}MB/s"
+        }), 200
 
     except Exception as e:
         logger.error(f"匯入測試資料失敗: {e}")
@@ -362,18 +1283,18 @@ def delete_testcases():
         if not testcases:
             return jsonify({"error": "請提供要刪除的測試資料"}), 400
 
+        # 只從索引移除，沒有被引用的內容之後會被清除
+        current = get_manifest()["testcases"]
         deleted_count = 0
+        deleted_names = []
         for testcase in testcases:
             if validate_testcase_name(testcase):
                 safe_name = secure_filename(testcase)
-                input_file = os.path.join(Config.TESTCASE_DIR, safe_name + ".in")
-                output_file = os.path.join(Config.TESTCASE_DIR, safe_name + ".out")
-                
-                if os.path.exists(input_file):
-                    os.remove(input_file)
+                if (current.get(safe_name) or {}).get("input"):
                     deleted_count += 1
-                if os.path.exists(output_file):
-                    os.remove(output_file)
+                deleted_names.append(safe_name)
+
+        apply_manifest_entries({name: None for name in deleted_names})
 
         logger.info(f"刪除 {deleted_count} 個測試檔案")
         return jsonify({"message": f"成功刪除 {deleted_count} 個測試檔案"}), 200
@@ -386,15 +1307,10 @@ def delete_testcases():
 def delete_all_testcases():
     """刪除所有測試資料"""
     try:
-        files = os.listdir(Config.TESTCASE_DIR)
-        deleted_count = 0
-        
-        for file in files:
-            if file.endswith(('.in', '.out')):
-                file_path = os.path.join(Config.TESTCASE_DIR, file)
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    deleted_count += 1
+        testcases = get_manifest()["testcases"]
+        deleted_count = sum(bool(entry.get("input")) + bool(entry.get("output")) for entry in testcases.values())
+
+        apply_manifest_entries({name: None for name in testcases})
 
         logger.info(f"刪除所有測試資料，共 {deleted_count} 個檔案")
         return jsonify({"message": f"成功刪除所有測試資料 ({deleted_count} 個檔案)"}), 200
@@ -403,211 +1319,2987 @@ def delete_all_testcases():
         logger.error(f"刪除所有測試資料失敗: {e}")
         return jsonify({"error": "刪除失敗"}), 500
 
-def compile_and_run_code(code: str, lang: str, input_data: str, temp_dir: str) -> Tuple[str, bool, str]:
-    """編譯並執行程式碼"""
-    try:
-        config = LANGUAGE_CONFIG.get(lang)
-        if not config:
-            return "不支援的程式語言", False, ""
+def write_source_file(code: str, lang: str, work_dir: str) -> str:
+    """將程式碼寫入工作目錄"""
+    config = LANGUAGE_CONFIG[lang]
+    if lang == "java":
+        code_file = os.path.join(work_dir, "Main.java")
+    else:
+        code_file = os.path.join(work_dir, f"main{config['extension']}")
 
-        # 準備程式碼檔案
-        if lang == "java":
-            code_file = os.path.join(temp_dir, "Main.java")
-        else:
-            code_file = os.path.join(temp_dir, f"main{config['extension']}")
+    with open(code_file, "w", encoding='utf-8') as f:
+        f.write(code)
+    return code_file
 
-        with open(code_file, "w", encoding='utf-8') as f:
-            f.write(code)
+def artifact_cache_key(code: str, lang: str) -> str:
+    """以語言、編譯指令與程式碼內容計算編譯產物的快取鍵"""
+    digest = hashlib.sha256()
+    digest.update(lang.encode('utf-8'))
+    digest.update(b"\0")
+    digest.update(json.dumps(LANGUAGE_CONFIG[lang]['compile_cmd']).encode('utf-8'))
+    digest.update(b"\0")
+    digest.update(code.encode('utf-8'))
+    return digest.hexdigest()
 
-        # 編譯 (如果需要)
-        if config['need_compile']:
-            try:
-                compile_result = subprocess.run(
-                    config['compile_cmd'], 
-                    cwd=temp_dir,
-                    capture_output=True, 
-                    text=True, 
-                    timeout=get_setting("compile_time_limit")
-                )
-                if compile_result.returncode != 0:
-                    return f"編譯錯誤: {compile_result.stderr}", False, ""
-            except subprocess.TimeoutExpired:
-                return "編譯時間過長", False, ""
-
-        # 執行程式
-        try:
-            start_time = time.time()
-            result = subprocess.run(
-                config['run_cmd'],
-                input=input_data,
-                cwd=temp_dir,
-                text=True,
-                capture_output=True,
-                timeout=get_setting("execution_time_limit")
-            )
-            execution_time = time.time() - start_time
+def list_artifact_files(lang: str, work_dir: str) -> List[str]:
+    """列出編譯產物 (C++/Go 的 main 執行檔、Java 的 .class 檔)"""
+    if lang == "java":
+        return [f for f in os.listdir(work_dir) if f.endswith(".class")]
+    return ["main"]
 
-            user_output = sanitize_output(result.stdout)
-            
-            if result.returncode != 0:
-                error_msg = sanitize_output(result.stderr)
-                return f"{user_output}\n執行錯誤: {error_msg}", False, f"{execution_time:.3f}s"
-            
-            return user_output, True, f"{execution_time:.3f}s"
+def find_jdk_classlist() -> Optional[str]:
+    """找出 JDK 內建的預設 class list ($JAVA_HOME/lib/classlist)"""
+    java = shutil.which("java")
+    if not java:
+        return None
+    java_home = os.path.dirname(os.path.dirname(os.path.realpath(java)))
+    classlist = os.path.join(java_home, "lib", "classlist")
+    return classlist if os.path.exists(classlist) else None
 
-        except subprocess.TimeoutExpired:
-            return f"執行時間過長 (超過{get_setting('execution_time_limit')}秒)", False, f">{get_setting('execution_time_limit')}s"
+_java_cds_archive: Optional[str] = None
+_java_cds_checked = False
+_java_cds_lock = threading.Lock()
 
-    except Exception as e:
-        logger.error(f"執行程式碼失敗: {e}")
-        return f"執行錯誤: {str(e)}", False, ""
+def java_cds_archive() -> Optional[str]:
+    """取得所有 Java 提交共用的 CDS 封存檔路徑，尚未建立時以 JDK 預設的 class list 建立
 
-@app.route("/judge", methods=["POST"])
-def judge_code():
-    """評判程式碼"""
-    try:
-        code = request.form.get("code", "").strip()
-        lang = request.form.get("lang", "").strip()
+    只封存 JDK 類別 (依 JDK 與 JVM 參數命名，每個 JDK 只建立一次)，提交程式本身的少數
+    類別照常從 .class 檔載入，不需要為每份提交建立數 MB 的封存檔。建立失敗時回傳 None，
+    JVM 改用 JDK 內建的預設封存檔；每個行程只嘗試一次。
+    """
+    global _java_cds_archive, _java_cds_checked
+    with _java_cds_lock:
+        if _java_cds_checked:
+            return _java_cds_archive
+        _java_cds_checked = True
+        classlist = find_jdk_classlist()
+        if not classlist:
+            return None
+        key = hashlib.sha256(json.dumps(
+            [os.path.realpath(classlist), os.stat(classlist).st_mtime_ns, JVM_RUN_FLAGS]
+        ).encode('utf-8')).hexdigest()[:16]
+        path = os.path.join(Config.JAVA_CDS_DIR, f"jdk-{key}.jsa")
+        with file_lock(os.path.join(Config.JAVA_CDS_DIR, ".lock")):
+            if not os.path.exists(path):
+                temp_path = f"{path}.tmp-{os.getpid()}"
+                try:
+                    result = subprocess.run(
+                        compile_command(["java"] + JVM_RUN_FLAGS + [
+                            "-Xshare:dump", f"-XX:SharedClassListFile={classlist}",
+                            f"-XX:SharedArchiveFile={temp_path}"]),
+                        capture_output=True, text=True, timeout=Config.JAVA_ARCHIVE_TIME_LIMIT
+                    )
+                    if result.returncode != 0:
+                        logger.warning(f"建立 CDS 封存檔失敗: {result.stderr.strip()[:200]}")
+                        return None
+                    os.rename(temp_path, path)
+                except (subprocess.TimeoutExpired, OSError) as e:
+                    logger.warning(f"建立 CDS 封存檔失敗: {e}")
+                    return None
+                finally:
+                    remove_file(temp_path)
+                logger.info(f"已建立共用 CDS 封存檔: {path}")
+        _java_cds_archive = path
+        return path
 
-        if not code:
-            return jsonify({"error": "請提供程式碼"}), 400
+def remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
-        if lang not in Config.SUPPORTED_LANGUAGES and lang != "default":
-            return jsonify({"error": f"不支援的程式語言。支援的語言: {', '.join(Config.SUPPORTED_LANGUAGES)}"}), 400
+def restore_cached_artifact(key: str, work_dir: str) -> bool:
+    """從快取複製編譯產物到工作目錄，命中時回傳 True
 
-        # 處理預設語言
-        config = load_config()
-        if lang == "default":
-            if not config.get("last_lang"):
-                return jsonify({"error": "目前沒有預設語言，請先選擇一種語言"}), 400
-            lang = config["last_lang"]
-        else:
-            config["last_lang"] = lang
-            save_config(config)
+    複製期間持有快取的共用鎖，淘汰 (獨占鎖) 不會在複製途中刪除項目，
+    避免 Java 只複製到部分 .class 檔卻回報命中。
+    """
+    entry_dir = os.path.join(Config.ARTIFACT_CACHE_DIR, key)
+    try:
+        with file_lock(os.path.join(Config.ARTIFACT_CACHE_DIR, ".lock"), shared=True):
+            if not os.path.isdir(entry_dir):
+                return False
+            for name in os.listdir(entry_dir):
+                shutil.copy2(os.path.join(entry_dir, name), os.path.join(work_dir, name))
+            # 更新 mtime 作為 LRU 的最近使用時間
+            os.utime(entry_dir)
+        return True
+    except OSError as e:
+        logger.warning(f"讀取編譯快取失敗: {e}")
+        return False
 
-        # 獲取測試資料
+def store_artifact(key: str, lang: str, work_dir: str) -> None:
+    """將編譯產物存入快取 (先寫入暫存目錄再 rename，其他 worker 不會看到半成品)"""
+    entry_dir = os.path.join(Config.ARTIFACT_CACHE_DIR, key)
+    try:
+        staging_dir = tempfile.mkdtemp(prefix=".tmp-", dir=Config.ARTIFACT_CACHE_DIR)
+        for name in list_artifact_files(lang, work_dir):
+            shutil.copy2(os.path.join(work_dir, name), os.path.join(staging_dir, name))
         try:
-            inputs = sorted([f for f in os.listdir(Config.TESTCASE_DIR) if f.endswith(".in")])
-        except Exception:
-            inputs = []
+            os.rename(staging_dir, entry_dir)
+        except OSError:
+            # 其他 worker 已先存入相同內容
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        evict_artifact_cache()
+    except OSError as e:
+        logger.warning(f"寫入編譯快取失敗: {e}")
 
-        if not inputs:
-            return jsonify({"error": "沒有可用的測試資料"}), 400
+def evict_artifact_cache() -> None:
+    """依 LRU 淘汰快取項目，直到總大小與項目數都在上限內"""
+    with file_lock(os.path.join(Config.ARTIFACT_CACHE_DIR, ".lock")):
+        entries = []
+        for entry in os.scandir(Config.ARTIFACT_CACHE_DIR):
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path))
+            entries.append((entry.stat().st_mtime, size, entry.path))
 
-        results = {}
-        success_count = 0
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > Config.ARTIFACT_CACHE_MAX_ENTRIES
+                           or total_size > Config.ARTIFACT_CACHE_MAX_BYTES):
+            _, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
 
-        # 使用臨時目錄執行程式碼
-        with tempfile.TemporaryDirectory() as temp_dir:
-            for input_file in inputs:
-                output_file = input_file.replace(".in", ".out")
-                input_path = os.path.join(Config.TESTCASE_DIR, input_file)
-                output_path = os.path.join(Config.TESTCASE_DIR, output_file)
+# 編譯器層級的加速：C++ 預編譯標頭與 Go 的持久化 build cache，
+# 與上方以整個提交為單位的編譯產物快取互補
+
+_pch_dir: Optional[str] = None
+
+def precompiled_header_key() -> Optional[str]:
+    """以 g++ 版本、編譯參數與標頭清單計算預編譯標頭的版本鍵，g++ 不存在時回傳 None"""
+    try:
+        version = subprocess.run(["g++", "--version"], capture_output=True, text=True,
+                                 timeout=10, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    digest = hashlib.sha256()
+    digest.update(version.encode('utf-8'))
+    digest.update(json.dumps([CPP_COMPILE_FLAGS, Config.CPP_PRECOMPILED_HEADERS]).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def build_precompiled_headers() -> None:
+    """建立常用 C++ 標頭的 .gch (啟動時於背景執行，多個 worker 以檔案鎖確保只建立一次)
 
+    .gch 放在以編譯器版本命名的目錄，編譯時以 -I 加入搜尋路徑，GCC 會在找到
+    對應標頭之前先使用 .gch；編譯器升級後舊目錄會被移除並重新建立。
+    """
+    global _pch_dir
+    key = precompiled_header_key()
+    if not key:
+        return
+    target_dir = os.path.join(Config.PCH_DIR, key)
+    start_time = time.time()
+    try:
+        with file_lock(os.path.join(Config.PCH_DIR, ".lock")):
+            for entry in os.scandir(Config.PCH_DIR):
+                if entry.is_dir() and entry.path != target_dir:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            if not os.path.isdir(target_dir):
+                staging_dir = tempfile.mkdtemp(prefix=".tmp-", dir=Config.PCH_DIR)
                 try:
-                    # 讀取輸入資料
-                    with open(input_path, "r", encoding='utf-8') as f:
-                        input_data = f.read()
-
-                    # 執行程式碼
-                    user_output, success, exec_time = compile_and_run_code(code, lang, input_data, temp_dir)
-                    
-                    # 讀取預期輸出
-                    expected_output = ""
-                    has_expected = os.path.exists(output_path)
-                    if has_expected:
-                        with open(output_path, "r", encoding='utf-8') as f:
-                            expected_output = f.read()
-
-                    # 比對輸出
-                    if success and has_expected and user_output.strip() == expected_output.strip():
-                        comparison_result = "通過 ✅"
-                        success_count += 1
-                    elif not has_expected:
-                        comparison_result = "無預期輸出 ⚠️"
-                    else:
-                        comparison_result = "未通過 ❌"
-
-                    results[input_file] = {
-                        "user_output": user_output,
-                        "expected_output": expected_output,
-                        "comparison_result": comparison_result,
-                        "execution_time": exec_time,
-                        "has_expected": has_expected
-                    }
+                    for index, header in enumerate(Config.CPP_PRECOMPILED_HEADERS):
+                        wrapper = os.path.join(staging_dir, f"wrapper{index}.h")
+                        with open(wrapper, "w", encoding="utf-8") as f:
+                            f.write(f"#include <{header}>\n")
+                        output = os.path.join(staging_dir, header + ".gch")
+                        os.makedirs(os.path.dirname(output), exist_ok=True)
+                        subprocess.run(compile_command(["g++"] + CPP_COMPILE_FLAGS
+                                                       + ["-x", "c++-header", wrapper, "-o", output]),
+                                       capture_output=True, timeout=300, check=True)
+                        os.remove(wrapper)
+                    os.rename(staging_dir, target_dir)
+                    logger.info(f"預編譯標頭建立完成 ({time.time() - start_time:.1f}s)")
+                except Exception:
+                    shutil.rmtree(staging_dir, ignore_errors=True)
+                    raise
+        _pch_dir = target_dir
+    except Exception as e:
+        logger.error(f"建立預編譯標頭失敗: {e}")
 
-                except Exception as e:
-                    logger.error(f"處理測試案例 {input_file} 失敗: {e}")
-                    results[input_file] = {
-                        "user_output": f"處理錯誤: {str(e)}",
-                        "expected_output": "",
-                        "comparison_result": "錯誤 ❌",
-                        "execution_time": "0s",
-                        "has_expected": False
-                    }
+def uses_precompiled_header(code: str) -> bool:
+    """程式碼是否引用了已預編譯的標頭 (GCC 只會使用第一個 #include 的 .gch)"""
+    for line in code.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("#include"):
+            header = stripped[len("#include"):].strip().strip("<>\"")
+            return header in Config.CPP_PRECOMPILED_HEADERS
+    return False
 
-        total_count = len(inputs)
-        summary = {
-            "success_count": success_count,
-            "total_count": total_count,
-            "success_rate": f"{(success_count/total_count*100):.1f}%" if total_count > 0 else "0%",
-            "language": lang,
-            "timestamp": datetime.now().isoformat()
-        }
+def trim_go_build_cache() -> None:
+    """GOCACHE 超過大小上限時，依最後使用時間刪除最舊的快取檔案
 
-        logger.info(f"評判完成: {lang}, {success_count}/{total_count} 通過")
-        return jsonify({"results": results, "summary": summary}), 200
+    Go 在每次使用快取項目時會更新 mtime，缺少的項目只會被視為未命中並重新編譯，
+    因此可以安全地在其他編譯進行中刪除。
+    """
+    marker = os.path.join(Config.CACHE_DIR, ".go-build-trim")
+    try:
+        if time.time() - os.path.getmtime(marker) < Config.GO_BUILD_CACHE_TRIM_INTERVAL:
+            return
+    except OSError:
+        pass
+    with file_lock(marker + ".lock"):
+        with open(marker, "w"):
+            pass
+        entries = []
+        for subdir in os.scandir(Config.GO_BUILD_CACHE_DIR):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        if total_size <= Config.GO_BUILD_CACHE_MAX_BYTES:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= Config.GO_BUILD_CACHE_MAX_BYTES * 0.8:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+        logger.info(f"GOCACHE 已清理至 {total_size / 1024 / 1024:.0f}MB")
 
-    except Exception as e:
-        logger.error(f"評判程式碼失敗: {e}")
-        return jsonify({"error": "評判失敗，請稍後再試"}), 500
+GO_WARMUP_SOURCE = """package main
 
-@app.route("/api/settings", methods=["GET"])
-def get_settings():
-    """獲取系統設定"""
+import (
+	"bufio"
+	"fmt"
+	"math"
+	"os"
+	"sort"
+	"strconv"
+	"strings"
+)
+
+func main() {
+	w := bufio.NewWriter(os.Stdout)
+	defer w.Flush()
+	s := []string{strconv.Itoa(int(math.Sqrt(4)))}
+	sort.Strings(s)
+	fmt.Fprintln(w, strings.Join(s, " "))
+}
+"""
+
+def warm_go_build_cache() -> None:
+    """以常用標準函式庫編譯一次小程式，讓第一次提交不必從頭編譯相依套件"""
+    if not shutil.which("go"):
+        return
+    start_time = time.time()
     try:
-        config = load_config()
-        settings = config.get("settings", DEFAULT_SETTINGS.copy())
-        return jsonify({"settings": settings}), 200
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, "main.go"), "w", encoding="utf-8") as f:
+                f.write(GO_WARMUP_SOURCE)
+            env = dict(os.environ, **LANGUAGE_CONFIG["golang"]["compile_env"])
+            subprocess.run(compile_command(LANGUAGE_CONFIG["golang"]["compile_cmd"]), cwd=temp_dir, env=env,
+                           capture_output=True, timeout=300, check=True)
+        logger.info(f"GOCACHE 預熱完成 ({time.time() - start_time:.1f}s)")
     except Exception as e:
-        logger.error(f"獲取設定失敗: {e}")
-        return jsonify({"error": "獲取設定失敗"}), 500
+        logger.error(f"GOCACHE 預熱失敗: {e}")
 
-@app.route("/api/settings", methods=["POST"])
-def update_settings():
-    """更新系統設定"""
+def prepare_toolchain_caches() -> None:
+    """啟動時於背景建立預編譯標頭並預熱 GOCACHE"""
+    build_precompiled_headers()
+    warm_go_build_cache()
+
+def compile_code(code: str, lang: str, work_dir: str) -> Tuple[bool, str, Dict]:
+    """編譯程式碼 (每次提交只執行一次，產物留在 work_dir 供所有測試案例使用)
+
+    回傳 (是否成功, 錯誤訊息, 編譯資訊)，編譯資訊包含快取命中狀態與編譯時間。
+    """
+    build_info = {"build_cache": "none", "build_time": "0.000s"}
     try:
-        data = request.get_json()
-        if not data or "settings" not in data:
-            return jsonify({"error": "請提供有效的設定資料"}), 400
+        config = LANGUAGE_CONFIG.get(lang)
+        if not config:
+            return False, "不支援的程式語言", build_info
 
-        new_settings = data["settings"]
-        
-        # 驗證設定值
-        validation_errors = []
-        
-        if "execution_time_limit" in new_settings:
-            if not isinstance(new_settings["execution_time_limit"], (int, float)) or new_settings["execution_time_limit"] <= 0 or new_settings["execution_time_limit"] > 60:
-                validation_errors.append("執行時間限制必須是1-60秒之間的數字")
-        
-        if "memory_limit" in new_settings:
-            if not isinstance(new_settings["memory_limit"], int) or new_settings["memory_limit"] <= 0 or new_settings["memory_limit"] > 1024:
-                validation_errors.append("記憶體限制必須是1-1024MB之間的整數")
-        
-        if "compile_time_limit" in new_settings:
-            if not isinstance(new_settings["compile_time_limit"], (int, float)) or new_settings["compile_time_limit"] <= 0 or new_settings["compile_time_limit"] > 60:
+        write_source_file(code, lang, work_dir)
+
+        if not config['need_compile']:
+            return True, "", build_info
+
+        start_time = time.time()
+        key = artifact_cache_key(code, lang)
+        if restore_cached_artifact(key, work_dir):
+            build_info["build_cache"] = "hit"
+            build_info["build_time"] = f"{time.time() - start_time:.3f}s"
+            return True, "", build_info
+
+        build_info["build_cache"] = "miss"
+        compile_cmd = list(config['compile_cmd'])
+        env = dict(os.environ, **config.get('compile_env', {}))
+        toolchain_cache = "none"
+        if lang == "cpp" and _pch_dir and uses_precompiled_header(code):
+            compile_cmd[1:1] = ["-I", _pch_dir]
+            toolchain_cache = "pch"
+        elif 'GOCACHE' in config.get('compile_env', {}):
+            toolchain_cache = "gocache"
+        build_info["toolchain_cache"] = toolchain_cache
+        try:
+            compile_result = subprocess.run(
+                compile_command(compile_cmd),
+                cwd=work_dir,
+                env=env,
+                capture_output=True,
+                text=True,
+                timeout=get_setting("compile_time_limit")
+            )
+            build_info["build_time"] = f"{time.time() - start_time:.3f}s"
+            if compile_result.returncode != 0:
+                return False, f"編譯錯誤: {compile_result.stderr}", build_info
+            if lang == "java":
+                # 第一次編譯 Java 時建立共用封存檔 (之後直接使用)，不計入編譯時間
+                build_info["class_data_sharing"] = java_cds_archive() is not None
+        except subprocess.TimeoutExpired:
+            # 逾時可能只是機器忙碌，重新提交時應重新編譯，不可快取
+            build_info["retryable"] = True
+            return False, "編譯時間過長", build_info
+
+        record_build_stats(lang, toolchain_cache, time.time() - start_time)
+        if lang == "golang":
+            trim_go_build_cache()
+        store_artifact(key, lang, work_dir)
+        return True, "", build_info
+
+    except Exception as e:
+        logger.error(f"編譯程式碼失敗: {e}")
+        build_info["retryable"] = True
+        return False, f"編譯錯誤: {str(e)}", build_info
+
+# 串流執行：stdin 直接從測試檔讀取，stdout 以固定大小的區塊讀出並與預期輸出逐段比對，
+# 記憶體中只保留有限長度的輸出前綴供回應顯示
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+WHITESPACE = b" \t\n\r\x0b\x0c"
+
+class StrippedStream:
+    """逐段輸出去除整體前後空白後的內容 (等同於對完整內容呼叫 strip())"""
+
+    def __init__(self):
+        self.started = False
+        self.pending = bytearray()
+
+    def feed(self, chunk: bytes) -> bytes:
+        if not self.started:
+            chunk = chunk.lstrip(WHITESPACE)
+            if not chunk:
+                return b""
+            self.started = True
+        body = chunk.rstrip(WHITESPACE)
+        trailing = chunk[len(body):]
+        if not body:
+            # 只有空白時先暫存，等到後面出現非空白字元才輸出
+            self.pending += trailing
+            return b""
+        data = bytes(self.pending) + body
+        self.pending = bytearray(trailing)
+        return data
+
+class StreamingComparator:
+    """將程式輸出與預期輸出檔逐段比對 (忽略整體前後空白)，不需將兩者完整載入記憶體"""
+
+    def __init__(self, expected_path: str):
+        self.expected_file = open(expected_path, "rb")
+        self.expected_stream = StrippedStream()
+        self.expected_buffer = bytearray()
+        self.expected_eof = False
+        self.user_stream = StrippedStream()
+        self.matched = True
+
+    def _fill_expected(self, size: int) -> None:
+        while len(self.expected_buffer) < size and not self.expected_eof:
+            chunk = self.expected_file.read(Config.IO_CHUNK_SIZE)
+            if not chunk:
+                self.expected_eof = True
+            else:
+                self.expected_buffer += self.expected_stream.feed(chunk)
+
+    def feed(self, chunk: bytes) -> None:
+        if not self.matched:
+            return
+        data = self.user_stream.feed(chunk)
+        if not data:
+            return
+        self._fill_expected(len(data))
+        if self.expected_buffer[:len(data)] != data:
+            self.matched = False
+            return
+        del self.expected_buffer[:len(data)]
+
+    def finish(self) -> bool:
+        """程式輸出結束後，確認預期輸出也沒有剩餘內容"""
+        if self.matched:
+            self._fill_expected(1)
+            self.matched = not self.expected_buffer
+        return self.matched
+
+    def close(self) -> None:
+        self.expected_file.close()
+
+# 展開的測試檔內容不會變動，預期輸出的預覽依 inode 快取在行程內 (LRU，有總大小上限)
+_preview_cache: "OrderedDict[Tuple, Tuple[str, bool]]" = OrderedDict()
+_preview_cache_bytes = 0
+_preview_cache_lock = threading.Lock()
+
+def read_prefix(path: str, limit: int) -> Tuple[str, bool]:
+    """讀取檔案前 limit 個位元組，回傳 (內容, 是否截斷)"""
+    global _preview_cache_bytes
+    st = os.stat(path)
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, limit)
+    with _preview_cache_lock:
+        if key in _preview_cache:
+            _preview_cache.move_to_end(key)
+            return _preview_cache[key]
+    with open(path, "rb") as f:
+        data = f.read(limit + 1)
+    preview = (data[:limit].decode('utf-8', errors='replace'), len(data) > limit)
+    with _preview_cache_lock:
+        if key not in _preview_cache:
+            _preview_cache[key] = preview
+            _preview_cache_bytes += len(data)
+            while _preview_cache_bytes > Config.PREVIEW_CACHE_MAX_BYTES and _preview_cache:
+                old_key, _ = _preview_cache.popitem(last=False)
+                _preview_cache_bytes -= min(old_key[2], old_key[4] + 1)
+    return preview
+
+# 記憶體不足時各語言執行環境常見的錯誤訊息
+OUT_OF_MEMORY_MESSAGES = (
+    "MemoryError",
+    "std::bad_alloc",
+    "java.lang.OutOfMemoryError",
+    "JavaScript heap out of memory",
+    "runtime: out of memory",
+    "cannot allocate memory",
+)
+
+def build_run_command(lang: str, memory_limit: int,
+                      base_cmd: Optional[List[str]] = None) -> Tuple[List[str], Dict[str, str]]:
+    """依記憶體限制組出執行指令與環境變數 (Java 的 -Xmx、Node 的 heap 上限、Go 的 GOMEMLIMIT)
+
+    Java 有共用的 CDS 封存檔時一併加入 JVM 參數。
+    """
+    config = LANGUAGE_CONFIG[lang]
+    run_cmd = list(base_cmd or config['run_cmd'])
+    memory_args = [arg.format(memory=memory_limit) for arg in config.get('memory_args', [])]
+    if config.get('class_data_sharing'):
+        archive = java_cds_archive()
+        if archive:
+            memory_args.append(f"-XX:SharedArchiveFile={archive}")
+    env = dict(os.environ)
+    for key, value in config.get('memory_env', {}).items():
+        env[key] = value.format(memory=memory_limit)
+    return run_cmd[:1] + memory_args + run_cmd[1:], env
+
+_startup_cpu_cache: Dict[Tuple[str, ...], float] = {}
+_startup_cpu_lock = threading.Lock()
+
+def measure_startup_cpu(lang: str, memory_limit: int) -> float:
+    """量測執行環境本身的啟動 CPU 時間 (例如 JVM 執行 -version)，結果依指令快取
+
+    以與實際執行相同的參數 (包含共用的 CDS 封存檔) 量測。
+    取數次量測的最小值，作為從程式 CPU 時間中扣除的啟動成本。
+    """
+    probe_cmd = LANGUAGE_CONFIG[lang].get('startup_probe_cmd')
+    if not probe_cmd:
+        return 0.0
+    cmd, env = build_run_command(lang, memory_limit, probe_cmd)
+    key = tuple(cmd)
+    with _startup_cpu_lock:
+        if key not in _startup_cpu_cache:
+            samples = []
+            for _ in range(Config.STARTUP_PROBE_RUNS):
+                # 與實際執行相同經由 spawn_held 啟動，等待放行的 sh 所用的 CPU 時間一併扣除
+                try:
+                    process, gate = spawn_held(cmd, os.devnull, env=env, stdout=subprocess.DEVNULL,
+                                               stderr=subprocess.DEVNULL)
+                except OSError as e:
+                    logger.warning(f"量測啟動時間失敗 ({lang}): {e}")
+                    break
+                try:
+                    os.sched_setaffinity(process.pid, compile_cpus)
+                    os.write(gate, b"\n")
+                except OSError:
+                    pass
+                finally:
+                    os.close(gate)
+                _, wait_status, usage = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(wait_status)
+                samples.append(usage.ru_utime + usage.ru_stime)
+            _startup_cpu_cache[key] = min(samples) if samples else 0.0
+            logger.info(f"{lang} 啟動 CPU 時間: {_startup_cpu_cache[key]:.3f}s")
+        return _startup_cpu_cache[key]
+
+# 子行程的限制由父行程設定：程式經由 /bin/sh 啟動，sh 在 exec 目標程式前讀取 stdin 上的一行
+# 放行訊號；父行程在這段期間以 prlimit、sched_setaffinity 與 cgroup.procs 設定子行程後才放行。
+# exec 後行程 ID、rlimit、affinity 與 cgroup 都會保留，且不需要 preexec_fn (在多執行緒的行程中
+# fork 後執行 Python 程式碼可能死結)。sh 的 read 逐位元組讀取，不會讀走放行訊號之後的資料。
+# stdin_path 為空字串時目標程式沿用同一條管線作為 stdin (預熱直譯器)。
+HOLD_SCRIPT = 'read -r _ || exit 125; f=$1; shift; [ -n "$f" ] && exec "$@" < "$f"; exec "$@"'
+
+def spawn_held(cmd: List[str], stdin_path: Optional[str], **popen_args) -> Tuple[subprocess.Popen, int]:
+    """啟動停在 exec 前的子行程，回傳 (行程, 放行管線的寫入端)
+
+    寫入一行到管線即放行；未放行就關閉管線時子行程直接結束。stdin_path 為 None 時，
+    放行後的管線就是目標程式的 stdin，由呼叫端負責關閉。
+    """
+    gate_read, gate_write = os.pipe()
+    try:
+        process = subprocess.Popen(["/bin/sh", "-c", HOLD_SCRIPT, "judge-run", stdin_path or ""] + list(cmd),
+                                   stdin=gate_read, **popen_args)
+    except BaseException:
+        os.close(gate_write)
+        raise
+    finally:
+        os.close(gate_read)
+    return process, gate_write
+
+TASKSET = shutil.which("taskset")
+
+def compile_command(cmd: List[str]) -> List[str]:
+    """編譯等不計時的工作經由 taskset 固定在編譯用的核心 (所有子行程都會繼承)"""
+    if TASKSET and set(compile_cpus) != os.sched_getaffinity(0):
+        return [TASKSET, "-c", ",".join(map(str, compile_cpus))] + list(cmd)
+    return list(cmd)
+
+def resolve_run_limits(lang: str, time_limit: float, memory_limit: int,
+                       file_limit: int) -> List[Tuple[int, int, int]]:
+    """計算執行時套用的 rlimit (CPU 時間、位址空間、行程數、檔案大小)
+
+    RLIMIT_NPROC 以使用者為單位計算，只作為總上限；單次執行的行程數由 cgroup 的 pids.max 限制。
+    """
+    cpu_limit = math.ceil(time_limit) + 1
+    limits = [
+        (resource.RLIMIT_CPU, cpu_limit, cpu_limit + 1),
+        (resource.RLIMIT_NPROC, Config.USER_MAX_PROCESSES, Config.USER_MAX_PROCESSES),
+        (resource.RLIMIT_FSIZE, file_limit, file_limit),
+        (resource.RLIMIT_CORE, 0, 0),
+    ]
+    if LANGUAGE_CONFIG[lang].get('limit_address_space'):
+        address_space = (memory_limit + Config.ADDRESS_SPACE_SLACK_MB) * 1024 * 1024
+        limits.append((resource.RLIMIT_AS, address_space, address_space))
+
+    # 不可超過目前的 hard limit (非特權行程無法調高)
+    resolved = []
+    for kind, soft, hard in limits:
+        current_hard = resource.getrlimit(kind)[1]
+        if current_hard != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current_hard), min(hard, current_hard)
+        resolved.append((kind, soft, hard))
+    return resolved
+
+def apply_run_limits(pid: int, limits: List[Tuple[int, int, int]]) -> None:
+    """以 prlimit 對尚未放行的子行程套用 rlimit"""
+    for kind, soft, hard in limits:
+        resource.prlimit(pid, kind, (soft, hard))
+
+def read_memory_status(pid: int) -> Tuple[int, int]:
+    """讀取行程目前的 RSS 與 peak RSS (VmHWM)，單位 bytes；行程已結束時回傳 (0, 0)"""
+    rss = hwm = 0
+    try:
+        with open(f"/proc/{pid}/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith(b"VmHWM:"):
+                    hwm = int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    return rss, hwm
+
+def current_rss() -> int:
+    """本行程目前的 RSS (bytes)"""
+    with open("/proc/self/statm", "rb") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+# 計時執行的隔離
+# 每次執行從 RUN_CPUS 取得一個獨占的核心 (以各核心的檔案鎖在所有 worker 行程間協調)，
+# 並以 CPU affinity 固定在該核心；cgroup v2 可用時另外放入專屬的子 cgroup，以 cpu.max
+# 限制為一顆核心並設定 memory.max。編譯、JVM 啟動量測與預熱直譯器的啟動固定在其餘核心，
+# 不佔用計時執行的核心 (只有一顆核心可用時兩者共用)。
+
+def parse_cpu_list(text: str) -> List[int]:
+    """解析 "0-3,6" 格式的 CPU 清單"""
+    cpus = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+def resolve_cpu_sets() -> Tuple[List[int], List[int]]:
+    """決定計時執行與編譯使用的核心，回傳 (執行核心, 編譯核心)"""
+    allowed = sorted(os.sched_getaffinity(0))
+    run = []
+    if Config.RUN_CPUS:
+        try:
+            run = [cpu for cpu in parse_cpu_list(Config.RUN_CPUS) if cpu in allowed]
+        except ValueError:
+            pass
+        if not run:
+            logger.warning(f"JUDGE_RUN_CPUS={Config.RUN_CPUS} 無效或不在可用核心內，改用所有核心")
+    run = run or allowed
+    compile_cpus = [cpu for cpu in allowed if cpu not in run] or allowed
+    return run, compile_cpus
+
+run_cpus, compile_cpus = resolve_cpu_sets()
+
+_cgroup_lock = threading.Lock()
+_cgroup_checked = False
+_cgroup_root: Optional[str] = None
+
+def get_cgroup_root() -> Optional[str]:
+    """準備存放執行 cgroup 的目錄並啟用 cpu、memory 控制器，cgroup v2 無法使用時回傳 None"""
+    global _cgroup_checked, _cgroup_root
+    with _cgroup_lock:
+        if _cgroup_checked:
+            return _cgroup_root
+        _cgroup_checked = True
+        parent = os.path.dirname(Config.CGROUP_ROOT)
+        try:
+            with open(os.path.join(parent, "cgroup.controllers")) as f:
+                available = set(f.read().split())
+            if not {"cpu", "memory"} <= available:
+                raise OSError("上層 cgroup 未提供 cpu / memory 控制器")
+            # pids 控制器可用時一併啟用，以 pids.max 限制單次執行的行程數
+            controllers = [name for name in ("cpu", "memory", "pids") if name in available]
+            os.makedirs(Config.CGROUP_ROOT, exist_ok=True)
+            for path in (parent, Config.CGROUP_ROOT):
+                with open(os.path.join(path, "cgroup.subtree_control")) as f:
+                    enabled = set(f.read().split())
+                missing = " ".join(f"+{name}" for name in controllers if name not in enabled)
+                if missing:
+                    with open(os.path.join(path, "cgroup.subtree_control"), "w") as f:
+                        f.write(missing)
+            # 清除先前行程異常結束留下的執行 cgroup (仍在使用中的無法刪除，會被略過)
+            for entry in os.scandir(Config.CGROUP_ROOT):
+                if entry.is_dir() and entry.name.startswith("run-"):
+                    try:
+                        os.rmdir(entry.path)
+                    except OSError:
+                        pass
+            _cgroup_root = Config.CGROUP_ROOT
+            logger.info(f"計時執行使用 cgroup v2 隔離: {_cgroup_root}")
+        except OSError as e:
+            logger.info(f"cgroup v2 無法使用，計時執行只以 CPU affinity 隔離: {e}")
+        return _cgroup_root
+
+def create_run_cgroup(memory_cap: int) -> Optional[str]:
+    """建立單次執行專用的子 cgroup (一顆核心的 CPU 配額、記憶體上限)，無法建立時回傳 None"""
+    root = get_cgroup_root()
+    if not root:
+        return None
+    path = os.path.join(root, f"run-{uuid.uuid4().hex[:16]}")
+    try:
+        os.mkdir(path)
+        for name, value in (("cpu.max", "100000 100000"), ("memory.max", str(memory_cap)),
+                            ("memory.swap.max", "0"), ("pids.max", str(Config.RUN_MAX_PROCESSES))):
+            control = os.path.join(path, name)
+            if os.path.exists(control):
+                with open(control, "w") as f:
+                    f.write(value)
+        return path
+    except OSError as e:
+        logger.error(f"建立執行 cgroup 失敗: {e}")
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+        return None
+
+class RunSlot:
+    """單次計時執行分配到的核心與 cgroup，執行結束後必須 release (由父行程以 attach 套用)"""
+
+    def __init__(self, cpu: int, lock_file, cgroup: Optional[str]):
+        self.cpu = cpu
+        self.lock_file = lock_file
+        self.cgroup = cgroup
+
+    @property
+    def isolation(self) -> str:
+        return "cgroup" if self.cgroup else "affinity"
+
+    def attach(self, pid: int) -> None:
+        """將行程 (尚未放行的子行程或預熱直譯器) 的所有執行緒移入 cgroup 並固定在分配到的核心"""
+        if self.cgroup:
+            try:
+                with open(os.path.join(self.cgroup, "cgroup.procs"), "w") as f:
+                    f.write(str(pid))
+            except OSError as e:
+                # 行程不在 cgroup 內，改為只以 CPU affinity 隔離，isolation 才會如實回報
+                logger.warning(f"移入執行 cgroup 失敗，改用 CPU affinity: {e}")
+                try:
+                    os.rmdir(self.cgroup)
+                except OSError:
+                    pass
+                self.cgroup = None
+        try:
+            tasks = os.listdir(f"/proc/{pid}/task")
+        except OSError:
+            tasks = [str(pid)]
+        for task in tasks:
+            try:
+                os.sched_setaffinity(int(task), {self.cpu})
+            except OSError:
+                pass
+
+    def oom_killed(self) -> bool:
+        """執行期間是否有行程因超過 cgroup 記憶體上限被終止"""
+        if not self.cgroup:
+            return False
+        try:
+            with open(os.path.join(self.cgroup, "memory.events")) as f:
+                for line in f:
+                    name, _, value = line.partition(" ")
+                    if name == "oom_kill":
+                        return int(value) > 0
+        except (OSError, ValueError):
+            pass
+        return False
+
+    def release(self) -> None:
+        if self.cgroup:
+            try:
+                os.rmdir(self.cgroup)
+            except OSError as e:
+                logger.warning(f"刪除執行 cgroup 失敗: {e}")
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+
+_run_slot_turn = itertools.count(os.getpid())
+
+def acquire_run_slot(memory_cap: int) -> RunSlot:
+    """取得一顆空閒的計時執行核心，cgroup 可用時一併建立專屬的子 cgroup
+
+    全部忙碌時輪流選定一顆核心並阻塞在它的檔案鎖上 (不輪詢)，等待者平均分散在各核心，
+    由核心在釋放鎖時喚醒，不會因為輪詢的時機而一直搶不到。
+    """
+    start_time = time.monotonic()
+    cpu, lock_file = None, None
+    for candidate in run_cpus:
+        lock_file = open(os.path.join(Config.CPU_SLOT_DIR, f"cpu{candidate}.lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            cpu = candidate
+            break
+        except BlockingIOError:
+            lock_file.close()
+    if cpu is None:
+        cpu = run_cpus[next(_run_slot_turn) % len(run_cpus)]
+        lock_file = open(os.path.join(Config.CPU_SLOT_DIR, f"cpu{cpu}.lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except BaseException:
+            lock_file.close()
+            raise
+    metrics.observe("judge_cpu_slot_wait_seconds", time.monotonic() - start_time)
+    return RunSlot(cpu, lock_file, create_run_cgroup(memory_cap))
+
+# 預熱直譯器池 (Python / JavaScript)
+# 事先啟動並完成 import 的直譯器行程，阻塞在控制管線上等待指派程式。每個行程只執行一次
+# 提交的程式，執行後即結束，因此每次執行仍是全新、互相隔離的行程，擁有自己的
+# stdin/stdout 與 rlimit；只是直譯器啟動成本移到評判的關鍵路徑之外。
+# (Node 無法 fork，因此兩種語言都採用「預先啟動、單次使用」而非 fork server。)
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+def read_cpu_time(pid: int) -> float:
+    """讀取行程目前已使用的 CPU 時間 (秒)"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+class WarmRunner:
+    """已啟動、等待指派程式的直譯器行程"""
+
+    def __init__(self, lang: str, limits: Tuple[float, int, int]):
+        time_limit, memory_limit, output_limit = limits
+        bootstrap = LANGUAGE_CONFIG[lang]['warm_bootstrap']
+        control_read, self.control_write = os.pipe()
+        cmd, env = build_run_command(lang, memory_limit, bootstrap + [str(control_read)])
+        self.fork_rss = current_rss()
+        try:
+            # 放行管線之後就是程式的 stdin
+            self.process, gate = spawn_held(
+                cmd,
+                None,
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                pass_fds=(control_read,),
+                start_new_session=True
+            )
+        except BaseException:
+            os.close(self.control_write)
+            raise
+        finally:
+            os.close(control_read)
+        self.stdin = os.fdopen(gate, "wb", buffering=0)
+        try:
+            # 啟動時固定在編譯用的核心，指派程式後再移到執行核心
+            apply_run_limits(self.process.pid, resolve_run_limits(lang, time_limit, memory_limit, output_limit))
+            os.sched_setaffinity(self.process.pid, compile_cpus)
+            self.stdin.write(b"\n")
+        except BaseException:
+            self.discard()
+            raise
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def start(self, script_path: str) -> float:
+        """指派要執行的程式，回傳指派前已使用的 CPU 時間 (直譯器啟動成本)"""
+        startup_cpu = read_cpu_time(self.process.pid)
+        os.write(self.control_write, script_path.encode() + b"\n")
+        os.close(self.control_write)
+        return startup_cpu
+
+    def discard(self) -> None:
+        os.close(self.control_write)
+        for pipe in (self.stdin, self.process.stdout, self.process.stderr):
+            pipe.close()
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+
+class WarmRunnerPool:
+    """每個 gunicorn worker 各自維護的預熱直譯器池，由背景執行緒補充"""
+
+    def __init__(self):
+        self._idle: Dict[Tuple[str, Tuple], List[WarmRunner]] = {}
+        self._wanted: Dict[str, Tuple] = {}
+        self._lock = threading.Lock()
+        self._refill = threading.Event()
+        self._thread = None
+
+    def acquire(self, lang: str, limits: Tuple[float, int, int]) -> Optional[WarmRunner]:
+        """取得一個可用的預熱行程，沒有時回傳 None (改用一般方式啟動)"""
+        stale = []
+        runner = None
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refill_loop, daemon=True)
+                self._thread.start()
+            # 限制變更後，舊設定啟動的行程不再使用
+            if self._wanted.get(lang) != limits:
+                stale = self._idle.pop((lang, self._wanted.get(lang)), [])
+                self._wanted[lang] = limits
+            idle = self._idle.setdefault((lang, limits), [])
+            while idle and runner is None:
+                candidate = idle.pop()
+                if candidate.alive():
+                    runner = candidate
+                else:
+                    stale.append(candidate)
+        for old in stale:
+            old.discard()
+        self._refill.set()
+        return runner
+
+    def _refill_loop(self) -> None:
+        while True:
+            self._refill.wait(Config.WARM_POOL_REFILL_INTERVAL)
+            self._refill.clear()
+            with self._lock:
+                wanted = list(self._wanted.items())
+            for lang, limits in wanted:
+                while True:
+                    with self._lock:
+                        if self._wanted.get(lang) != limits:
+                            break
+                        if len(self._idle.setdefault((lang, limits), [])) >= Config.WARM_POOL_SIZE:
+                            break
+                    try:
+                        runner = WarmRunner(lang, limits)
+                    except Exception as e:
+                        logger.error(f"啟動預熱直譯器失敗 ({lang}): {e}")
+                        break
+                    with self._lock:
+                        self._idle.setdefault((lang, limits), []).append(runner)
+
+warm_pool = WarmRunnerPool()
+
+def run_program(lang: str, input_path: str, work_dir: str,
+                on_stdout: Optional[Callable[[bytes], None]] = None) -> Dict:
+    """以測試檔作為 stdin 執行已編譯的程式
+
+    stdout 逐段交給 on_stdout 處理，只保留前 OUTPUT_PREVIEW_BYTES 個位元組；超過
+    output_limit 時終止程式。程式以 rlimit 限制 CPU 時間、記憶體、行程數與檔案大小，
+    結束後由 wait4 取得 CPU 時間與 peak RSS。回傳的 status 為
+    ok / timeout / memory_limit / output_limit。
+    """
+    config = LANGUAGE_CONFIG[lang]
+    time_limit = get_setting("execution_time_limit")
+    memory_limit = get_setting("memory_limit")
+    output_limit = get_setting("output_limit") * 1024 * 1024
+    memory_cap = (memory_limit + config.get('memory_overhead', 0)) * 1024 * 1024
+
+    run_cmd, env = build_run_command(lang, memory_limit)
+    limits = resolve_run_limits(lang, time_limit, memory_limit, output_limit)
+    stdout_prefix = bytearray()
+    stderr_prefix = bytearray()
+    stdout_size = 0
+    status = "ok"
+    usage = None
+    sampled_peak = 0
+
+    def memory_exceeded() -> bool:
+        nonlocal sampled_peak
+        rss, hwm = read_memory_status(process.pid)
+        sampled_peak = max(sampled_peak, hwm)
+        return rss > memory_cap
+
+    warm_runner = None
+    if config.get('warm_bootstrap') and get_setting("warm_runners"):
+        warm_runner = warm_pool.acquire(lang, (time_limit, memory_limit, output_limit))
+    startup_cpu = 0.0
+    if not warm_runner:
+        # JVM 等執行環境的啟動成本另外回報，不計入程式的 CPU 時間 (在編譯核心上量測，不佔用執行核心)
+        startup_cpu = measure_startup_cpu(lang, memory_limit)
+
+    # 獨占一顆執行核心，避免與其他執行搶同一顆核心而讓計時失真
+    slot = acquire_run_slot(memory_cap)
+    stdin_file = open(input_path, "rb") if warm_runner else None
+    stdin_pipe = warm_runner.stdin if warm_runner else None
+    pending_input = b""
+    process = None
+    try:
+        if warm_runner:
+            # 預熱行程的 stdin 是管線，由下方的迴圈把測試檔內容寫入
+            process = warm_runner.process
+            fork_rss = warm_runner.fork_rss
+            slot.attach(process.pid)
+            start_time = time.monotonic()
+            startup_cpu = warm_runner.start(os.path.join(work_dir, os.path.basename(run_cmd[-1])))
+            os.set_blocking(stdin_pipe.fileno(), False)
+        else:
+            # 子行程在 exec 前沿用本行程的記憶體，ru_maxrss 至少會是這個值
+            fork_rss = current_rss()
+            process, gate = spawn_held(
+                run_cmd,
+                os.path.abspath(input_path),
+                cwd=work_dir,
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True
+            )
+            try:
+                apply_run_limits(process.pid, limits)
+                slot.attach(process.pid)
+                start_time = time.monotonic()
+                os.write(gate, b"\n")
+            finally:
+                os.close(gate)
+    except BaseException:
+        if process and not warm_runner:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            process.wait()
+            process.stdout.close()
+            process.stderr.close()
+        if stdin_file:
+            stdin_file.close()
+        slot.release()
+        raise
+
+    # CPU 時間由 RLIMIT_CPU 限制；牆鐘時間給較寬的上限，避免程式因等待而永遠不結束
+    deadline = start_time + time_limit * Config.WALL_TIME_FACTOR
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+    selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+    if warm_runner:
+        selector.register(stdin_pipe, selectors.EVENT_WRITE, "stdin")
+    metrics.inc("judge_runs_in_flight", {"lang": lang})
+    try:
+        while status == "ok" and selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                status = "timeout"
+                break
+            for key, _ in selector.select(min(remaining, Config.MEMORY_POLL_INTERVAL)):
+                if key.data == "stdin":
+                    if not pending_input:
+                        pending_input = stdin_file.read(Config.IO_CHUNK_SIZE)
+                    try:
+                        if pending_input:
+                            pending_input = pending_input[os.write(key.fd, pending_input):]
+                        input_done = not pending_input and stdin_file.peek(1) == b""
+                    except BlockingIOError:
+                        continue
+                    except BrokenPipeError:
+                        # 程式已結束或關閉 stdin，剩餘的輸入不必再寫入
+                        input_done = True
+                    if input_done:
+                        selector.unregister(key.fileobj)
+                        stdin_pipe.close()
+                    continue
+                chunk = os.read(key.fd, Config.IO_CHUNK_SIZE)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                if key.data == "stderr":
+                    if len(stderr_prefix) < Config.OUTPUT_PREVIEW_BYTES:
+                        stderr_prefix += chunk[:Config.OUTPUT_PREVIEW_BYTES - len(stderr_prefix)]
+                    continue
+                stdout_size += len(chunk)
+                if stdout_size > output_limit:
+                    status = "output_limit"
+                    break
+                if len(stdout_prefix) < Config.OUTPUT_PREVIEW_BYTES:
+                    stdout_prefix += chunk[:Config.OUTPUT_PREVIEW_BYTES - len(stdout_prefix)]
+                if on_stdout:
+                    on_stdout(chunk)
+            if status == "ok" and memory_exceeded():
+                status = "memory_limit"
+
+        # 輸出結束後等待程式結束，並持續檢查時間與記憶體
+        delay = 0.001
+        while status == "ok":
+            pid, wait_status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                process.returncode = os.waitstatus_to_exitcode(wait_status)
+                break
+            usage = None
+            if time.monotonic() >= deadline:
+                status = "timeout"
+            elif memory_exceeded():
+                status = "memory_limit"
+            else:
+                time.sleep(delay)
+                delay = min(delay * 2, Config.MEMORY_POLL_INTERVAL)
+    finally:
+        if usage is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            _, wait_status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(wait_status)
+        selector.close()
+        for pipe in (stdin_file, stdin_pipe, process.stdout, process.stderr):
+            if pipe:
+                pipe.close()
+        oom_killed = slot.oom_killed()
+        slot.release()
+        metrics.inc("judge_runs_in_flight", {"lang": lang}, -1)
+
+    wall_time = time.monotonic() - start_time
+    cpu_time = max(0.0, usage.ru_utime + usage.ru_stime - startup_cpu)
+    # ru_maxrss 未超過 fork 時的 RSS 時只能當作上限，改用執行期間取樣到的 VmHWM 判斷
+    peak_bound = usage.ru_maxrss * 1024
+    peak_exact = peak_bound > fork_rss
+    peak_rss = peak_bound if peak_exact else sampled_peak
+    stderr = stderr_prefix.decode('utf-8', errors='replace')
+
+    if status == "ok":
+        if cpu_time > time_limit or process.returncode == -signal.SIGXCPU:
+            status = "timeout"
+        elif peak_rss > memory_cap or oom_killed or (
+                process.returncode != 0 and any(msg in stderr for msg in OUT_OF_MEMORY_MESSAGES)):
+            status = "memory_limit"
+
+    return {
+        "status": status,
+        "returncode": process.returncode,
+        "cpu_time": cpu_time,
+        "wall_time": wall_time,
+        "peak_rss": peak_rss,
+        "peak_rss_exact": peak_exact,
+        "peak_rss_bound": peak_bound,
+        "runner": "warm" if warm_runner else "cold",
+        "startup_cpu_time": startup_cpu,
+        "cpu": slot.cpu,
+        "isolation": slot.isolation,
+        "stdout": stdout_prefix.decode('utf-8', errors='replace'),
+        "stdout_size": stdout_size,
+        "stderr": stderr,
+    }
+
+# 監控指標 (Prometheus 文字格式)
+# 每個 gunicorn worker 在記憶體中累計指標，定期寫成 METRICS_DIR 下的快照檔；
+# /metrics 合併所有快照：counter 與 histogram 加總，gauge 只計入仍在更新的行程。
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 名稱: (類型, 說明, histogram 的 bucket 上界)
+METRIC_DEFINITIONS = {
+    "judge_compile_seconds": ("histogram", "Compile time per submission", LATENCY_BUCKETS),
+    "judge_case_run_seconds": ("histogram", "Wall time per test case run", LATENCY_BUCKETS),
+    "judge_request_seconds": ("histogram", "End-to-end judge latency from enqueue to result", LATENCY_BUCKETS),
+    "judge_queue_wait_seconds": ("histogram", "Time a judge job waited in the queue", LATENCY_BUCKETS),
+    "judge_verdicts_total": ("counter", "Test case verdicts", None),
+    "judge_timeouts_total": ("counter", "Test cases that exceeded the time limit", None),
+    "judge_cache_total": ("counter", "Build artifact cache lookups", None),
+    "judge_verdict_cache_total": ("counter", "Submission verdict cache lookups", None),
+    "judge_case_results_reused_total": ("counter", "Test case results reused from earlier runs", None),
+    "judge_runs_in_flight": ("gauge", "Test case runs currently executing", None),
+    "judge_cpu_slot_wait_seconds": ("histogram", "Time a run waited for a free CPU slot", LATENCY_BUCKETS),
+}
+
+def metric_key(name: str, labels: Optional[Dict[str, str]]) -> Tuple[str, Tuple]:
+    return name, tuple(sorted((labels or {}).items()))
+
+class MetricsRegistry:
+    """本行程的指標 (以鎖保護的 dict，記錄成本只有一次字典更新)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], Dict] = {}
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1) -> None:
+        """counter 累加，或 gauge 增減"""
+        key = metric_key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        buckets = METRIC_DEFINITIONS[name][2]
+        index = bisect.bisect_left(buckets, value)
+        key = metric_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"counts": [0] * (len(buckets) + 1), "sum": 0.0}
+            histogram["counts"][index] += 1
+            histogram["sum"] += value
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "values": [[name, dict(labels), value] for (name, labels), value in self._values.items()],
+                "histograms": [[name, dict(labels), copy.deepcopy(histogram)]
+                               for (name, labels), histogram in self._histograms.items()],
+            }
+
+metrics = MetricsRegistry()
+
+def metrics_snapshot_path() -> str:
+    return os.path.join(Config.METRICS_DIR, f"{WORKER_ID.replace(':', '-')}.json")
+
+def flush_metrics() -> None:
+    """將本行程的指標寫成快照檔"""
+    try:
+        write_json_atomic(metrics_snapshot_path(), {"updated_at": time.time(), **metrics.snapshot()})
+    except OSError as e:
+        logger.error(f"寫入指標快照失敗: {e}")
+
+def metrics_flush_loop() -> None:
+    """背景執行緒：定期寫入指標快照"""
+    while True:
+        flush_metrics()
+        time.sleep(Config.METRICS_FLUSH_INTERVAL)
+
+def collect_metrics() -> Tuple[Dict, Dict]:
+    """合併所有 worker 的快照，回傳 (counter/gauge 值, histogram)"""
+    now = time.time()
+    values: Dict[Tuple[str, Tuple], float] = {}
+    histograms: Dict[Tuple[str, Tuple], Dict] = {}
+    for entry in os.scandir(Config.METRICS_DIR):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            with open(entry.path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        age = now - snapshot.get("updated_at", 0)
+        if age > Config.METRICS_RETENTION_SECONDS:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+            continue
+        for name, labels, value in snapshot["values"]:
+            if METRIC_DEFINITIONS.get(name, ("",))[0] == "gauge" and age > Config.METRICS_STALE_SECONDS:
+                continue
+            key = metric_key(name, labels)
+            values[key] = values.get(key, 0) + value
+        for name, labels, histogram in snapshot["histograms"]:
+            key = metric_key(name, labels)
+            merged = histograms.setdefault(key, {"counts": [0] * len(histogram["counts"]), "sum": 0.0})
+            merged["counts"] = [a + b for a, b in zip(merged["counts"], histogram["counts"])]
+            merged["sum"] += histogram["sum"]
+    return values, histograms
+
+def format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in pairs) + "}"
+
+def render_metrics(values: Dict, histograms: Dict, gauges: Dict[str, Tuple[str, float]]) -> str:
+    """輸出 Prometheus 文字格式"""
+    lines = []
+    for name, (kind, help_text, buckets) in METRIC_DEFINITIONS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for (metric_name, labels), histogram in sorted(histograms.items()):
+                if metric_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ["+Inf"], histogram["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels, (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        else:
+            for (metric_name, labels), value in sorted(values.items()):
+                if metric_name == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+    for name, (help_text, value) in gauges.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+def get_parallel_workers(case_count: int) -> int:
+    """計算可同時執行的測試案例數
+
+    上限為計時執行專用的核心數；每次執行仍會獨占一顆核心，多個 worker 同時評判時依序等待。
+    """
+    cpu_count = len(run_cpus)
+    configured = get_setting("max_parallel_runs") or cpu_count
+    return max(1, min(configured, cpu_count, case_count))
+
+def format_memory(run: Dict) -> str:
+    """顯示 peak RSS；無法精確量測時 (低於 fork 時的 RSS) 以 ≤ 表示上限"""
+    if run["peak_rss_exact"]:
+        return f"{run['peak_rss'] / 1024 / 1024:.1f}MB"
+    return f"≤{run['peak_rss_bound'] / 1024 / 1024:.1f}MB"
+
+def judge_testcase(lang: str, input_file: str, work_dir: str, testcase_dir: str) -> Tuple[Dict, bool]:
+    """執行並比對單一測試案例，回傳 (結果, 是否通過)"""
+    output_file = input_file.replace(".in", ".out")
+    input_path = os.path.join(testcase_dir, input_file)
+    output_path = os.path.join(testcase_dir, output_file)
+
+    try:
+        has_expected = os.path.exists(output_path)
+        comparator = StreamingComparator(output_path) if has_expected else None
+
+        # 執行程式碼並逐段比對輸出
+        try:
+            run = run_program(lang, input_path, work_dir, comparator.feed if comparator else None)
+            output_matched = comparator.finish() if comparator else False
+        finally:
+            if comparator:
+                comparator.close()
+
+        # 讀取預期輸出 (只保留前綴供顯示)
+        expected_output = ""
+        if has_expected:
+            expected_output, _ = read_prefix(output_path, Config.OUTPUT_PREVIEW_BYTES)
+
+        user_output = sanitize_output(run["stdout"])
+        exec_time = f"{run['cpu_time']:.3f}s"
+        success = False
+        if run["status"] == "timeout":
+            time_limit = get_setting("execution_time_limit")
+            user_output = f"執行時間過長 (超過{time_limit}秒)"
+            exec_time = f">{time_limit}s"
+            verdict = "TLE"
+        elif run["status"] == "memory_limit":
+            user_output = f"{user_output}\n記憶體超過限制 (超過{get_setting('memory_limit')}MB)"
+            verdict = "MLE"
+        elif run["status"] == "output_limit":
+            user_output = f"{user_output}\n輸出超過限制 (超過{get_setting('output_limit')}MB)"
+            verdict = "OLE"
+        elif run["returncode"] != 0:
+            user_output = f"{user_output}\n執行錯誤: {sanitize_output(run['stderr'])}"
+            verdict = "RE"
+        else:
+            success = True
+            verdict = ("AC" if output_matched else "WA") if has_expected else "NO_EXPECTED"
+
+        metrics.observe("judge_case_run_seconds", run["wall_time"], {"lang": lang, "verdict": verdict})
+        metrics.inc("judge_verdicts_total", {"lang": lang, "verdict": verdict})
+        if verdict == "TLE":
+            metrics.inc("judge_timeouts_total", {"lang": lang})
+
+        # 比對輸出
+        passed = False
+        if success and has_expected and output_matched:
+            comparison_result = "通過 ✅"
+            passed = True
+        elif verdict == "OLE":
+            comparison_result = "輸出超過限制 ❌"
+        elif verdict == "MLE":
+            comparison_result = "記憶體超過限制 ❌"
+        elif not has_expected:
+            comparison_result = "無預期輸出 ⚠️"
+        else:
+            comparison_result = "未通過 ❌"
+
+        return {
+            "user_output": user_output,
+            "expected_output": expected_output,
+            "comparison_result": comparison_result,
+            "verdict": verdict,
+            "execution_time": exec_time,
+            "cpu_time": f"{run['cpu_time']:.3f}s",
+            "wall_time": f"{run['wall_time']:.3f}s",
+            "runner": run["runner"],
+            "cpu": run["cpu"],
+            "isolation": run["isolation"],
+            "startup_cpu_time": f"{run['startup_cpu_time']:.3f}s",
+            "memory": format_memory(run),
+            "output_size": run["stdout_size"],
+            "output_truncated": run["stdout_size"] > Config.OUTPUT_PREVIEW_BYTES,
+            "has_expected": has_expected
+        }, passed
+
+    except Exception as e:
+        logger.error(f"處理測試案例 {input_file} 失敗: {e}")
+        return {
+            "user_output": f"處理錯誤: {str(e)}",
+            "expected_output": "",
+            "comparison_result": "錯誤 ❌",
+            "verdict": "ERROR",
+            "execution_time": "0s",
+            "has_expected": False
+        }, False
+
+def is_case_failure(case_result: Dict, passed: bool) -> bool:
+    """是否為答案錯誤、執行錯誤或超時 (沒有預期輸出的案例不算失敗)"""
+    return not passed and case_result.get("has_expected", False)
+
+def skipped_case_result(input_file: str, testcase_dir: str) -> Dict:
+    """fail-fast 停止後未執行的測試案例"""
+    output_path = os.path.join(testcase_dir, input_file.replace(".in", ".out"))
+    return {
+        "user_output": "",
+        "expected_output": "",
+        "comparison_result": "略過 ⏭️",
+        "verdict": "SKIPPED",
+        "execution_time": "-",
+        "has_expected": os.path.exists(output_path)
+    }
+
+def parse_execution_time(execution_time: str) -> float:
+    """將 "0.123s" 或 ">5s" 格式的執行時間轉為秒數"""
+    try:
+        return float(execution_time.lstrip(">").rstrip("s"))
+    except (AttributeError, ValueError):
+        return 0.0
+
+def order_testcases(inputs: List[str], hashes: Dict[str, str]) -> List[str]:
+    """依歷史統計排序測試案例 (統計以輸入內容雜湊為鍵，替換內容後重新累計)
+
+    以 平均執行時間 / 失敗機率 由小到大排序，使預期最快找到失敗的案例先執行。
+    失敗機率使用拉普拉斯平滑，沒有紀錄的案例視為執行時間 0，會最先執行。
+    """
+    stats = load_case_stats([hashes[f] for f in inputs if f in hashes])
+
+    def priority(input_file: str) -> Tuple[float, str]:
+        runs, failures, total_time = stats.get(hashes.get(input_file), (0, 0, 0.0))
+        avg_time = total_time / runs if runs else 0.0
+        failure_rate = (failures + 1) / (runs + 2)
+        return avg_time / failure_rate, input_file
+
+    return sorted(inputs, key=priority)
+
+def compile_error_response(message: str, lang: str, total_count: int, build_info: Dict) -> Dict:
+    """編譯失敗時的評判結果 (只回報一次，不重複於每個測試案例)"""
+    return {
+        "results": {
+            "編譯": {
+                "user_output": message,
+                "expected_output": "",
+                "comparison_result": "編譯錯誤 ❌",
+                "verdict": "CE",
+                "execution_time": "0s",
+                "has_expected": False
+            }
+        },
+        "summary": {
+            "success_count": 0,
+            "total_count": total_count,
+            "success_rate": "0.0%",
+            "language": lang,
+            "compile_error": True,
+            **build_info,
+            "timestamp": datetime.now().isoformat()
+        }
+    }
+
+def resolve_submission(code: str, lang: str) -> Tuple[str, str]:
+    """驗證提交內容並解析預設語言，回傳 (語言, 錯誤訊息)"""
+    if not code:
+        return lang, "請提供程式碼"
+
+    if lang not in Config.SUPPORTED_LANGUAGES and lang != "default":
+        return lang, f"不支援的程式語言。支援的語言: {', '.join(Config.SUPPORTED_LANGUAGES)}"
+
+    # 處理預設語言 (語言未變更時不會寫入配置檔案)
+    if lang == "default":
+        last_lang = _cached_config().get("last_lang")
+        if not last_lang:
+            return lang, "目前沒有預設語言，請先選擇一種語言"
+        lang = last_lang
+    else:
+        def set_last_lang(config: Dict) -> None:
+            config["last_lang"] = lang
+        update_config(set_last_lang)
+
+    return lang, ""
+
+def execute_judge(code: str, lang: str,
+                  on_case_result: Optional[Callable[[str, Dict], None]] = None,
+                  testset_dir: Optional[str] = None) -> Tuple[Dict, int]:
+    """評判程式碼，回傳 (回應內容, HTTP 狀態碼)
+
+    on_case_result 會在每個測試案例完成時以 (檔名, 結果) 呼叫，用於串流回報進度。
+    testset_dir 為依內容雜湊展開的測試資料目錄 (不會再變動)；未指定時展開目前的測試資料。
+    """
+    try:
+        # 獲取測試資料 (未指定版本時使用目前的測試資料)
+        testcase_dir = testset_dir or materialize_testset(publish_testset())
+        inputs = sorted(f for f in os.listdir(testcase_dir) if f.endswith(".in"))
+
+        if not inputs:
+            return {"error": "沒有可用的測試資料"}, 400
+
+        # 各測試檔的內容雜湊，作為歷史統計與測試案例結果快取的鍵
+        try:
+            hashes = load_testcase_hashes(testcase_dir)
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"讀取測試資料雜湊失敗: {e}")
+            hashes = {}
+
+        results = {}
+        success_count = 0
+
+        # 使用臨時目錄執行程式碼
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # 編譯只做一次，編譯失敗時直接回傳單一結果
+            compiled, compile_message, build_info = compile_code(code, lang, temp_dir)
+            if build_info["build_cache"] != "none":
+                metrics.inc("judge_cache_total", {"lang": lang, "result": build_info["build_cache"]})
+                metrics.observe("judge_compile_seconds", parse_execution_time(build_info["build_time"]),
+                                {"lang": lang, "cache": build_info["build_cache"]})
+            if not compiled:
+                logger.info(f"評判完成: {lang}, 編譯失敗")
+                return compile_error_response(compile_message, lang, len(inputs), build_info), 200
+
+            # fail-fast 模式下依歷史統計排序，優先執行便宜且常失敗的測試案例
+            fail_fast = bool(get_setting("fail_fast"))
+            run_order = order_testcases(inputs, hashes) if fail_fast else inputs
+
+            case_results = {}
+
+            def collect(input_file: str, outcome: Tuple[Dict, bool], executed: bool = True) -> None:
+                outcome[0]["executed"] = executed
+                case_results[input_file] = outcome
+                if on_case_result:
+                    on_case_result(input_file, outcome[0])
+
+            # 相同編譯產物、測試內容與限制已有結果的測試案例直接沿用，只執行有變動的部分
+            case_keys = case_result_keys(code, lang, inputs, hashes) if get_setting("reuse_case_results") else {}
+            stored = load_case_results(list(case_keys.values()))
+            stopped = False
+            for input_file in run_order:
+                outcome = stored.get(case_keys.get(input_file))
+                if outcome:
+                    collect(input_file, outcome, executed=False)
+                    if fail_fast and is_case_failure(*outcome):
+                        stopped = True
+                        break
+            if stored:
+                metrics.inc("judge_case_results_reused_total", {"lang": lang}, len(case_results))
+            pending_inputs = [] if stopped else [f for f in run_order if f not in case_results]
+
+            # 以有限的平行度執行各測試案例，結果仍依檔名排序回傳
+            futures = {}
+            # 執行緒池不會繼承 contextvars，以目前的 context 執行才能沿用工作的設定快照
+            context = contextvars.copy_context()
+            with ThreadPoolExecutor(max_workers=get_parallel_workers(len(pending_inputs))) as executor:
+                futures = {
+                    executor.submit(context.copy().run, judge_testcase, lang, input_file, temp_dir, testcase_dir): input_file
+                    for input_file in pending_inputs
+                }
+                for future in as_completed(futures):
+                    collect(futures[future], future.result())
+                    if fail_fast and is_case_failure(*case_results[futures[future]]):
+                        for pending in futures:
+                            pending.cancel()
+                        break
+
+            # 停止時已在執行中的測試案例仍會完成，一併納入結果
+            for future, input_file in futures.items():
+                if input_file not in case_results and future.done() and not future.cancelled():
+                    collect(input_file, future.result())
+
+            for input_file in inputs:
+                case_result, passed = case_results.get(input_file, (skipped_case_result(input_file, testcase_dir), False))
+                results[input_file] = case_result
+                if passed:
+                    success_count += 1
+
+            executed = {input_file: outcome for input_file, outcome in case_results.items() if outcome[0]["executed"]}
+            record_case_stats([
+                (hashes[input_file], parse_execution_time(case_result["execution_time"]),
+                 is_case_failure(case_result, passed))
+                for input_file, (case_result, passed) in executed.items() if input_file in hashes
+            ])
+            # 逾時與系統錯誤的執行時間不是實際量測值，不計入變異統計
+            record_timing_samples(artifact_cache_key(code, lang), [
+                (hashes[input_file], parse_execution_time(case_result["execution_time"]))
+                for input_file, (case_result, _) in executed.items()
+                if input_file in hashes and case_result.get("verdict") not in ("TLE", "ERROR")
+            ])
+            store_case_results({case_keys[input_file]: outcome for input_file, outcome in executed.items()
+                                if input_file in case_keys})
+
+        total_count = len(inputs)
+        summary = {
+            "success_count": success_count,
+            "total_count": total_count,
+            "success_rate": f"{(success_count/total_count*100):.1f}%" if total_count > 0 else "0%",
+            "language": lang,
+            "fail_fast": fail_fast,
+            "skipped_count": total_count - len(case_results),
+            "executed_count": len(executed),
+            "reused_count": len(case_results) - len(executed),
+            **build_info,
+            "timestamp": datetime.now().isoformat()
+        }
+
+        logger.info(f"評判完成: {lang}, {success_count}/{total_count} 通過")
+        return {"results": results, "summary": summary}, 200
+
+    except Exception as e:
+        logger.error(f"評判程式碼失敗: {e}")
+        return {"error": "評判失敗，請稍後再試"}, 500
+
+# 評判工作佇列
+# 工作存放於 SQLite，所有 gunicorn worker 共用；每個 worker 行程啟動固定數量的
+# 背景執行緒依 FIFO 領取工作。執行中的工作會定期更新 heartbeat，行程重啟或被
+# 終止後，逾時未更新的工作會重新排入佇列。
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+def get_job_db() -> sqlite3.Connection:
+    """開啟工作佇列資料庫 (每次呼叫建立新連線，可安全用於多執行緒)"""
+    conn = sqlite3.connect(Config.JOB_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_job_db() -> None:
+    """建立工作佇列資料表"""
+    conn = get_job_db()
+    try:
+        # WAL 讓讀取不阻塞寫入，但只能用於本機檔案系統 (見 Config.SHARED_STORE_DIR)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT UNIQUE NOT NULL,
+                status TEXT NOT NULL,
+                lang TEXT NOT NULL,
+                code TEXT NOT NULL,
+                worker TEXT,
+                heartbeat_at REAL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                status_code INTEGER,
+                result TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                testset TEXT,
+                settings TEXT,
+                cache_key TEXT,
+                priority INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # 舊版資料庫補上新增的欄位
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in (("attempts", "INTEGER NOT NULL DEFAULT 0"), ("testset", "TEXT"),
+                                   ("settings", "TEXT"), ("cache_key", "TEXT"),
+                                   ("priority", "INTEGER NOT NULL DEFAULT 0")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq)")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, seq)")
+        # 批次評判：每個提交對應一個工作 (相同程式碼共用同一個工作)，done_order 為完成順序
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS batches (
+                id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                testset TEXT NOT NULL,
+                cases TEXT NOT NULL,
+                total INTEGER NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS batch_items (
+                batch_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                submission_id TEXT NOT NULL,
+                lang TEXT NOT NULL,
+                job_id TEXT NOT NULL,
+                done_order INTEGER,
+                PRIMARY KEY (batch_id, position)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS batch_items_job ON batch_items (job_id)")
+        # 舊版在查詢批次時才編上完成順序，補上已完成但尚未編號的提交
+        conn.execute("BEGIN IMMEDIATE")
+        assign_batch_done_order(conn, [row["job_id"] for row in conn.execute(
+            "SELECT DISTINCT b.job_id FROM batch_items b JOIN jobs j ON j.id = b.job_id "
+            "WHERE b.done_order IS NULL AND j.status = 'done'"
+        ).fetchall()])
+        conn.execute("COMMIT")
+        # 相同提交 (語言、程式碼、測試資料版本、相關限制) 的評判結果
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS verdict_cache (
+                key TEXT PRIMARY KEY,
+                status_code INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+        """)
+        # 單一測試案例的結果 (編譯產物、測試內容雜湊與執行限制相同時可以沿用)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS case_result_cache (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                passed INTEGER NOT NULL,
+                used_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS case_result_cache_used ON case_result_cache (used_at)")
+        # 已發布到共用儲存的測試資料版本 (內容雜湊 -> 檔名與各檔案的 SHA-256)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS testsets (
+                digest TEXT PRIMARY KEY,
+                files TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        # 已完成的單一測試案例結果，供串流介面逐筆讀取
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_cases (
+                cursor INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                result TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS job_cases_job ON job_cases (job_id, cursor)")
+        # 各測試輸入 (以內容雜湊為鍵) 的歷史執行時間與失敗次數，供 fail-fast 排序使用
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(case_stats)")}
+        if columns and "input_hash" not in columns:
+            # 舊版以測試案例名稱為鍵，替換內容後仍沿用舊統計；統計只影響排序，直接重建
+            conn.execute("DROP TABLE case_stats")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS case_stats (
+                input_hash TEXT PRIMARY KEY,
+                runs INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                total_time REAL NOT NULL DEFAULT 0,
+                total_time_sq REAL NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS case_stats_updated ON case_stats (updated_at)")
+        # 同一編譯產物在同一測試輸入上的執行時間，用來觀察計時的穩定度 (不混入不同提交)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS timing_samples (
+                artifact TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                runs INTEGER NOT NULL DEFAULT 0,
+                total_time REAL NOT NULL DEFAULT 0,
+                total_time_sq REAL NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (artifact, input_hash)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS timing_samples_updated ON timing_samples (updated_at)")
+        # 各語言實際編譯 (未命中編譯快取) 的次數與總時間，依編譯器層級加速方式分開統計
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS build_stats (
+                lang TEXT NOT NULL,
+                toolchain_cache TEXT NOT NULL,
+                builds INTEGER NOT NULL DEFAULT 0,
+                total_time REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (lang, toolchain_cache)
+            )
+        """)
+    finally:
+        conn.close()
+
+# 影響評判結果的設定，納入評判結果快取的鍵
+VERDICT_CACHE_SETTINGS = ["execution_time_limit", "memory_limit", "compile_time_limit", "output_limit", "fail_fast"]
+
+def verdict_cache_key(code: str, lang: str, testset: str, settings: Dict) -> str:
+    """以語言、程式碼雜湊、測試資料內容版本與相關限制計算評判結果快取的鍵
+
+    上傳、匯入、刪除測試資料會改變內容版本，修改限制會改變設定部分，因此舊的結果
+    不會再被命中，不需要額外清除。
+    """
+    digest = hashlib.sha256()
+    limits = {key: settings.get(key, DEFAULT_SETTINGS[key]) for key in VERDICT_CACHE_SETTINGS}
+    for part in (lang, hashlib.sha256(code.encode('utf-8')).hexdigest(), testset, json.dumps(limits, sort_keys=True)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def lookup_verdict_cache(conn: sqlite3.Connection, key: str) -> Optional[Tuple[Dict, int]]:
+    """查詢評判結果快取，命中時回傳 (回應內容, HTTP 狀態碼)，並標記為快取結果"""
+    row = conn.execute("SELECT status_code, result, created_at FROM verdict_cache WHERE key = ?", (key,)).fetchone()
+    if not row:
+        return None
+    conn.execute("UPDATE verdict_cache SET used_at = ? WHERE key = ?", (time.time(), key))
+    body = json.loads(row["result"])
+    body["summary"]["cached"] = True
+    body["summary"]["cached_at"] = datetime.fromtimestamp(row["created_at"]).isoformat()
+    return body, row["status_code"]
+
+def store_verdict_cache(key: str, body: Dict, status_code: int) -> None:
+    """寫入評判結果快取
+
+    只快取可重現的結果：評判失敗、編譯逾時或編譯時的系統錯誤，以及有測試案例發生系統錯誤或
+    逾時 (可能受機器負載影響) 的結果不快取。
+    """
+    if status_code != 200 or "summary" not in body or body["summary"].get("retryable"):
+        return
+    if any(result.get("verdict") in ("ERROR", "TLE") for result in body.get("results", {}).values()):
+        return
+    now = time.time()
+    try:
+        conn = get_job_db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO verdict_cache (key, status_code, result, created_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                (key, status_code, json.dumps(body, ensure_ascii=False), now, now)
+            )
+            conn.execute(
+                "DELETE FROM verdict_cache WHERE key NOT IN (SELECT key FROM verdict_cache ORDER BY used_at DESC LIMIT ?)",
+                (Config.VERDICT_CACHE_MAX_ENTRIES,)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"寫入評判結果快取失敗: {e}")
+
+def insert_job(conn: sqlite3.Connection, code: str, lang: str, testset: str, settings: Dict,
+               priority: int = 0, queue_full: bool = False) -> Tuple[str, bool]:
+    """在目前的交易中建立評判工作，回傳 (工作 ID, 是否命中評判結果快取)
+
+    相同提交已有評判結果時直接建立已完成的工作並附上快取的結果；未命中且 queue_full
+    時不建立工作，工作 ID 為空字串。
+    """
+    cache_key = verdict_cache_key(code, lang, testset, settings)
+    settings_json = json.dumps(settings, ensure_ascii=False)
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    cached = lookup_verdict_cache(conn, cache_key)
+    metrics.inc("judge_verdict_cache_total", {"lang": lang, "result": "hit" if cached else "miss"})
+    if cached:
+        conn.execute(
+            "INSERT INTO jobs (id, status, lang, code, created_at, started_at, finished_at, status_code, result, "
+            "testset, settings, cache_key, priority) VALUES (?, 'done', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, lang, code, now, now, now, cached[1], json.dumps(cached[0], ensure_ascii=False),
+             testset, settings_json, cache_key, priority)
+        )
+        return job_id, True
+    if queue_full:
+        return "", False
+    conn.execute(
+        "INSERT INTO jobs (id, status, lang, code, created_at, testset, settings, cache_key, priority) "
+        "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+        (job_id, lang, code, now, testset, settings_json, cache_key, priority)
+    )
+    return job_id, False
+
+def enqueue_job(code: str, lang: str) -> Tuple[str, int]:
+    """加入評判工作，回傳 (工作 ID, 排隊位置)；佇列已滿時工作 ID 為空字串
+
+    工作記錄提交當下的測試資料版本與設定，任何 worker 行程都能以相同條件評判。
+    相同提交已有評判結果時，直接建立已完成的工作並附上快取的結果 (排隊位置為 0)。
+    """
+    testset = publish_testset()
+    settings = _cached_config().get("settings", {})
+    conn = get_job_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND priority >= 0").fetchone()[0]
+        job_id, cached = insert_job(conn, code, lang, testset, settings,
+                                    queue_full=queued >= Config.JOB_QUEUE_MAX_DEPTH)
+        if not job_id:
+            conn.execute("ROLLBACK")
+            return "", queued
+        conn.execute("COMMIT")
+        return job_id, 0 if cached else queued + 1
+    finally:
+        conn.close()
+
+def claim_next_job() -> Optional[sqlite3.Row]:
+    """依優先順序與 FIFO 領取下一個工作，並將失去 heartbeat 的工作重新排入佇列"""
+    conn = get_job_db()
+    try:
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        # 租約過期的工作重新排隊；已重試太多次的工作直接以錯誤結束，避免讓 worker 反覆當機
+        abandoned = [row["id"] for row in conn.execute(
+            "SELECT id FROM jobs WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+            (now - Config.JOB_LEASE_SECONDS, Config.JOB_MAX_ATTEMPTS)
+        )]
+        conn.executemany(
+            "UPDATE jobs SET status = 'done', finished_at = ?, status_code = 500, result = ? WHERE id = ?",
+            [(now, json.dumps({"error": "評判工作多次中斷，已停止重試"}, ensure_ascii=False), job_id)
+             for job_id in abandoned]
+        )
+        assign_batch_done_order(conn, abandoned)
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat_at < ?",
+            (now - Config.JOB_LEASE_SECONDS,)
+        )
+        # 批次評判的工作保留到批次過期為止，供下載結果
+        conn.execute("DELETE FROM batches WHERE created_at < ?", (now - Config.BATCH_RETENTION_SECONDS,))
+        conn.execute("DELETE FROM batch_items WHERE batch_id NOT IN (SELECT id FROM batches)")
+        conn.execute(
+            "DELETE FROM jobs WHERE status = 'done' AND finished_at < ? AND id NOT IN (SELECT job_id FROM batch_items)",
+            (now - Config.JOB_RETENTION_SECONDS,)
+        )
+        conn.execute("DELETE FROM job_cases WHERE job_id NOT IN (SELECT id FROM jobs)")
+        job = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, seq LIMIT 1"
+        ).fetchone()
+        if job:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, heartbeat_at = ?, started_at = ?, "
+                "attempts = attempts + 1 WHERE seq = ?",
+                (WORKER_ID, now, now, job["seq"])
+            )
+            # 重新排隊的工作從頭執行，捨棄先前的部分結果
+            conn.execute("DELETE FROM job_cases WHERE job_id = ?", (job["id"],))
+        conn.execute("COMMIT")
+        return job
+    finally:
+        conn.close()
+
+def finish_job(job_id: str, body: Dict, status_code: int) -> None:
+    """寫入工作結果，並在同一個交易中為所屬批次的提交編上完成順序"""
+    conn = get_job_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, status_code = ?, result = ? WHERE id = ?",
+            (time.time(), status_code, json.dumps(body, ensure_ascii=False), job_id)
+        )
+        assign_batch_done_order(conn, [job_id])
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def record_case_result(job_id: str, name: str, result: Dict) -> None:
+    """寫入單一測試案例結果"""
+    try:
+        conn = get_job_db()
+        try:
+            conn.execute(
+                "INSERT INTO job_cases (job_id, name, result) VALUES (?, ?, ?)",
+                (job_id, name, json.dumps(result, ensure_ascii=False))
+            )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"寫入測試案例結果失敗 {job_id}/{name}: {e}")
+
+def get_case_results(job_id: str, after: int) -> List[sqlite3.Row]:
+    """讀取 cursor 之後完成的測試案例結果"""
+    conn = get_job_db()
+    try:
+        return conn.execute(
+            "SELECT cursor, name, result FROM job_cases WHERE job_id = ? AND cursor > ? ORDER BY cursor",
+            (job_id, after)
+        ).fetchall()
+    finally:
+        conn.close()
+
+def get_recorded_case_names(job_id: str) -> set:
+    """已逐筆回報過的測試案例名稱"""
+    conn = get_job_db()
+    try:
+        rows = conn.execute("SELECT name FROM job_cases WHERE job_id = ?", (job_id,)).fetchall()
+        return {row["name"] for row in rows}
+    finally:
+        conn.close()
+
+def load_case_stats(input_hashes: List[str]) -> Dict[str, Tuple[int, int, float]]:
+    """讀取測試輸入的歷史統計，回傳 {輸入雜湊: (執行次數, 失敗次數, 總執行時間)}"""
+    stats = {}
+    try:
+        conn = get_job_db()
+        try:
+            for start in range(0, len(input_hashes), 500):
+                batch = input_hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for row in conn.execute(
+                    f"SELECT input_hash, runs, failures, total_time FROM case_stats WHERE input_hash IN ({placeholders})",
+                    batch
+                ):
+                    stats[row["input_hash"]] = (row["runs"], row["failures"], row["total_time"])
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"讀取測試案例統計失敗: {e}")
+        return {}
+    return stats
+
+def record_case_stats(entries: List[Tuple[str, float, bool]]) -> None:
+    """累加測試輸入 (內容雜湊) 的執行時間與失敗次數，超過上限時淘汰最久未執行的項目"""
+    if not entries:
+        return
+    now = time.time()
+    try:
+        conn = get_job_db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                """
+                INSERT INTO case_stats (input_hash, runs, failures, total_time, total_time_sq, updated_at)
+                VALUES (?, 1, ?, ?, ?, ?)
+                ON CONFLICT(input_hash) DO UPDATE SET
+                    runs = runs + 1,
+                    failures = failures + excluded.failures,
+                    total_time = total_time + excluded.total_time,
+                    total_time_sq = total_time_sq + excluded.total_time_sq,
+                    updated_at = excluded.updated_at
+                """,
+                [(input_hash, int(failed), exec_time, exec_time * exec_time, now)
+                 for input_hash, exec_time, failed in entries]
+            )
+            conn.execute(
+                "DELETE FROM case_stats WHERE updated_at < (SELECT updated_at FROM case_stats "
+                "ORDER BY updated_at DESC LIMIT 1 OFFSET ?)",
+                (Config.CASE_STATS_MAX_ENTRIES,)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"寫入測試案例統計失敗: {e}")
+
+# 影響單一測試案例結果的設定，納入測試案例結果快取的鍵
+CASE_RESULT_SETTINGS = ["execution_time_limit", "memory_limit", "output_limit"]
+
+def load_testcase_hashes(testset_dir: Optional[str]) -> Dict[str, str]:
+    """取得各測試檔案的 SHA-256，回傳 {檔名: 雜湊}
+
+    testset_dir 為依內容雜湊展開的目錄時，從共用儲存登記的版本讀取；否則使用測試案例索引。
+    """
+    if testset_dir is None:
+        hashes = {}
+        for name, entry in get_manifest()["testcases"].items():
+            for kind, ext in (("input", ".in"), ("output", ".out")):
+                if entry.get(kind):
+                    hashes[name + ext] = entry[kind]["sha256"]
+        return hashes
+    conn = get_job_db()
+    try:
+        row = conn.execute("SELECT files FROM testsets WHERE digest = ?", (os.path.basename(testset_dir),)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row["files"]) if row else {}
+
+def case_result_keys(code: str, lang: str, inputs: List[str], hashes: Dict[str, str]) -> Dict[str, str]:
+    """計算各測試案例結果快取的鍵，回傳 {輸入檔名: 鍵}
+
+    鍵由編譯產物、執行指令、輸入與預期輸出的內容雜湊 (hashes 為 {檔名: 雜湊}) 以及執行限制
+    組成；檔名不影響結果，重新命名的測試案例也能沿用。沒有內容雜湊的測試案例不會出現在結果中。
+    """
+    prefix = json.dumps([
+        artifact_cache_key(code, lang),
+        LANGUAGE_CONFIG[lang]['run_cmd'],
+        {key: get_setting(key) for key in CASE_RESULT_SETTINGS},
+    ], sort_keys=True)
+    keys = {}
+    for input_file in inputs:
+        input_hash = hashes.get(input_file)
+        if not input_hash:
+            continue
+        output_hash = hashes.get(input_file.replace(".in", ".out"), "")
+        keys[input_file] = hashlib.sha256(f"{prefix}\0{input_hash}\0{output_hash}".encode('utf-8')).hexdigest()
+    return keys
+
+def load_case_results(keys: List[str]) -> Dict[str, Tuple[Dict, bool]]:
+    """讀取已儲存的測試案例結果，回傳 {鍵: (結果, 是否通過)}"""
+    if not keys:
+        return {}
+    stored = {}
+    try:
+        conn = get_job_db()
+        try:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for row in conn.execute(
+                    f"SELECT key, result, passed FROM case_result_cache WHERE key IN ({placeholders})", batch
+                ):
+                    stored[row["key"]] = (json.loads(row["result"]), bool(row["passed"]))
+            if stored:
+                conn.executemany("UPDATE case_result_cache SET used_at = ? WHERE key = ?",
+                                 [(time.time(), key) for key in stored])
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"讀取測試案例結果快取失敗: {e}")
+        return {}
+    return stored
+
+def store_case_results(outcomes: Dict[str, Tuple[Dict, bool]]) -> None:
+    """儲存實際執行的測試案例結果
+
+    發生系統錯誤或逾時 (可能受機器負載影響) 的結果不儲存，重新評判時會再執行一次。
+    """
+    now = time.time()
+    rows = [
+        (key, json.dumps({k: v for k, v in result.items() if k != "executed"}, ensure_ascii=False), int(passed), now)
+        for key, (result, passed) in outcomes.items() if result.get("verdict") not in ("ERROR", "TLE")
+    ]
+    if not rows:
+        return
+    try:
+        conn = get_job_db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR REPLACE INTO case_result_cache (key, result, passed, used_at) VALUES (?, ?, ?, ?)", rows
+            )
+            conn.execute(
+                "DELETE FROM case_result_cache WHERE used_at < (SELECT used_at FROM case_result_cache "
+                "ORDER BY used_at DESC LIMIT 1 OFFSET ?)",
+                (Config.CASE_RESULT_CACHE_MAX_ENTRIES,)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"寫入測試案例結果快取失敗: {e}")
+
+def record_timing_samples(artifact: str, entries: List[Tuple[str, float]]) -> None:
+    """累加編譯產物在各測試輸入 (內容雜湊) 上的執行時間，超過上限時淘汰最久未執行的項目"""
+    if not entries:
+        return
+    now = time.time()
+    try:
+        conn = get_job_db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                """
+                INSERT INTO timing_samples (artifact, input_hash, runs, total_time, total_time_sq, updated_at)
+                VALUES (?, ?, 1, ?, ?, ?)
+                ON CONFLICT(artifact, input_hash) DO UPDATE SET
+                    runs = runs + 1,
+                    total_time = total_time + excluded.total_time,
+                    total_time_sq = total_time_sq + excluded.total_time_sq,
+                    updated_at = excluded.updated_at
+                """,
+                [(artifact, input_hash, exec_time, exec_time * exec_time, now) for input_hash, exec_time in entries]
+            )
+            conn.execute(
+                "DELETE FROM timing_samples WHERE updated_at < (SELECT updated_at FROM timing_samples "
+                "ORDER BY updated_at DESC LIMIT 1 OFFSET ?)",
+                (Config.TIMING_SAMPLES_MAX_ENTRIES,)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"寫入執行時間統計失敗: {e}")
+
+def load_timing_stats(hashes: Dict[str, str], limit: int = 10) -> Dict:
+    """統計同一程式重複執行同一測試案例時執行時間的變異程度
+
+    hashes 為 {輸入檔名: 內容雜湊}。樣本以編譯產物 + 測試輸入分組，不同提交的執行時間
+    不會混在一起。回傳平均與最大的變異係數，以及變異最大的幾組。
+    """
+    names = {}
+    for name, input_hash in hashes.items():
+        names.setdefault(input_hash, name)
+    try:
+        conn = get_job_db()
+        try:
+            rows = conn.execute(
+                "SELECT artifact, input_hash, runs, total_time, total_time_sq FROM timing_samples WHERE runs > 1"
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"讀取執行時間統計失敗: {e}")
+        return {}
+    cases = []
+    for row in rows:
+        if row["input_hash"] not in names:
+            continue
+        mean = row["total_time"] / row["runs"]
+        variance = max(0.0, row["total_time_sq"] / row["runs"] - mean * mean)
+        stddev = math.sqrt(variance)
+        cases.append({
+            "name": names[row["input_hash"]],
+            "artifact": row["artifact"][:12],
+            "runs": row["runs"],
+            "mean_time": f"{mean:.3f}s",
+            "stddev": f"{stddev:.3f}s",
+            "cv": round(stddev / mean, 3) if mean > 0 else 0.0,
+        })
+    cases.sort(key=lambda case: case["cv"], reverse=True)
+    return {
+        "run_cpus": run_cpus,
+        "isolation": "cgroup" if get_cgroup_root() else "affinity",
+        "cases": len(cases),
+        "mean_cv": round(sum(case["cv"] for case in cases) / len(cases), 3) if cases else 0.0,
+        "max_cv": cases[0]["cv"] if cases else 0.0,
+        "most_variable": cases[:limit],
+    }
+
+def record_build_stats(lang: str, toolchain_cache: str, build_time: float) -> None:
+    """累加實際編譯的次數與時間"""
+    try:
+        conn = get_job_db()
+        try:
+            conn.execute(
+                """
+                INSERT INTO build_stats (lang, toolchain_cache, builds, total_time) VALUES (?, ?, 1, ?)
+                ON CONFLICT(lang, toolchain_cache) DO UPDATE SET
+                    builds = builds + 1,
+                    total_time = total_time + excluded.total_time
+                """,
+                (lang, toolchain_cache, build_time)
+            )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"寫入編譯統計失敗: {e}")
+
+def load_build_stats() -> Dict[str, Dict[str, Dict]]:
+    """讀取編譯統計，回傳 {語言: {加速方式: {builds, average_time}}}"""
+    try:
+        conn = get_job_db()
+        try:
+            rows = conn.execute("SELECT lang, toolchain_cache, builds, total_time FROM build_stats").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"讀取編譯統計失敗: {e}")
+        return {}
+    stats: Dict[str, Dict[str, Dict]] = {}
+    for row in rows:
+        stats.setdefault(row["lang"], {})[row["toolchain_cache"]] = {
+            "builds": row["builds"],
+            "average_time": f"{row['total_time'] / row['builds']:.3f}s"
+        }
+    return stats
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """查詢工作狀態，排隊中的工作會附上排隊位置"""
+    conn = get_job_db()
+    try:
+        job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not job:
+            return None
+        info = {
+            "job_id": job["id"],
+            "status": job["status"],
+            "language": job["lang"],
+            "created_at": datetime.fromtimestamp(job["created_at"]).isoformat(),
+            "started_at": datetime.fromtimestamp(job["started_at"]).isoformat() if job["started_at"] else None,
+            "finished_at": datetime.fromtimestamp(job["finished_at"]).isoformat() if job["finished_at"] else None,
+        }
+        if job["status"] == "queued":
+            info["position"] = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority > ? OR (priority = ? AND seq <= ?))",
+                (job["priority"], job["priority"], job["seq"])
+            ).fetchone()[0]
+        if job["status"] == "done":
+            info["status_code"] = job["status_code"]
+            info["result"] = json.loads(job["result"])
+        return info
+    finally:
+        conn.close()
+
+# 批次評判
+# 一次提交多份程式 (例如期末評分)：共用同一份測試資料版本與設定快照，相同語言與程式碼的
+# 提交只建立一個工作，已有評判結果的直接沿用；工作排在互動提交之後，由所有 worker 執行。
+# 結果以精簡的分數矩陣回傳 (每個提交一列，每個測試案例一個判定)。
+
+def enqueue_batch(submissions: List[Dict]) -> Tuple[str, int, int]:
+    """建立批次評判，回傳 (批次 ID, 實際建立的工作數, 命中評判結果快取的工作數)
+
+    submissions 為已驗證的 {"id", "lang", "code"}，不會更新預設語言。所有批次排隊中的
+    工作會超過 BATCH_QUEUE_MAX_JOBS 時不建立批次，批次 ID 為空字串。
+    """
+    testset = publish_testset()
+    settings = _cached_config().get("settings", {})
+    conn = get_job_db()
+    try:
+        row = conn.execute("SELECT files FROM testsets WHERE digest = ?", (testset,)).fetchone()
+        cases = sorted(name for name in json.loads(row["files"]) if name.endswith(".in")) if row else []
+        batch_id = uuid.uuid4().hex
+        jobs = {}
+        cached_count = 0
+        conn.execute("BEGIN IMMEDIATE")
+        queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND priority < 0").fetchone()[0]
+        conn.execute(
+            "INSERT INTO batches (id, created_at, testset, cases, total) VALUES (?, ?, ?, ?, ?)",
+            (batch_id, time.time(), testset, json.dumps(cases, ensure_ascii=False), len(submissions))
+        )
+        for position, submission in enumerate(submissions):
+            source = (submission["lang"], submission["code"])
+            if source not in jobs:
+                jobs[source], cached = insert_job(conn, submission["code"], submission["lang"], testset, settings,
+                                                  priority=Config.BATCH_JOB_PRIORITY,
+                                                  queue_full=queued >= Config.BATCH_QUEUE_MAX_JOBS)
+                if not jobs[source]:
+                    conn.execute("ROLLBACK")
+                    return "", 0, 0
+                cached_count += cached
+                queued += not cached
+            conn.execute(
+                "INSERT INTO batch_items (batch_id, position, submission_id, lang, job_id) VALUES (?, ?, ?, ?, ?)",
+                (batch_id, position, submission["id"], submission["lang"], jobs[source])
+            )
+        # 命中評判結果快取的工作建立時即已完成
+        assign_batch_done_order(conn, list(jobs.values()))
+        conn.execute("COMMIT")
+        return batch_id, len(jobs), cached_count
+    finally:
+        conn.close()
+
+def assign_batch_done_order(conn: sqlite3.Connection, job_ids: List[str]) -> None:
+    """在呼叫端的交易中為剛完成的工作所對應的批次提交編上完成順序，串流結果以此作為 cursor
+
+    只在工作完成時寫入，查詢批次的 GET 不需要取得寫入鎖。
+    """
+    for job_id in job_ids:
+        items = conn.execute(
+            """
+            SELECT b.batch_id, b.position FROM batch_items b JOIN jobs j ON j.id = b.job_id
+            WHERE b.job_id = ? AND b.done_order IS NULL AND j.status = 'done' ORDER BY b.batch_id, b.position
+            """,
+            (job_id,)
+        ).fetchall()
+        for item in items:
+            conn.execute(
+                """
+                UPDATE batch_items SET done_order = (
+                    SELECT COALESCE(MAX(done_order), 0) + 1 FROM batch_items WHERE batch_id = ?
+                ) WHERE batch_id = ? AND position = ?
+                """,
+                (item["batch_id"], item["batch_id"], item["position"])
+            )
+
+def batch_row(item: sqlite3.Row, cases: List[str]) -> Dict:
+    """將單一提交的評判結果整理成分數矩陣的一列"""
+    row = {"id": item["submission_id"], "lang": item["lang"], "status": item["status"] or "expired"}
+    if item["done_order"]:
+        row["cursor"] = item["done_order"]
+    if item["status"] != "done":
+        return row
+    body = json.loads(item["result"])
+    if item["status_code"] != 200 or "summary" not in body:
+        row.update(status="error", error=body.get("error", "評判失敗"))
+        return row
+    summary = body["summary"]
+    results = body["results"]
+    if summary.get("compile_error"):
+        verdicts = ["CE"] * len(cases)
+    else:
+        verdicts = [results.get(name, {}).get("verdict", "-") for name in cases]
+    row.update(passed=summary["success_count"], total=summary["total_count"], score=summary["success_rate"],
+               cached=bool(summary.get("cached")), verdicts=verdicts)
+    return row
+
+def load_batch_info(conn: sqlite3.Connection, batch_id: str) -> Optional[Dict]:
+    """查詢批次資訊與進度 (完成數只以 COUNT 計算，不讀取結果)"""
+    batch = conn.execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+    if not batch:
+        return None
+    done = conn.execute("SELECT COUNT(*) FROM batch_items WHERE batch_id = ? AND done_order IS NOT NULL",
+                        (batch_id,)).fetchone()[0]
+    return {
+        "batch_id": batch_id,
+        "status": "done" if done == batch["total"] else "running",
+        "total": batch["total"],
+        "done": done,
+        "created_at": datetime.fromtimestamp(batch["created_at"]).isoformat(),
+        "testset": batch["testset"],
+        "cases": json.loads(batch["cases"]),
+    }
+
+def get_batch_info(batch_id: str) -> Optional[Dict]:
+    """查詢批次評判進度"""
+    conn = get_job_db()
+    try:
+        return load_batch_info(conn, batch_id)
+    finally:
+        conn.close()
+
+def get_batch(batch_id: str, after: Optional[int] = None) -> Optional[Tuple[Dict, List[Dict]]]:
+    """查詢批次狀態與結果，回傳 (批次資訊, 各提交的結果列)
+
+    after 為 None 時依提交順序回傳所有提交；否則只回傳完成順序大於 after 的已完成提交。
+    """
+    conn = get_job_db()
+    try:
+        info = load_batch_info(conn, batch_id)
+        if not info:
+            return None
+        query = """
+            SELECT b.submission_id, b.lang, b.done_order, j.status, j.status_code, j.result
+            FROM batch_items b LEFT JOIN jobs j ON j.id = b.job_id WHERE b.batch_id = ?
+        """
+        if after is None:
+            items = conn.execute(query + " ORDER BY b.position", (batch_id,)).fetchall()
+        else:
+            items = conn.execute(query + " AND b.done_order > ? ORDER BY b.done_order", (batch_id, after)).fetchall()
+    finally:
+        conn.close()
+    return info, [batch_row(item, info["cases"]) for item in items]
+
+# 測試資料同步
+# web 端在提交工作時把目前的測試資料以內容雜湊發布到共用儲存 (檔案存成 BLOB_DIR 下
+# 以 SHA-256 命名的 blob)；worker 依工作記錄的雜湊在本機展開成唯讀目錄，只需下載
+# 本機 blob 快取中還沒有的檔案。
+
+def copy_atomic(source: str, target: str, sha256: str, decompress: bool = False) -> None:
+    """複製 blob 到暫存檔再 rename，其他行程不會看到寫到一半的檔案；decompress=True 時解壓縮 gzip 來源
+
+    複製時一併驗證內容的 SHA-256，不符時拋出 RuntimeError，不會以錯誤的內容登記成該雜湊。
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(target))
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as dst, (open_blob(source) if decompress else open(source, "rb")) as src:
+            for chunk in iter(lambda: src.read(Config.IO_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+        if not decompress and source.endswith(".gz"):
+            # 維持壓縮的複本以解壓縮後的內容驗證
+            digest = hashlib.sha256()
+            with gzip.open(temp_path, "rb") as f:
+                for chunk in iter(lambda: f.read(Config.IO_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+        if digest.hexdigest() != sha256:
+            raise RuntimeError(f"測試檔內容與雜湊不符 {sha256[:12]}")
+        os.rename(temp_path, target)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def publish_testset() -> str:
+    """將目前的測試資料發布到共用儲存，回傳內容雜湊 (已發布過的版本不重複處理)"""
+    manifest = get_manifest()
+    digest = testset_digest(manifest)
+    files = {}
+    for name, entry in manifest["testcases"].items():
+        for kind, ext in (("input", ".in"), ("output", ".out")):
+            if entry.get(kind):
+                files[name + ext] = entry[kind]["sha256"]
+
+    conn = get_job_db()
+    try:
+        if conn.execute("SELECT 1 FROM testsets WHERE digest = ?", (digest,)).fetchone():
+            return digest
+        # 發布與清理互斥，避免剛複製、尚未登記的 blob 被當成未引用而刪除；來源物件也在發布期間保留
+        with file_lock(os.path.join(Config.BLOB_DIR, ".lock")), object_store_lock(shared=True):
+            for sha256 in set(files.values()):
+                if find_blob(Config.BLOB_DIR, sha256):
+                    continue
+                # 物件以暫存檔 + rename 寫入且之後不再修改 (不像舊版 TESTCASE_DIR 會被 /upload 原地覆寫)，
+                # 同一檔案系統上直接建立硬連結，壓縮的物件維持壓縮；跨檔案系統複製時驗證雜湊
+                source = find_blob(Config.TESTCASE_OBJECT_DIR, sha256)
+                if not source:
+                    raise RuntimeError(f"找不到測試檔內容 {sha256[:12]}")
+                target = blob_path(Config.BLOB_DIR, sha256) + (".gz" if source.endswith(".gz") else "")
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                try:
+                    os.link(source, target)
+                except FileExistsError:
+                    pass
+                except OSError:
+                    copy_atomic(source, target, sha256)
+            conn.execute(
+                "INSERT OR IGNORE INTO testsets (digest, files, created_at) VALUES (?, ?, ?)",
+                (digest, json.dumps(files), time.time())
+            )
+            prune_testset_store(conn)
+        collect_testcase_objects()
+    finally:
+        conn.close()
+    return digest
+
+def prune_testset_store(conn: sqlite3.Connection) -> None:
+    """只保留最近的測試資料版本與仍在排隊或執行中的工作所需的版本，並刪除沒有被引用的 blob"""
+    conn.execute(
+        """
+        DELETE FROM testsets WHERE digest NOT IN (
+            SELECT digest FROM testsets ORDER BY created_at DESC LIMIT ?
+        ) AND digest NOT IN (
+            SELECT testset FROM jobs WHERE status IN ('queued', 'running') AND testset IS NOT NULL
+        )
+        """,
+        (Config.TESTSET_STORE_KEEP,)
+    )
+    referenced = set()
+    for row in conn.execute("SELECT files FROM testsets"):
+        referenced.update(json.loads(row["files"]).values())
+    for subdir in os.scandir(Config.BLOB_DIR):
+        if not subdir.is_dir():
+            continue
+        for entry in os.scandir(subdir.path):
+            if entry.name.split(".")[0] not in referenced and not entry.name.startswith(".tmp-"):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+def trim_blob_cache() -> None:
+    """worker 本機解壓縮或複製的 blob 超過 BLOB_CACHE_MAX_BYTES 時，依最近使用時間刪除
+
+    已展開的測試資料以硬連結引用這些檔案，刪除快取不影響已展開的版本。與共用儲存
+    為同一目錄時，只刪除另有壓縮版本的解壓縮副本。
+    """
+    shared = os.path.realpath(Config.BLOB_DIR) == os.path.realpath(Config.WORKER_BLOB_DIR)
+    cached = []
+    for subdir in os.scandir(Config.WORKER_BLOB_DIR):
+        if not subdir.is_dir():
+            continue
+        for entry in os.scandir(subdir.path):
+            if "." in entry.name:
+                continue
+            if shared and not os.path.exists(entry.path + ".gz"):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            cached.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in cached)
+    for _, size, path in sorted(cached):
+        if total <= Config.BLOB_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def materialize_testset(digest: str) -> str:
+    """在本機展開指定版本的測試資料，回傳目錄路徑"""
+    target_dir = os.path.join(Config.WORKER_TESTSET_DIR, digest)
+    if os.path.isdir(target_dir):
+        os.utime(target_dir)
+        return target_dir
+
+    conn = get_job_db()
+    try:
+        row = conn.execute("SELECT files FROM testsets WHERE digest = ?", (digest,)).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        raise RuntimeError(f"共用儲存中找不到測試資料版本 {digest[:12]}")
+
+    staging_dir = tempfile.mkdtemp(prefix=".tmp-", dir=Config.WORKER_TESTSET_DIR)
+    try:
+        for filename, sha256 in json.loads(row["files"]).items():
+            # 程式的 stdin 必須是一般檔案，壓縮的 blob 先在本機解壓縮
+            local_blob = blob_path(Config.WORKER_BLOB_DIR, sha256)
+            if os.path.exists(local_blob):
+                os.utime(local_blob)
+            else:
+                source = find_blob(Config.BLOB_DIR, sha256)
+                if not source:
+                    raise RuntimeError(f"共用儲存中找不到測試檔 {sha256[:12]}")
+                copy_atomic(source, local_blob, sha256, decompress=source.endswith(".gz"))
+            # blob 內容不會再變動，可以直接以硬連結展開
+            try:
+                os.link(local_blob, os.path.join(staging_dir, filename))
+            except OSError:
+                shutil.copyfile(local_blob, os.path.join(staging_dir, filename))
+        try:
+            os.rename(staging_dir, target_dir)
+        except OSError:
+            # 其他執行緒已展開相同版本
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    # 只保留最近使用的幾個版本
+    entries = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(Config.WORKER_TESTSET_DIR)
+                     if entry.is_dir() and not entry.name.startswith("."))
+    for _, path in entries[:-Config.WORKER_TESTSET_KEEP]:
+        shutil.rmtree(path, ignore_errors=True)
+    trim_blob_cache()
+    return target_dir
+
+def run_job(job: sqlite3.Row) -> Tuple[Dict, int]:
+    """以工作記錄的測試資料版本與設定快照執行評判"""
+    job_id = job["id"]
+    testset_dir = materialize_testset(job["testset"]) if job["testset"] else None
+    token = job_settings.set(json.loads(job["settings"]) if job["settings"] else None)
+    try:
+        return execute_judge(
+            job["code"], job["lang"],
+            on_case_result=lambda name, result: record_case_result(job_id, name, result),
+            testset_dir=testset_dir
+        )
+    finally:
+        job_settings.reset(token)
+
+def overall_verdict(body: Dict) -> str:
+    """整份提交的結果：全部通過為 AC，否則為第一個未通過測試案例的結果"""
+    if "results" not in body:
+        return "ERROR"
+    verdicts = [result.get("verdict", "ERROR") for result in body["results"].values()]
+    for verdict in verdicts:
+        if verdict not in ("AC", "SKIPPED"):
+            return verdict
+    return "AC" if verdicts else "ERROR"
+
+def job_runner_loop() -> None:
+    """背景執行緒：持續領取並執行評判工作"""
+    while True:
+        try:
+            job = claim_next_job()
+        except sqlite3.Error as e:
+            logger.error(f"領取評判工作失敗: {e}")
+            job = None
+        if not job:
+            time.sleep(Config.JOB_POLL_INTERVAL)
+            continue
+
+        metrics.observe("judge_queue_wait_seconds", time.time() - job["created_at"], {"lang": job["lang"]})
+        try:
+            body, status_code = run_job(job)
+        except Exception as e:
+            logger.error(f"執行評判工作失敗 {job['id']}: {e}")
+            body, status_code = {"error": "評判失敗，請稍後再試"}, 500
+        if job["cache_key"]:
+            store_verdict_cache(job["cache_key"], body, status_code)
+        metrics.observe("judge_request_seconds", time.time() - job["created_at"],
+                        {"lang": job["lang"], "verdict": overall_verdict(body)})
+        try:
+            finish_job(job["id"], body, status_code)
+        except sqlite3.Error as e:
+            logger.error(f"寫入評判結果失敗 {job['id']}: {e}")
+
+def job_heartbeat_loop() -> None:
+    """背景執行緒：為本行程執行中的工作更新 heartbeat"""
+    while True:
+        time.sleep(Config.JOB_HEARTBEAT_INTERVAL)
+        try:
+            conn = get_job_db()
+            try:
+                conn.execute(
+                    "UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND worker = ?",
+                    (time.time(), WORKER_ID)
+                )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"更新工作 heartbeat 失敗: {e}")
+
+_runners_started = threading.Event()
+
+def start_job_runners() -> None:
+    """啟動本行程的評判背景執行緒 (重複呼叫不會重複啟動)"""
+    if _runners_started.is_set():
+        return
+    _runners_started.set()
+    for _ in range(Config.JOB_RUNNERS_PER_PROCESS):
+        threading.Thread(target=job_runner_loop, daemon=True).start()
+    threading.Thread(target=job_heartbeat_loop, daemon=True).start()
+    threading.Thread(target=prepare_toolchain_caches, daemon=True).start()
+
+def run_worker() -> None:
+    """獨立的 worker 行程：只從共用儲存領取並執行評判工作，不提供 HTTP 服務"""
+    logger.info(f"評判 worker 啟動: {WORKER_ID}，共用儲存 {Config.SHARED_STORE_DIR}")
+    start_job_runners()
+    while True:
+        time.sleep(3600)
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus 指標 (合併所有 worker)"""
+    try:
+        flush_metrics()
+        values, histograms = collect_metrics()
+        manifest = get_manifest()
+        testset_bytes = 0
+        for entry in manifest["testcases"].values():
+            for kind in ("input", "output"):
+                if entry.get(kind):
+                    testset_bytes += entry[kind]["size"]
+        conn = get_job_db()
+        try:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        finally:
+            conn.close()
+        gauges = {
+            "judge_testset_cases": ("Test cases in the current test set", len(manifest["testcases"])),
+            "judge_testset_bytes": ("Total size of test input and output files", testset_bytes),
+            "judge_jobs_queued": ("Judge jobs waiting in the queue", queued),
+        }
+        return Response(render_metrics(values, histograms, gauges), mimetype="text/plain; version=0.0.4")
+    except Exception as e:
+        logger.error(f"產生監控指標失敗: {e}")
+        return jsonify({"error": "產生監控指標失敗"}), 500
+
+@app.route("/api/jobs", methods=["POST"])
+def submit_job():
+    """提交評判工作，立即回傳工作 ID"""
+    try:
+        code = request.form.get("code", "").strip()
+        lang = request.form.get("lang", "").strip()
+
+        lang, error = resolve_submission(code, lang)
+        if error:
+            return jsonify({"error": error}), 400
+
+        job_id, position = enqueue_job(code, lang)
+        if not job_id:
+            return jsonify({"error": "評判佇列已滿，請稍後再試"}), 429
+
+        logger.info(f"提交評判工作: {job_id} ({lang})")
+        # 排隊位置為 0 表示命中評判結果快取，工作已完成
+        return jsonify({"job_id": job_id, "status": "done" if position == 0 else "queued", "position": position}), 202
+
+    except Exception as e:
+        logger.error(f"提交評判工作失敗: {e}")
+        return jsonify({"error": "提交失敗，請稍後再試"}), 500
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job_status(job_id):
+    """查詢評判工作狀態"""
+    try:
+        job = get_job(job_id)
+        if not job:
+            return jsonify({"error": "評判工作不存在"}), 404
+        job.pop("result", None)
+        return jsonify(job), 200
+    except Exception as e:
+        logger.error(f"查詢評判工作失敗: {e}")
+        return jsonify({"error": "查詢評判工作失敗"}), 500
+
+@app.route("/api/jobs/<job_id>/result", methods=["GET"])
+def get_job_result(job_id):
+    """取得評判結果，尚未完成時回傳 202 與目前狀態"""
+    try:
+        job = get_job(job_id)
+        if not job:
+            return jsonify({"error": "評判工作不存在"}), 404
+        if job["status"] != "done":
+            return jsonify(job), 202
+        return jsonify(job["result"]), job["status_code"]
+    except Exception as e:
+        logger.error(f"取得評判結果失敗: {e}")
+        return jsonify({"error": "取得評判結果失敗"}), 500
+
+@app.route("/api/batches", methods=["POST"])
+def submit_batch():
+    """提交批次評判：{"submissions": [{"id": ..., "lang": ..., "code": ...}, ...]}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        submissions = data.get("submissions") if isinstance(data, dict) else None
+        if not isinstance(submissions, list) or not submissions:
+            return jsonify({"error": "請提供要評判的提交"}), 400
+        if len(submissions) > Config.BATCH_MAX_SUBMISSIONS:
+            return jsonify({"error": f"單一批次最多 {Config.BATCH_MAX_SUBMISSIONS} 份提交"}), 400
+
+        validated = []
+        seen_ids = set()
+        validation_errors = []
+        for index, submission in enumerate(submissions):
+            if not isinstance(submission, dict):
+                validation_errors.append(f"第 {index + 1} 份提交格式錯誤")
+                continue
+            submission_id = str(submission.get("id", "")).strip()
+            lang = submission.get("lang")
+            code = submission.get("code")
+            if not submission_id or submission_id in seen_ids:
+                validation_errors.append(f"第 {index + 1} 份提交缺少 id 或 id 重複")
+            elif lang not in Config.SUPPORTED_LANGUAGES:
+                validation_errors.append(f"{submission_id}: 不支援的程式語言")
+            elif not isinstance(code, str) or not code.strip():
+                validation_errors.append(f"{submission_id}: 請提供程式碼")
+            else:
+                seen_ids.add(submission_id)
+                validated.append({"id": submission_id, "lang": lang, "code": code.strip()})
+        if validation_errors:
+            return jsonify({"error": "提交驗證失敗", "details": validation_errors[:50]}), 400
+
+        if not list_input_files():
+            return jsonify({"error": "沒有可用的測試資料"}), 400
+
+        batch_id, job_count, cached_count = enqueue_batch(validated)
+        if not batch_id:
+            return jsonify({"error": "批次評判佇列已滿，請稍後再試"}), 429
+        logger.info(f"提交批次評判: {batch_id} ({len(validated)} 份提交，{job_count} 個工作，{cached_count} 個命中快取)")
+        return jsonify({
+            "batch_id": batch_id,
+            "status": "queued",
+            "total": len(validated),
+            "jobs": job_count,
+            "cached": cached_count,
+        }), 202
+
+    except Exception as e:
+        logger.error(f"提交批次評判失敗: {e}")
+        return jsonify({"error": "提交失敗，請稍後再試"}), 500
+
+@app.route("/api/batches/<batch_id>", methods=["GET"])
+def get_batch_status(batch_id):
+    """查詢批次評判進度"""
+    try:
+        info = get_batch_info(batch_id)
+        if not info:
+            return jsonify({"error": "批次評判不存在"}), 404
+        return jsonify(info), 200
+    except Exception as e:
+        logger.error(f"查詢批次評判失敗: {e}")
+        return jsonify({"error": "查詢批次評判失敗"}), 500
+
+@app.route("/api/batches/<batch_id>/results", methods=["GET"])
+def get_batch_results(batch_id):
+    """取得批次評判的分數矩陣
+
+    format=json (預設) 或 csv 回傳目前所有提交的結果 (未完成的提交標示狀態)；
+    format=ndjson 依完成順序串流，每行的 type 為 header / row / summary / pending，
+    連線超過等待時間時送出 pending 與 cursor，可帶 ?after=<cursor> 重新連線接續讀取。
+    """
+    try:
+        result_format = request.args.get("format", "json")
+        if result_format not in ("json", "csv", "ndjson"):
+            return jsonify({"error": "format 必須是 json、csv 或 ndjson"}), 400
+        after = request.args.get("after", 0, type=int)
+        batch = get_batch(batch_id, after=after if result_format == "ndjson" else None)
+        if not batch:
+            return jsonify({"error": "批次評判不存在"}), 404
+    except Exception as e:
+        logger.error(f"取得批次評判結果失敗: {e}")
+        return jsonify({"error": "取得批次評判結果失敗"}), 500
+
+    info, rows = batch
+    if result_format == "json":
+        return jsonify({**info, "submissions": rows}), 200
+
+    if result_format == "csv":
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["id", "lang", "status", "passed", "total"] + info["cases"])
+        for row in rows:
+            writer.writerow([row["id"], row["lang"], row["status"], row.get("passed", ""), row.get("total", "")]
+                            + row.get("verdicts", [""] * len(info["cases"])))
+        return Response(output.getvalue(), mimetype="text/csv; charset=utf-8", headers={
+            "Content-Disposition": f"attachment; filename=batch-{batch_id[:12]}.csv"
+        })
+
+    def generate():
+        cursor = after
+        batch_info, batch_rows = info, rows
+        deadline = time.time() + Config.SYNC_JUDGE_WAIT_SECONDS
+        yield json.dumps({"type": "header", "cases": batch_info["cases"], "total": batch_info["total"]},
+                         ensure_ascii=False) + "\n"
+        while True:
+            for row in batch_rows:
+                cursor = row["cursor"]
+                yield json.dumps({"type": "row", **row}, ensure_ascii=False) + "\n"
+            if batch_info["status"] == "done":
+                summary = {key: batch_info[key] for key in ("batch_id", "total", "done")}
+                yield json.dumps({"type": "summary", **summary}, ensure_ascii=False) + "\n"
+                return
+            if time.time() >= deadline:
+                yield json.dumps({"type": "pending", "cursor": cursor, "done": batch_info["done"]},
+                                 ensure_ascii=False) + "\n"
+                return
+            time.sleep(Config.JOB_POLL_INTERVAL)
+            batch = get_batch(batch_id, after=cursor)
+            if not batch:
+                yield json.dumps({"type": "error", "error": "批次評判不存在"}, ensure_ascii=False) + "\n"
+                return
+            batch_info, batch_rows = batch
+
+    return Response(generate(), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/jobs/<job_id>/stream", methods=["GET"])
+def stream_job_result(job_id):
+    """以 NDJSON 串流評判結果：每完成一個測試案例送出一行，最後送出總結
+
+    每行的 type 為 case / summary / error / pending。連線超過等待時間時送出
+    pending 與 cursor，用戶端可帶 ?after=<cursor> 重新連線接續讀取。
+    """
+    try:
+        if not get_job(job_id):
+            return jsonify({"error": "評判工作不存在"}), 404
+        after = request.args.get("after", 0, type=int)
+    except Exception as e:
+        logger.error(f"串流評判結果失敗: {e}")
+        return jsonify({"error": "串流評判結果失敗"}), 500
+
+    def generate():
+        cursor = after
+        deadline = time.time() + Config.SYNC_JUDGE_WAIT_SECONDS
+        while True:
+            # 先讀取工作狀態再讀取案例，確保完成前寫入的案例都會被送出
+            job = get_job(job_id)
+            for row in get_case_results(job_id, cursor):
+                cursor = row["cursor"]
+                yield json.dumps({"type": "case", "cursor": cursor, "name": row["name"],
+                                  "result": json.loads(row["result"])}, ensure_ascii=False) + "\n"
+
+            if job is None:
+                yield json.dumps({"type": "error", "error": "評判工作不存在"}, ensure_ascii=False) + "\n"
+                return
+
+            if job["status"] == "done":
+                body = job["result"]
+                if "error" in body:
+                    yield json.dumps({"type": "error", "error": body["error"]}, ensure_ascii=False) + "\n"
+                    return
+                # 未經逐筆回報的結果 (例如編譯錯誤、fail-fast 略過的案例) 在總結前補送
+                recorded = get_recorded_case_names(job_id)
+                for name, result in body.get("results", {}).items():
+                    if name not in recorded:
+                        yield json.dumps({"type": "case", "cursor": cursor, "name": name,
+                                          "result": result}, ensure_ascii=False) + "\n"
+                yield json.dumps({"type": "summary", "summary": body["summary"]}, ensure_ascii=False) + "\n"
+                return
+
+            if time.time() >= deadline:
+                yield json.dumps({"type": "pending", "cursor": cursor, "status": job["status"]}, ensure_ascii=False) + "\n"
+                return
+            time.sleep(Config.JOB_POLL_INTERVAL)
+
+    return Response(generate(), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/judge", methods=["POST"])
+def judge_code():
+    """評判程式碼 (同步介面：提交工作後等待結果)"""
+    try:
+        code = request.form.get("code", "").strip()
+        lang = request.form.get("lang", "").strip()
+
+        lang, error = resolve_submission(code, lang)
+        if error:
+            return jsonify({"error": error}), 400
+
+        job_id, _ = enqueue_job(code, lang)
+        if not job_id:
+            return jsonify({"error": "評判佇列已滿，請稍後再試"}), 429
+
+        # 在 gunicorn timeout 之前放棄等待，改由用戶端以工作 ID 查詢
+        deadline = time.time() + Config.SYNC_JUDGE_WAIT_SECONDS
+        while time.time() < deadline:
+            job = get_job(job_id)
+            if job and job["status"] == "done":
+                return jsonify(job["result"]), job["status_code"]
+            time.sleep(Config.JOB_POLL_INTERVAL)
+
+        return jsonify({"job_id": job_id, "status": "pending", "message": "評判時間較長，請以工作 ID 查詢結果"}), 202
+
+    except Exception as e:
+        logger.error(f"評判程式碼失敗: {e}")
+        return jsonify({"error": "評判失敗，請稍後再試"}), 500
+
+@app.route("/api/settings", methods=["GET"])
+def get_settings():
+    """獲取系統設定"""
+    try:
+        config = load_config()
+        settings = config.get("settings", DEFAULT_SETTINGS.copy())
+        return jsonify({"settings": settings}), 200
+    except Exception as e:
+        logger.error(f"獲取設定失敗: {e}")
+        return jsonify({"error": "獲取設定失敗"}), 500
+
+@app.route("/api/settings", methods=["POST"])
+def update_settings():
+    """更新系統設定"""
+    try:
+        data = request.get_json()
+        if not data or "settings" not in data:
+            return jsonify({"error": "請提供有效的設定資料"}), 400
+
+        new_settings = data["settings"]
+        
+        # 驗證設定值
+        validation_errors = []
+        
+        if "execution_time_limit" in new_settings:
+            if not isinstance(new_settings["execution_time_limit"], (int, float)) or new_settings["execution_time_limit"] <= 0 or new_settings["execution_time_limit"] > 60:
+                validation_errors.append("執行時間限制必須是1-60秒之間的數字")
+        
+        if "memory_limit" in new_settings:
+            if not isinstance(new_settings["memory_limit"], int) or new_settings["memory_limit"] <= 0 or new_settings["memory_limit"] > 1024:
+                validation_errors.append("記憶體限制必須是1-1024MB之間的整數")
+        
+        if "compile_time_limit" in new_settings:
+            if not isinstance(new_settings["compile_time_limit"], (int, float)) or new_settings["compile_time_limit"] <= 0 or new_settings["compile_time_limit"] > 60:
                 validation_errors.append("編譯時間限制必須是1-60秒之間的數字")
         
+        if "max_parallel_runs" in new_settings:
+            if not isinstance(new_settings["max_parallel_runs"], int) or isinstance(new_settings["max_parallel_runs"], bool) or new_settings["max_parallel_runs"] < 0 or new_settings["max_parallel_runs"] > 64:
+                validation_errors.append("平行執行數必須是0-64之間的整數 (0 表示依 CPU 核心數)")
+        
+        if "fail_fast" in new_settings:
+            if not isinstance(new_settings["fail_fast"], bool):
+                validation_errors.append("失敗即停止必須是布林值")
+        
+        if "output_limit" in new_settings:
+            if not isinstance(new_settings["output_limit"], int) or isinstance(new_settings["output_limit"], bool) or new_settings["output_limit"] <= 0 or new_settings["output_limit"] > 1024:
+                validation_errors.append("輸出限制必須是1-1024MB之間的整數")
+        
+        if "warm_runners" in new_settings:
+            if not isinstance(new_settings["warm_runners"], bool):
+                validation_errors.append("預熱直譯器必須是布林值")
+        
+        if "reuse_case_results" in new_settings:
+            if not isinstance(new_settings["reuse_case_results"], bool):
+                validation_errors.append("沿用測試案例結果必須是布林值")
+        
         if validation_errors:
             return jsonify({"error": "設定驗證失敗", "details": validation_errors}), 400
         
         # 更新設定
-        config = load_config()
-        if "settings" not in config:
-            config["settings"] = DEFAULT_SETTINGS.copy()
-        
-        config["settings"].update(new_settings)
-        save_config(config)
+        def apply_settings(config: Dict) -> None:
+            config.setdefault("settings", DEFAULT_SETTINGS.copy()).update(new_settings)
+        config = update_config(apply_settings)
         
         logger.info(f"設定已更新: {new_settings}")
         return jsonify({"message": "設定更新成功", "settings": config["settings"]}), 200
@@ -616,5 +4308,16 @@ def update_settings():
         logger.error(f"更新設定失敗: {e}")
         return jsonify({"error": "更新設定失敗"}), 500
 
+if not WORKER_ROLE:
+    backfill_testcase_refs()
+    migrate_flat_testcases()
+init_job_db()
+threading.Thread(target=metrics_flush_loop, daemon=True).start()
+if Config.EMBEDDED_RUNNERS:
+    start_job_runners()
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True) 
\ No newline at end of file
+    if WORKER_ROLE:
+        run_worker()
+    else:
+        app.run(host="0.0.0.0", port=5000, debug=True) 
\ No newline at end of file
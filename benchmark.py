@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""評判系統效能基準測試
+
+產生合成測試資料並上傳到執行中的評判系統，以各語言的參考解答 (正確、逾時、
+答案錯誤、大量輸出) 併發送出 /judge 請求，輸出延遲百分位數、吞吐量、編譯與
+執行時間拆分及峰值記憶體的 JSON 報告，可與先前的報告比較。
+
+用法:
+    python benchmark.py --url http://localhost:5000 --cases 10 --case-size 100000 \\
+        --requests 40 --concurrency 4 --output result.json
+    python benchmark.py --compare baseline.json result.json
+"""
+
+import argparse
+import io
+import json
+import platform
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+SUPPORTED_LANGUAGES = ["cpp", "java", "python", "javascript", "golang"]
+SCENARIOS = ["fast", "slow", "wrong", "flood"]
+
+# 每種語言的參考解答：讀入 n 與 n 個整數，輸出總和
+SOLUTIONS = {
+    "cpp": {
+        "fast": """#include <cstdio>
+int main(){long long n,x,s=0;scanf("%lld",&n);for(long long i=0;i<n;i++){scanf("%lld",&x);s+=x;}printf("%lld\\n",s);}
+""",
+        "slow": """#include <cstdio>
+int main(){volatile unsigned long long x=0;for(;;)x++;}
+""",
+        "wrong": """#include <cstdio>
+int main(){long long n,x,s=0;scanf("%lld",&n);for(long long i=0;i<n;i++){scanf("%lld",&x);s+=x;}printf("%lld\\n",s+1);}
+""",
+        "flood": """#include <cstdio>
+int main(){for(;;)puts("0123456789012345678901234567890123456789");}
+""",
+    },
+    "java": {
+        "fast": """import java.io.*;
+public class Main{public static void main(String[] a)throws IOException{StreamTokenizer t=new StreamTokenizer(new BufferedInputStream(System.in));t.nextToken();long n=(long)t.nval,s=0;for(long i=0;i<n;i++){t.nextToken();s+=(long)t.nval;}System.out.println(s);}}
+""",
+        "slow": """public class Main{public static void main(String[] a){long x=0;while(true){x++;}}}
+""",
+        "wrong": """import java.io.*;
+public class Main{public static void main(String[] a)throws IOException{StreamTokenizer t=new StreamTokenizer(new BufferedInputStream(System.in));t.nextToken();long n=(long)t.nval,s=0;for(long i=0;i<n;i++){t.nextToken();s+=(long)t.nval;}System.out.println(s+1);}}
+""",
+        "flood": """import java.io.*;
+public class Main{public static void main(String[] a){PrintWriter w=new PrintWriter(new BufferedOutputStream(System.out));while(true){w.println("0123456789012345678901234567890123456789");}}}
+""",
+    },
+    "python": {
+        "fast": """import sys
+data = sys.stdin.buffer.read().split()
+print(sum(map(int, data[1:1 + int(data[0])])))
+""",
+        "slow": """while True:
+    pass
+""",
+        "wrong": """import sys
+data = sys.stdin.buffer.read().split()
+print(sum(map(int, data[1:1 + int(data[0])])) + 1)
+""",
+        "flood": """import sys
+line = "0123456789012345678901234567890123456789\\n" * 1000
+while True:
+    sys.stdout.write(line)
+""",
+    },
+    "javascript": {
+        "fast": """const d = require("fs").readFileSync(0, "utf8").trim().split(/\\s+/).map(Number);
+let s = 0; for (let i = 1; i <= d[0]; i++) s += d[i];
+console.log(String(s));
+""",
+        "slow": """for (;;) {}
+""",
+        "wrong": """const d = require("fs").readFileSync(0, "utf8").trim().split(/\\s+/).map(Number);
+let s = 0; for (let i = 1; i <= d[0]; i++) s += d[i];
+console.log(String(s + 1));
+""",
+        "flood": """const line = "0123456789012345678901234567890123456789\\n".repeat(1000);
+for (;;) process.stdout.write(line);
+""",
+    },
+    "golang": {
+        "fast": """package main
+import ("bufio";"fmt";"os")
+func main(){r:=bufio.NewReader(os.Stdin);var n,x,s int64;fmt.Fscan(r,&n);for i:=int64(0);i<n;i++{fmt.Fscan(r,&x);s+=x};fmt.Println(s)}
+""",
+        "slow": """package main
+func main(){x:=0;for{x++}}
+""",
+        "wrong": """package main
+import ("bufio";"fmt";"os")
+func main(){r:=bufio.NewReader(os.Stdin);var n,x,s int64;fmt.Fscan(r,&n);for i:=int64(0);i<n;i++{fmt.Fscan(r,&x);s+=x};fmt.Println(s+1)}
+""",
+        "flood": """package main
+import ("bufio";"os")
+func main(){w:=bufio.NewWriter(os.Stdout);for{w.WriteString("0123456789012345678901234567890123456789\\n")}}
+""",
+    },
+}
+
+def generate_testset(cases: int, case_size: int, seed: int) -> bytes:
+    """產生合成測試資料的 ZIP：每個輸入約 case_size 位元組的整數，輸出為總和"""
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for index in range(cases):
+            numbers = []
+            size = 0
+            while size < case_size:
+                value = rng.randint(-10 ** 9, 10 ** 9)
+                numbers.append(value)
+                size += len(str(value)) + 1
+            body = " ".join(map(str, numbers))
+            zipf.writestr(f"bench_{index:04d}.in", f"{len(numbers)}\n{body}\n")
+            zipf.writestr(f"bench_{index:04d}.out", f"{sum(numbers)}\n")
+    return buffer.getvalue()
+
+def encode_multipart(fields: Dict[str, str], files: Dict[str, Tuple[str, bytes]]) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode() +
+                     value.encode("utf-8") + b"\r\n")
+    for name, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+def request_json(url: str, data: Optional[bytes] = None, content_type: Optional[str] = None,
+                 timeout: float = 600) -> Tuple[int, Dict]:
+    req = urllib.request.Request(url, data=data)
+    if content_type:
+        req.add_header("Content-Type", content_type)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        try:
+            return e.code, json.loads(body)
+        except ValueError:
+            return e.code, {"error": body.decode("utf-8", "replace")}
+
+def setup_testset(base_url: str, cases: int, case_size: int, seed: int, reset: bool) -> Dict:
+    """上傳合成測試資料"""
+    if reset:
+        request_json(f"{base_url}/deleteAll", data=b"", content_type="application/json")
+    archive = generate_testset(cases, case_size, seed)
+    body, content_type = encode_multipart({}, {"zipfile": ("bench.zip", archive)})
+    status, result = request_json(f"{base_url}/import", data=body, content_type=content_type)
+    if status != 200:
+        raise RuntimeError(f"匯入測試資料失敗: {status} {result}")
+    return result
+
+def judge_once(base_url: str, lang: str, code: str) -> Dict:
+    """送出一次 /judge，逾時回傳 202 時改為輪詢工作結果"""
+    body, content_type = encode_multipart({"code": code, "lang": lang}, {})
+    start = time.monotonic()
+    status, result = request_json(f"{base_url}/judge", data=body, content_type=content_type)
+    job_id = result.get("job_id") if status == 202 else None
+    while status == 202 and job_id:
+        time.sleep(0.5)
+        status, result = request_json(f"{base_url}/api/jobs/{job_id}/result")
+    return {"status": status, "latency": time.monotonic() - start, "body": result}
+
+MEMORY_PATTERN = re.compile(r"([\d.]+)MB")
+
+def parse_seconds(value) -> float:
+    try:
+        return float(str(value).lstrip(">").rstrip("s"))
+    except ValueError:
+        return 0.0
+
+def summarize_response(response: Dict) -> Dict:
+    """從評判回應取出編譯時間、各測試案例執行時間總和與峰值記憶體"""
+    body = response["body"]
+    summary = body.get("summary", {})
+    results = body.get("results", {}).values()
+    peak_memory = 0.0
+    for result in results:
+        match = MEMORY_PATTERN.search(str(result.get("memory", "")))
+        if match:
+            peak_memory = max(peak_memory, float(match.group(1)))
+    return {
+        "ok": response["status"] == 200,
+        "latency": response["latency"],
+        "compile_time": parse_seconds(summary.get("build_time", 0)),
+        "run_time": sum(parse_seconds(result.get("wall_time", 0)) for result in results),
+        "peak_memory_mb": peak_memory,
+        "verdicts": sorted({result.get("verdict", "") for result in results}),
+    }
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def aggregate(samples: List[Dict], elapsed: float) -> Dict:
+    latencies = [sample["latency"] for sample in samples]
+    verdicts = sorted({verdict for sample in samples for verdict in sample["verdicts"]})
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if not sample["ok"]),
+        "throughput_rps": len(samples) / elapsed if elapsed > 0 else 0.0,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "compile_time_mean": statistics.fmean(s["compile_time"] for s in samples) if samples else 0.0,
+        "run_time_mean": statistics.fmean(s["run_time"] for s in samples) if samples else 0.0,
+        "peak_memory_mb": max((s["peak_memory_mb"] for s in samples), default=0.0),
+        "verdicts": verdicts,
+    }
+
+def run_benchmark(args) -> Dict:
+    base_url = args.url.rstrip("/")
+    testset = setup_testset(base_url, args.cases, args.case_size, args.seed, args.reset)
+    print(f"測試資料: {testset.get('message')}", file=sys.stderr)
+
+    workload = [(lang, scenario) for lang in args.langs for scenario in args.scenarios]
+    plan = [workload[i % len(workload)] for i in range(args.requests)]
+    # 每個請求附加不同的註解，避免編譯快取讓結果只反映快取命中
+    comment = {"cpp": "// ", "java": "// ", "javascript": "// ", "golang": "// ", "python": "# "}
+
+    samples: Dict[Tuple[str, str], List[Dict]] = {}
+    lock = threading.Lock()
+
+    def task(lang: str, scenario: str) -> None:
+        code = SOLUTIONS[lang][scenario]
+        if not args.allow_cache:
+            code += comment[lang] + uuid.uuid4().hex + "\n"
+        sample = summarize_response(judge_once(base_url, lang, code))
+        with lock:
+            samples.setdefault((lang, scenario), []).append(sample)
+
+    for lang, scenario in workload[:args.warmup]:
+        task(lang, scenario)
+    samples.clear()
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for future in [executor.submit(task, lang, scenario) for lang, scenario in plan]:
+            future.result()
+    elapsed = time.monotonic() - start
+
+    all_samples = [sample for group in samples.values() for sample in group]
+    return {
+        "config": {
+            "url": base_url,
+            "cases": args.cases,
+            "case_size": args.case_size,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "langs": args.langs,
+            "scenarios": args.scenarios,
+            "allow_cache": args.allow_cache,
+            "seed": args.seed,
+        },
+        "environment": {"host": platform.node(), "python": platform.python_version(), "time": time.time()},
+        "elapsed": elapsed,
+        "overall": aggregate(all_samples, elapsed),
+        "scenarios": {f"{lang}/{scenario}": aggregate(group, elapsed)
+                      for (lang, scenario), group in sorted(samples.items())},
+    }
+
+COMPARE_FIELDS = ["latency_p50", "latency_p95", "latency_p99", "throughput_rps",
+                  "compile_time_mean", "run_time_mean", "peak_memory_mb"]
+
+def compare_reports(baseline: Dict, current: Dict) -> Dict:
+    """比較兩份報告，回傳各項指標的變化百分比"""
+    def diff(old: Dict, new: Dict) -> Dict:
+        changes = {}
+        for field in COMPARE_FIELDS:
+            before, after = old.get(field, 0.0), new.get(field, 0.0)
+            changes[field] = {
+                "baseline": before,
+                "current": after,
+                "change": f"{(after - before) / before * 100:+.1f}%" if before else None,
+            }
+        return changes
+
+    scenarios = {}
+    for name in sorted(set(baseline["scenarios"]) & set(current["scenarios"])):
+        scenarios[name] = diff(baseline["scenarios"][name], current["scenarios"][name])
+    return {"overall": diff(baseline["overall"], current["overall"]), "scenarios": scenarios}
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="評判系統效能基準測試")
+    parser.add_argument("--url", default="http://localhost:5000", help="評判系統網址")
+    parser.add_argument("--cases", type=int, default=10, help="測試案例數量")
+    parser.add_argument("--case-size", type=int, default=100000, help="每個輸入檔的大約大小 (bytes)")
+    parser.add_argument("--requests", type=int, default=20, help="評判請求總數")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時送出的請求數")
+    parser.add_argument("--langs", nargs="+", default=SUPPORTED_LANGUAGES, choices=SUPPORTED_LANGUAGES)
+    parser.add_argument("--scenarios", nargs="+", default=["fast"], choices=SCENARIOS,
+                        help="fast=正確, slow=逾時, wrong=答案錯誤, flood=大量輸出")
+    parser.add_argument("--warmup", type=int, default=0, help="正式量測前的暖機請求數")
+    parser.add_argument("--allow-cache", action="store_true", help="允許編譯快取命中 (預設每次送出不同的程式碼)")
+    parser.add_argument("--reset", action="store_true", help="上傳前刪除所有現有測試資料")
+    parser.add_argument("--seed", type=int, default=1, help="測試資料亂數種子")
+    parser.add_argument("--output", help="報告輸出檔案 (預設輸出到 stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="比較兩份報告")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.compare[1], "r", encoding="utf-8") as f:
+            current = json.load(f)
+        report = compare_reports(baseline, current)
+    else:
+        report = run_benchmark(args)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,5 +14,11 @@ else
     chmod -R 755 /app/testcases
 fi
 
+# JUDGE_ROLE=worker 時只啟動評判 worker (需與 web 共用 JUDGE_SHARED_STORE)
+if [ "$JUDGE_ROLE" = "worker" ]; then
+    exec gosu judge python /app/app.py worker
+fi
+
 # 切換到 judge 使用者並啟動應用程式
-exec gosu judge gunicorn --workers 4 --bind 0.0.0.0:5000 --timeout 30 app:app 
\ No newline at end of file
+# 串流結果與同步 /judge 會長時間等待評判完成，使用執行緒 worker，等待中的連線不會佔住整個 worker 行程
+exec gosu judge gunicorn --workers 4 --worker-class gthread --threads 16 --bind 0.0.0.0:5000 --timeout 30 app:app 
\ No newline at end of file
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# 匯入 app 前設定：工作佇列放在暫存目錄，且不在測試行程內啟動評判執行緒
+os.environ.setdefault("JUDGE_SHARED_STORE", tempfile.mkdtemp(prefix="judge-test-"))
+os.environ.setdefault("JUDGE_EMBEDDED_RUNNERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as judge_app  # noqa: E402
+
+
+@pytest.fixture
+def app_module():
+    return judge_app
+
+
+@pytest.fixture
+def settings():
+    """以設定快照覆寫部分設定 (與 worker 執行工作時相同的機制)"""
+    tokens = []
+
+    def apply(**overrides):
+        tokens.append(judge_app.job_settings.set({**judge_app.DEFAULT_SETTINGS, **overrides}))
+
+    yield apply
+    for token in reversed(tokens):
+        judge_app.job_settings.reset(token)
+
+
+@pytest.fixture
+def job_db(tmp_path, monkeypatch):
+    """每個測試使用獨立的工作佇列資料庫"""
+    monkeypatch.setattr(judge_app.Config, "JOB_DB", str(tmp_path / "jobs.db"))
+    judge_app.init_job_db()
+    return judge_app.get_job_db
@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def batches(app_module, job_db, monkeypatch):
+    """批次評判使用固定的測試資料版本與預設設定"""
+    monkeypatch.setattr(app_module, "publish_testset", lambda: "testset")
+    monkeypatch.setattr(app_module, "_cached_config", lambda: {"settings": dict(app_module.DEFAULT_SETTINGS)})
+    return job_db
+
+
+def submit(app_module, *codes):
+    return app_module.enqueue_batch([{"id": f"s{index}", "lang": "python", "code": code}
+                                     for index, code in enumerate(codes)])
+
+
+def judged(passed=1):
+    return {"summary": {"success_count": passed, "total_count": 1, "success_rate": passed * 100.0},
+            "results": {}}
+
+
+def test_interactive_jobs_are_claimed_before_batch_jobs(app_module, batches):
+    submit(app_module, "print(1)")
+    interactive_job, _ = app_module.enqueue_job("print(2)", "python")
+
+    assert app_module.claim_next_job()["id"] == interactive_job
+    assert app_module.claim_next_job()["priority"] == app_module.Config.BATCH_JOB_PRIORITY
+    assert app_module.claim_next_job() is None
+
+
+def test_done_order_follows_completion_order(app_module, batches):
+    batch_id, job_count, _ = submit(app_module, "print(1)", "print(2)")
+    first = app_module.claim_next_job()
+    second = app_module.claim_next_job()
+    assert job_count == 2
+
+    app_module.finish_job(second["id"], judged(), 200)
+    info, rows = app_module.get_batch(batch_id, after=0)
+    assert (info["status"], info["done"]) == ("running", 1)
+    assert [(row["id"], row["cursor"]) for row in rows] == [("s1", 1)]
+
+    app_module.finish_job(first["id"], judged(0), 200)
+    info, rows = app_module.get_batch(batch_id, after=1)
+    assert (info["status"], info["done"]) == ("done", 2)
+    assert [(row["id"], row["cursor"], row["passed"]) for row in rows] == [("s0", 2, 0)]
+
+
+def test_identical_submissions_share_one_job(app_module, batches):
+    batch_id, job_count, _ = submit(app_module, "print(1)", "print(1)")
+    job = app_module.claim_next_job()
+    assert job_count == 1
+
+    app_module.finish_job(job["id"], judged(), 200)
+
+    _, rows = app_module.get_batch(batch_id)
+    assert sorted(row["cursor"] for row in rows) == [1, 2]
+
+
+def test_cached_submissions_are_done_when_batch_is_created(app_module, batches):
+    settings = dict(app_module.DEFAULT_SETTINGS)
+    key = app_module.verdict_cache_key("print(1)", "python", "testset", settings)
+    app_module.store_verdict_cache(key, judged(), 200)
+
+    batch_id, job_count, cached_count = submit(app_module, "print(1)", "print(2)")
+
+    assert (job_count, cached_count) == (2, 1)
+    info = app_module.get_batch_info(batch_id)
+    assert (info["status"], info["done"]) == ("running", 1)
+    _, rows = app_module.get_batch(batch_id)
+    assert rows[0]["cached"] is True
+    assert "cursor" not in rows[1]
+
+
+def test_batch_is_rejected_when_queue_is_full(app_module, batches, monkeypatch):
+    monkeypatch.setattr(app_module.Config, "BATCH_QUEUE_MAX_JOBS", 1)
+
+    assert submit(app_module, "print(1)", "print(2)") == ("", 0, 0)
+
+    conn = batches()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_abandoned_jobs_complete_their_batch(app_module, batches):
+    batch_id, _, _ = submit(app_module, "print(1)")
+    job = app_module.claim_next_job()
+    conn = batches()
+    try:
+        conn.execute("UPDATE jobs SET heartbeat_at = ?, attempts = ? WHERE id = ?",
+                     (time.time() - app_module.Config.JOB_LEASE_SECONDS - 1, app_module.Config.JOB_MAX_ATTEMPTS,
+                      job["id"]))
+    finally:
+        conn.close()
+
+    assert app_module.claim_next_job() is None
+
+    info, rows = app_module.get_batch(batch_id)
+    assert (info["status"], info["done"]) == ("done", 1)
+    assert rows[0]["status"] == "error"
+    assert rows[0]["cursor"] == 1
@@ -0,0 +1,89 @@
+import pytest
+
+CODE = "print(input())\n"
+HASHES = {"a.in": "1" * 64, "a.out": "2" * 64, "b.in": "3" * 64, "b.out": "4" * 64}
+
+
+@pytest.fixture
+def verdict_key(app_module):
+    def key(code=CODE, lang="python", testset="testset", **overrides):
+        return app_module.verdict_cache_key(code, lang, testset, {**app_module.DEFAULT_SETTINGS, **overrides})
+
+    return key
+
+
+def test_verdict_key_is_stable(verdict_key):
+    assert verdict_key() == verdict_key()
+
+
+@pytest.mark.parametrize("change", [
+    {"code": "print(1)\n"},
+    {"lang": "javascript"},
+    {"testset": "other"},
+    {"execution_time_limit": 2},
+    {"memory_limit": 256},
+    {"compile_time_limit": 20},
+    {"output_limit": 1},
+    {"fail_fast": True},
+])
+def test_verdict_key_changes_with_inputs_that_affect_result(verdict_key, change):
+    assert verdict_key(**change) != verdict_key()
+
+
+@pytest.mark.parametrize("change", [
+    {"auto_save_code": False},
+    {"show_execution_time": False},
+    {"max_parallel_runs": 2},
+    {"warm_runners": True},
+])
+def test_verdict_key_ignores_unrelated_settings(verdict_key, change):
+    assert verdict_key(**change) == verdict_key()
+
+
+@pytest.fixture
+def case_keys(app_module, settings):
+    def keys(code=CODE, hashes=HASHES, **overrides):
+        settings(**overrides)
+        return app_module.case_result_keys(code, "python", sorted(name for name in hashes if name.endswith(".in")),
+                                           hashes)
+
+    return keys
+
+
+def test_case_keys_change_only_for_changed_case(case_keys):
+    before = case_keys()
+    after = case_keys(hashes={**HASHES, "a.out": "5" * 64})
+
+    assert after["a.in"] != before["a.in"]
+    assert after["b.in"] == before["b.in"]
+
+
+def test_case_keys_change_with_input_content(case_keys):
+    assert case_keys(hashes={**HASHES, "b.in": "6" * 64})["b.in"] != case_keys()["b.in"]
+
+
+def test_case_keys_follow_content_not_name(case_keys):
+    renamed = {"c.in": HASHES["a.in"], "c.out": HASHES["a.out"]}
+
+    assert case_keys(hashes=renamed)["c.in"] == case_keys()["a.in"]
+
+
+@pytest.mark.parametrize("change", [
+    {"code": "print(1)\n"},
+    {"execution_time_limit": 2},
+    {"memory_limit": 256},
+    {"output_limit": 1},
+])
+def test_case_keys_change_with_program_and_limits(case_keys, change):
+    before = case_keys()
+    after = case_keys(**change)
+
+    assert all(after[name] != before[name] for name in before)
+
+
+def test_case_keys_skip_cases_without_hash(app_module, settings):
+    settings()
+
+    keys = app_module.case_result_keys(CODE, "python", ["a.in", "missing.in"], HASHES)
+
+    assert set(keys) == {"a.in"}
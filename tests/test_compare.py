@@ -0,0 +1,79 @@
+import pytest
+
+
+def split_every(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)] or [b""]
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"   \n\t ",
+    b"abc",
+    b"  \n abc \n",
+    b"1\n\n2\n\n\n",
+    b"\n\n1 2 \n 3\t\n",
+])
+@pytest.mark.parametrize("size", [1, 2, 3, 1024])
+def test_stripped_stream_matches_strip(app_module, data, size):
+    stream = app_module.StrippedStream()
+
+    output = b"".join(stream.feed(chunk) for chunk in split_every(data, size))
+
+    assert output == data.strip()
+
+
+def test_stripped_stream_holds_whitespace_until_more_content(app_module):
+    stream = app_module.StrippedStream()
+
+    assert stream.feed(b"1\n") == b"1"
+    assert stream.feed(b"\n \n") == b""
+    assert stream.feed(b"2\n") == b"\n\n \n2"
+
+
+@pytest.fixture
+def compare(app_module, tmp_path, monkeypatch):
+    """以小區塊讀取預期輸出，讓比對跨越多次讀取"""
+    monkeypatch.setattr(app_module.Config, "IO_CHUNK_SIZE", 3)
+
+    def run(expected, user_chunks):
+        path = tmp_path / "expected.out"
+        path.write_bytes(expected)
+        comparator = app_module.StreamingComparator(str(path))
+        try:
+            for chunk in user_chunks:
+                comparator.feed(chunk)
+            return comparator.finish()
+        finally:
+            comparator.close()
+
+    return run
+
+
+@pytest.mark.parametrize("expected, user_chunks", [
+    (b"1 2 3\n", [b"1 2 3\n"]),
+    (b"1 2 3\n", [b"1", b" 2", b" 3"]),
+    (b"hello\nworld\n", [b"\n\n  hello", b"\nwor", b"ld", b"\n\n\n"]),
+    (b"1\n\n2\n", [b"1\n", b"\n", b"2"]),
+    (b"", [b""]),
+    (b"\n\n", [b"  \n"]),
+    (b"", []),
+])
+def test_streaming_comparator_accepts_matching_output(compare, expected, user_chunks):
+    assert compare(expected, user_chunks) is True
+
+
+@pytest.mark.parametrize("expected, user_chunks", [
+    (b"1 2 3\n", [b"1 2 4\n"]),
+    (b"1 2 3\n", [b"1 2"]),
+    (b"1 2\n", [b"1 2 3"]),
+    (b"1\n\n2\n", [b"1\n2\n"]),
+    (b"abc", [b""]),
+    (b"", [b"x"]),
+    (b"1 2\n", [b"1  2"]),
+])
+def test_streaming_comparator_rejects_different_output(compare, expected, user_chunks):
+    assert compare(expected, user_chunks) is False
+
+
+def test_streaming_comparator_stops_comparing_after_mismatch(compare):
+    assert compare(b"abc\n", [b"x", b"abc"]) is False
@@ -0,0 +1,83 @@
+import json
+import time
+import uuid
+
+
+def add_job(app_module, job_db):
+    conn = job_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        job_id, cached = app_module.insert_job(conn, f"print('{uuid.uuid4().hex}')", "python", "testset",
+                                               dict(app_module.DEFAULT_SETTINGS))
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    assert job_id and not cached
+    return job_id
+
+
+def expire_lease(app_module, job_db, job_id, attempts=None):
+    """模擬 worker 中斷：heartbeat 停在租約期限之前"""
+    conn = job_db()
+    try:
+        conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?",
+                     (time.time() - app_module.Config.JOB_LEASE_SECONDS - 1, job_id))
+        if attempts is not None:
+            conn.execute("UPDATE jobs SET attempts = ? WHERE id = ?", (attempts, job_id))
+    finally:
+        conn.close()
+
+
+def load_job(job_db, job_id):
+    conn = job_db()
+    try:
+        return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_claim_marks_job_running_with_lease(app_module, job_db):
+    job_id = add_job(app_module, job_db)
+
+    job = app_module.claim_next_job()
+
+    assert job["id"] == job_id
+    stored = load_job(job_db, job_id)
+    assert stored["status"] == "running"
+    assert stored["worker"] == app_module.WORKER_ID
+    assert stored["attempts"] == 1
+    assert app_module.claim_next_job() is None
+
+
+def test_live_lease_is_not_reclaimed(app_module, job_db):
+    add_job(app_module, job_db)
+    app_module.claim_next_job()
+
+    assert app_module.claim_next_job() is None
+
+
+def test_expired_lease_is_requeued_and_retried(app_module, job_db):
+    job_id = add_job(app_module, job_db)
+    app_module.claim_next_job()
+    app_module.record_case_result(job_id, "a.in", {"verdict": "AC"})
+    expire_lease(app_module, job_db, job_id)
+
+    job = app_module.claim_next_job()
+
+    assert job["id"] == job_id
+    assert load_job(job_db, job_id)["attempts"] == 2
+    # 重新執行的工作捨棄先前的部分結果
+    assert app_module.get_case_results(job_id, 0) == []
+
+
+def test_job_fails_after_max_attempts(app_module, job_db):
+    job_id = add_job(app_module, job_db)
+    app_module.claim_next_job()
+    expire_lease(app_module, job_db, job_id, attempts=app_module.Config.JOB_MAX_ATTEMPTS)
+
+    assert app_module.claim_next_job() is None
+
+    stored = load_job(job_db, job_id)
+    assert stored["status"] == "done"
+    assert stored["status_code"] == 500
+    assert "error" in json.loads(stored["result"])
@@ -0,0 +1,102 @@
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture
+def work_dir(tmp_path):
+    return tmp_path
+
+
+def write_program(work_dir, source, name="main.py"):
+    (work_dir / name).write_text(source)
+
+
+def write_input(work_dir, data):
+    path = work_dir / "input.in"
+    path.write_bytes(data)
+    return str(path)
+
+
+def run_warm(app_module, input_path, work_dir, attempts=50):
+    """預熱行程由背景執行緒補充，重試到取得預熱行程為止"""
+    for _ in range(attempts):
+        result = app_module.run_program("python", input_path, str(work_dir))
+        if result["runner"] == "warm":
+            return result
+        time.sleep(0.2)
+    pytest.fail("預熱直譯器未啟動")
+
+
+def test_warm_runner_program_exits_without_reading_large_input(app_module, settings, work_dir):
+    settings(warm_runners=True)
+    write_program(work_dir, "print('done')\n")
+    input_path = write_input(work_dir, b"1 2\n" * (4 * 1024 * 1024))
+
+    result = run_warm(app_module, input_path, work_dir)
+
+    assert result["status"] == "ok"
+    assert result["returncode"] == 0
+    assert result["stdout"] == "done\n"
+
+
+def test_warm_runner_broken_pipe_on_first_write(app_module, settings, work_dir, monkeypatch):
+    settings(warm_runners=True)
+    write_program(work_dir, "print('done')\n")
+    input_path = write_input(work_dir, b"PUMP" + b"x" * (1024 * 1024))
+    real_write = os.write
+
+    def write(fd, data):
+        # 模擬程式在第一次寫入 stdin 前就已結束
+        if bytes(data[:4]) == b"PUMP":
+            raise BrokenPipeError()
+        return real_write(fd, data)
+
+    monkeypatch.setattr(app_module.os, "write", write)
+    result = run_warm(app_module, input_path, work_dir)
+
+    assert result["status"] == "ok"
+    assert result["stdout"] == "done\n"
+
+
+def test_output_limit_stops_program_and_keeps_bounded_prefix(app_module, settings, work_dir):
+    settings(output_limit=1)
+    write_program(work_dir, "import sys\nwhile True:\n    sys.stdout.write('x' * 65536)\n")
+    input_path = write_input(work_dir, b"")
+
+    result = app_module.run_program("python", input_path, str(work_dir))
+
+    assert result["status"] == "output_limit"
+    assert len(result["stdout"]) <= app_module.Config.OUTPUT_PREVIEW_BYTES
+
+
+def test_stdin_is_read_from_test_file(app_module, work_dir):
+    write_program(work_dir, "a, b = map(int, input().split())\nprint(a + b)\n")
+    input_path = write_input(work_dir, b"1 2\n")
+
+    result = app_module.run_program("python", input_path, str(work_dir))
+
+    assert result["status"] == "ok"
+    assert result["returncode"] == 0
+    assert result["stdout"] == "3\n"
+
+
+def test_cpu_time_limit_is_reported_as_timeout(app_module, settings, work_dir):
+    settings(execution_time_limit=1)
+    write_program(work_dir, "while True:\n    pass\n")
+    input_path = write_input(work_dir, b"")
+
+    result = app_module.run_program("python", input_path, str(work_dir))
+
+    assert result["status"] == "timeout"
+
+
+def test_memory_limit_is_reported_as_memory_limit(app_module, settings, work_dir):
+    settings(memory_limit=64)
+    write_program(work_dir, "data = bytearray(256 * 1024 * 1024)\nprint(len(data))\n")
+    input_path = write_input(work_dir, b"")
+
+    result = app_module.run_program("python", input_path, str(work_dir))
+
+    assert result["status"] == "memory_limit"
@@ -0,0 +1,136 @@
+import io
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture
+def store(app_module, tmp_path, monkeypatch):
+    """測試資料目錄、物件儲存與索引都放在暫存目錄"""
+    root = tmp_path / "testcases"
+    monkeypatch.setattr(app_module.Config, "TESTCASE_DIR", str(root))
+    monkeypatch.setattr(app_module.Config, "TESTCASE_OBJECT_DIR", str(root / "objects"))
+    monkeypatch.setattr(app_module.Config, "TESTCASE_REF_DIR", str(root / "refs"))
+    monkeypatch.setattr(app_module.Config, "MANIFEST_FILE", str(root / "manifest.json"))
+    monkeypatch.setattr(app_module, "manifest_store",
+                        app_module.JsonFileStore(str(root / "manifest.json"), app_module.default_manifest))
+    os.makedirs(root / "objects")
+    app_module.backfill_testcase_refs()
+    return root
+
+
+def add_testcase(app_module, name, test_input, test_output):
+    app_module.apply_manifest_entries({name: {
+        "input": app_module.store_testcase_blob(io.BytesIO(test_input)),
+        "output": app_module.store_testcase_blob(io.BytesIO(test_output)),
+    }})
+
+
+def object_count(store):
+    return sum(len(os.listdir(subdir)) for subdir in (store / "objects").iterdir() if subdir.is_dir())
+
+
+def age_objects(store, seconds=3600):
+    """讓所有物件超過清除的保留時間"""
+    past = time.time() - seconds
+    for directory, _, files in os.walk(store / "objects"):
+        for filename in files:
+            os.utime(os.path.join(directory, filename), (past, past))
+
+
+def test_gc_removes_only_unreferenced_objects(app_module, store):
+    add_testcase(app_module, "a", b"1 2\n", b"3\n")
+    add_testcase(app_module, "b", b"5 5\n", b"10\n")
+    app_module.apply_manifest_entries({"b": None})
+    age_objects(store)
+
+    app_module.collect_testcase_objects()
+
+    assert object_count(store) == 2
+    for content in (b"1 2\n", b"3\n"):
+        assert app_module.find_blob(str(store / "objects"), app_module.hashlib.sha256(content).hexdigest())
+
+
+def test_gc_keeps_recently_reused_objects(app_module, store):
+    add_testcase(app_module, "a", b"1 2\n", b"3\n")
+    app_module.apply_manifest_entries({"a": None})
+    add_testcase(app_module, "b", b"9\n", b"9\n")
+    age_objects(store)
+    # 重新上傳相同內容只更新修改時間，尚未寫入索引前不可被清除
+    app_module.store_testcase_blob(io.BytesIO(b"1 2\n"))
+
+    app_module.collect_testcase_objects()
+
+    assert app_module.find_blob(str(store / "objects"), app_module.hashlib.sha256(b"1 2\n").hexdigest())
+
+
+def test_gc_keeps_objects_when_manifest_is_missing(app_module, store):
+    add_testcase(app_module, "a", b"1 2\n", b"3\n")
+    age_objects(store)
+    os.remove(store / "manifest.json")
+
+    app_module.collect_testcase_objects()
+
+    assert object_count(store) == 2
+
+
+def test_gc_aborts_when_manifest_is_corrupt(app_module, store):
+    add_testcase(app_module, "a", b"1 2\n", b"3\n")
+    app_module.apply_manifest_entries({"a": None})
+    age_objects(store)
+    (store / "manifest.json").write_text("{")
+
+    app_module.collect_testcase_objects()
+
+    assert object_count(store) == 2
+
+
+def test_gc_refuses_to_run_when_nothing_is_referenced(app_module, store):
+    add_testcase(app_module, "a", b"1 2\n", b"3\n")
+    age_objects(store)
+    os.remove(store / "manifest.json")
+    for filename in os.listdir(store / "refs"):
+        os.remove(store / "refs" / filename)
+
+    app_module.collect_testcase_objects()
+
+    assert object_count(store) == 2
+
+
+@pytest.mark.parametrize("damage", ["missing", "corrupt"])
+def test_rebuild_restores_names_from_refs(app_module, store, damage):
+    add_testcase(app_module, "a", b"1 2\n", b"3\n")
+    add_testcase(app_module, "b", b"5 5\n", b"10\n")
+    expected = dict(app_module.get_manifest()["testcases"])
+    if damage == "missing":
+        os.remove(store / "manifest.json")
+    else:
+        (store / "manifest.json").write_text("{")
+
+    manifest = app_module.rebuild_manifest()
+
+    assert manifest["testcases"] == expected
+
+
+def test_rebuild_drops_cases_whose_content_is_missing(app_module, store):
+    add_testcase(app_module, "a", b"1 2\n", b"3\n")
+    add_testcase(app_module, "b", b"5 5\n", b"10\n")
+    os.remove(app_module.find_blob(str(store / "objects"), app_module.hashlib.sha256(b"5 5\n").hexdigest()))
+
+    manifest = app_module.rebuild_manifest()
+
+    assert manifest["testcases"]["b"]["input"] is None
+    assert manifest["testcases"]["b"]["output"]["size"] == 3
+    assert set(manifest["testcases"]) == {"a", "b"}
+
+
+def test_refs_are_backfilled_from_existing_manifest(app_module, store):
+    add_testcase(app_module, "a", b"1 2\n", b"3\n")
+    for filename in os.listdir(store / "refs"):
+        os.remove(store / "refs" / filename)
+    os.rmdir(store / "refs")
+
+    app_module.backfill_testcase_refs()
+
+    assert app_module.load_testcase_refs() == app_module.get_manifest()["testcases"]